@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+收藏相關的 AJAX 端點與 nearby_shops 為 async view，部署於 ASGI 伺服器時
+不會佔用 worker 執行緒，例如:
+
+    uvicorn mysite.asgi:application --workers 4
 """
 
 import os
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'polls.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'polls.middleware.NPlusOneMiddleware',
 ]
 
 ROOT_URLCONF = 'mysite.urls'
@@ -74,10 +76,48 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite 連線設定檔（環境變數 DJANGO_SQLITE_PROFILE 切換，未設定時依 DEBUG 決定）
+# - default:    SQLite 預設（rollback journal、每個請求重新開檔）；開發時不會把資料庫檔改成 WAL
+# - production: WAL 讓讀取不會被匯入時的寫入鎖住，並保留持久連線
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'default' if DEBUG else 'production')
+
+# 每條新連線建立時套用的 PRAGMA
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',    # WAL 下安全，且不必每次 commit 都 fsync
+    'mmap_size': 268435456,     # 256MB，讀取直接走記憶體映射
+    'cache_size': -65536,       # 負數代表 KiB，即 64MB page cache
+    'temp_store': 'MEMORY',
+    'busy_timeout': 20000,      # 毫秒，遇到寫入鎖時等待而不是直接報錯
+}
+
+SQLITE_PROFILES = {
+    'default': {
+        'OPTIONS': {},
+        'CONN_MAX_AGE': 0,
+    },
+    'production': {
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {key}={value}' for key, value in SQLITE_PRAGMAS.items()),
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            # 交易一開始就取得寫入鎖，避免讀轉寫時無法等待而直接 "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **SQLITE_PROFILES[SQLITE_PROFILE],
+        # 測試使用檔案型資料庫：in-memory 的 shared cache 遇到寫入鎖直接報錯而不等待，
+        # 多執行緒的併發測試（polls.tests）需要一般的檔案鎖
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -118,6 +158,31 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# 正式環境（DEBUG = False）部署前需執行 python manage.py collectstatic：
+# 檔名帶內容雜湊（css/base.<hash>.css），內容變動即換網址，因此可讓瀏覽器長期快取。
+# 請由前端 web server 直接提供 STATIC_ROOT，不經過 Django，例如 nginx：
+#   location /static/ {
+#       alias /path/to/mysite/staticfiles/;
+#       expires 5m;
+#       location ~ "\.[0-9a-f]{12}\.[^./]+$" {
+#           expires 1y;
+#           add_header Cache-Control "public, immutable";
+#       }
+#   }
+# collectstatic 之後才下載的店家照片需再執行一次 collectstatic；
+# 沒有前端 web server 時由 polls.views.static_file 提供（快取標頭相同）
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage',
+    },
+}
+STATIC_MAX_AGE = 365 * 24 * 3600  # 帶雜湊檔名的快取秒數（Cache-Control: immutable）
+STATIC_UNHASHED_MAX_AGE = 300  # 未帶雜湊檔名（例如 collectstatic 之後才下載的店家照片）的快取秒數
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -135,3 +200,87 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
+
+# N+1 查詢偵測（開發 / 測試環境，正式環境請關閉）
+NPLUSONE_ENABLED = DEBUG
+NPLUSONE_MODE = 'warn'  # warn / log / raise
+NPLUSONE_THRESHOLD = 5  # 同一形狀、同一位置的查詢重複幾次視為 N+1
+
+# 指標（/metrics，Prometheus 文字格式）
+# 各 worker 行程共用同一個本機 SQLite 檔來彙總
+METRICS_ENABLED = True
+METRICS_DB = BASE_DIR / 'metrics.sqlite3'
+METRICS_PUBLIC = False  # False: 僅限 staff 存取 /metrics
+METRICS_FLUSH_INTERVAL = 5  # 各行程累積的計數每隔幾秒寫入指標檔
+METRICS_FLUSH_EVERY = 500  # 累積幾個請求（批）就立即寫入
+
+# 快取；多個 worker 行程時請改用共用的後端（Redis / Memcached），
+# single-flight 的重算鎖（cache.add）才能在行程間生效
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'polls',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# single-flight 快取（polls.cache）
+SINGLE_FLIGHT_CACHE = 'default'
+SINGLE_FLIGHT_TIMEOUT = 300  # 新鮮期間（秒）
+SINGLE_FLIGHT_STALE = 600  # 過期後重算期間仍可回傳舊值的秒數
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30  # 重算鎖的存活時間（秒），應大於最慢的計算時間
+SINGLE_FLIGHT_WAIT = 2.0  # 沒有舊值時等待他人計算的最長秒數
+CATALOG_VERSION_CHECK_INTERVAL = 1  # 各 worker 重新讀取目錄版本（polls.catalog）的間隔（秒）
+
+# 背景工作（python manage.py run_jobs）
+JOB_CONCURRENCY = {  # 各 group 同時執行的工作數上限
+    'import': 1,
+    'images': 1,
+    'rebuild': 1,
+}
+JOB_MAX_ATTEMPTS = 3  # 失敗時最多嘗試次數
+JOB_RETRY_DELAY = 60  # 第一次重試前等待秒數，之後每次加倍
+JOB_STALE_AFTER = 600  # 執行中的工作超過此秒數沒有心跳，視為 worker 已中止並重新排入
+
+# 目錄快照（python manage.py build_snapshot），各 worker 以 mmap 共用；檔案不存在時改查資料庫
+CATALOG_SNAPSHOT_PATH = BASE_DIR / 'catalog.snapshot'
+CATALOG_SNAPSHOT_CHECK_INTERVAL = 5  # 檢查快照檔是否被替換的間隔（秒）
+
+# 部署後快取預熱（python manage.py warm_caches）
+# 預熱 single-flight 快取時，LocMemCache 只會填入執行指令的行程，請改用共用的快取後端或 --base-url
+WARM_CACHES_BUDGET = 60  # 預熱的時間上限（秒）
+WARM_CACHES_TOP = 50  # 預熱最常被請求的參數組合數
+WARM_CACHES_DAYS = 7  # 請求統計的保留天數，也是挑選組合時參考的期間
+
+# AJAX 與搜尋端點的限流（polls.ratelimit），依登入帳號或 IP 分別計算；各 worker 行程各自計算
+# 以 manage.py loadtest 壓測時，額度遠小於預設的 500 個請求，請以環境變數 DJANGO_RATE_LIMIT=0 關閉
+RATE_LIMIT_ENABLED = os.environ.get('DJANGO_RATE_LIMIT', '1') != '0'
+RATE_LIMITS = {  # 端點 -> (可連續送出的請求數, 每分鐘補充數)
+    'check_favorite': (120, 120),
+    'check_favorites': (30, 30),  # 每個頁面載入一至兩次（店家頁同時檢查店家與飲料）
+    'add_favorite': (30, 30),
+    'remove_favorite': (30, 30),
+    'batch_favorites': (10, 10),
+    'update_favorite_notes': (30, 30),
+    'also_liked': (60, 60),
+    'search_drinks': (30, 30),
+    'cheapest_nearby_drinks': (30, 30),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'polls': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
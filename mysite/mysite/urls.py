@@ -1,8 +1,11 @@
 """
 URL configuration for mysite project.
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from polls import views as polls_views
 
 
@@ -14,7 +17,10 @@ urlpatterns = [
     path('shops/', polls_views.shop_list, name='shop_list'),
     path('shops/<int:shop_id>/', polls_views.shop_detail, name='shop_detail'),
     path('drinks/', polls_views.recommended_drinks, name='recommended_drinks'),
+    path('drinks/canonical/', polls_views.canonical_drink_stats, name='canonical_drink_stats'),
+    path('drinks/canonical/<int:canonical_id>/', polls_views.canonical_drink_compare, name='canonical_drink_compare'),
     path('nearby/', polls_views.nearby_shops, name='nearby_shops'),
+    path('nearby/cheapest/', polls_views.cheapest_nearby_drinks, name='cheapest_nearby_drinks'),
     path('search/', polls_views.search_drinks, name='search_drinks'),
 
     # 使用者認證
@@ -26,6 +32,23 @@ urlpatterns = [
     path('favorites/', polls_views.favorites_list, name='favorites_list'),
     path('favorites/add/', polls_views.add_favorite, name='add_favorite'),
     path('favorites/remove/', polls_views.remove_favorite, name='remove_favorite'),
+    path('favorites/batch/', polls_views.batch_favorites, name='batch_favorites'),
     path('favorites/update-notes/', polls_views.update_favorite_notes, name='update_favorite_notes'),
     path('favorites/check/', polls_views.check_favorite, name='check_favorite'),
+    path('favorites/check/batch/', polls_views.check_favorites, name='check_favorites'),
+    path('favorites/also-liked/', polls_views.also_liked, name='also_liked'),
+
+    # 匯出（僅限 staff）
+    path('export/<str:kind>/', polls_views.export_catalog, name='export_catalog'),
+
+    # 監控
+    path('metrics', polls_views.metrics_view, name='metrics'),
+
 ]
+
+# 靜態檔案：正式環境應由前端 web server 直接提供 STATIC_ROOT（見 settings.STATIC_ROOT），
+# 沒有前端 web server 時才由 Django 提供；DEBUG 時由 runserver 提供
+if not settings.DEBUG:
+    urlpatterns.append(
+        re_path(rf'^{re.escape(settings.STATIC_URL.lstrip("/"))}(?P<path>.+)$', polls_views.static_file, name='static_file')
+    )
@@ -1,14 +1,18 @@
-from django.contrib import admin
-from .models import TeaShop, Drink, Favorite
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count
+from .models import TeaShop, Drink, Favorite, CanonicalDrink, Job
+from . import catalog, favorites, jobs, menu_stats, snapshot
 
 # 自訂 TeaShop 的 Admin 管理介面
 @admin.register(TeaShop)
 class TeaShopAdmin(admin.ModelAdmin):
     # 列表頁顯示的欄位
-    list_display = ['id', 'name', 'rating', 'phone', 'address', 'drinks_count', 'created_at']
+    list_display = ['id', 'name', 'rating', 'phone', 'address', 'drinks_count', 'menu_price_range', 'favorite_count', 'created_at']
 
     # 可以篩選的欄位
-    list_filter = ['rating', 'created_at']
+    list_filter = ['rating', 'menu_has_fresh_milk', 'menu_has_topping', 'created_at']
 
     # 可以搜尋的欄位
     search_fields = ['name', 'address', 'phone']
@@ -19,6 +23,9 @@ class TeaShopAdmin(admin.ModelAdmin):
     # 每頁顯示的項目數
     list_per_page = 20
 
+    # 不另外計算未篩選前的總筆數（大表時省一次 COUNT）
+    show_full_result_count = False
+
     # 詳細頁面的欄位分組
     fieldsets = (
         ('基本資料', {
@@ -30,19 +37,43 @@ class TeaShopAdmin(admin.ModelAdmin):
         ('營業資訊', {
             'fields': ('opening_hours',),
         }),
+        ('菜單統計', {
+            'fields': ('menu_drink_count', 'menu_min_price', 'menu_max_price', 'menu_tea_types',
+                       'menu_has_fresh_milk', 'menu_has_topping', 'menu_min_fresh_milk_price'),
+            'classes': ('collapse',),
+        }),
         ('系統資訊', {
-            'fields': ('place_id', 'created_at'),
+            'fields': ('place_id', 'favorite_count', 'created_at'),
             'classes': ('collapse',),
         }),
     )
 
     # 唯讀欄位
-    readonly_fields = ['created_at', 'place_id']
+    readonly_fields = ['created_at', 'place_id', 'favorite_count', 'menu_drink_count', 'menu_min_price',
+                       'menu_max_price', 'menu_tea_types', 'menu_has_fresh_milk', 'menu_has_topping',
+                       'menu_min_fresh_milk_price']
 
     def drinks_count(self, obj):
-        """顯示飲料品項數量"""
-        return obj.drinks.count()
+        """顯示飲料品項數量（預先彙總的菜單統計）"""
+        return obj.menu_drink_count
     drinks_count.short_description = '飲料品項數'
+    drinks_count.admin_order_field = 'menu_drink_count'
+
+    def menu_price_range(self, obj):
+        """顯示菜單價格範圍"""
+        return obj.get_menu_price_range()
+    menu_price_range.short_description = '價格範圍'
+    menu_price_range.admin_order_field = 'menu_min_price'
+
+    def delete_queryset(self, request, queryset):
+        """
+        批次刪除：連帶刪除的飲料不逐筆重算菜單統計，刪除後排入一次目錄快照重建；
+        連帶刪除的收藏都屬於被刪除的店家或飲料，不必逐筆扣回收藏人數
+        """
+        with transaction.atomic(), menu_stats.deferred(), favorites.deferred():
+            super().delete_queryset(request, queryset)
+            catalog.bump()
+            snapshot.schedule()
 
 
 # 自訂 Drink 的 Admin 管理介面
@@ -63,13 +94,21 @@ class DrinkAdmin(admin.ModelAdmin):
     # 每頁顯示的項目數
     list_per_page = 20
 
+    # 列表頁一併載入店家，避免每列查詢一次
+    list_select_related = ['tea_shop']
+
+    # 店家欄位改用自動完成，不在表單中列出所有店家
+    autocomplete_fields = ['tea_shop']
+
+    show_full_result_count = False
+
+    # 標準飲料由 canonicalize_drinks 指派
+    readonly_fields = ['canonical']
+
     # 詳細頁面的欄位分組
     fieldsets = (
         ('基本資料', {
-            'fields': ('tea_shop', 'name', 'description', 'milk_type', 'tea_type', 'topping')
-        }),
-        ('小杯', {
-            'fields': ('has_small', 'price_small'),
+            'fields': ('tea_shop', 'name', 'canonical', 'description', 'milk_type', 'tea_type', 'topping')
         }),
         ('中杯', {
             'fields': ('has_medium', 'price_medium'),
@@ -79,11 +118,45 @@ class DrinkAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Drink.__str__ 會用到店家名稱（自動完成結果、收藏編輯頁等）
+        return super().get_queryset(request).select_related('tea_shop')
+
     def price_display(self, obj):
         """顯示價格範圍"""
         return obj.get_price_range()
     price_display.short_description = '價格'
 
+    def delete_queryset(self, request, queryset):
+        """
+        批次刪除：不逐筆重算菜單統計，刪除後一次重算受影響的店家並排入一次目錄快照重建；
+        連帶刪除的收藏都屬於被刪除的飲料，不必逐筆扣回收藏人數
+        """
+        shop_ids = set(queryset.values_list('tea_shop_id', flat=True))
+        with transaction.atomic(), menu_stats.deferred(), favorites.deferred():
+            super().delete_queryset(request, queryset)
+            menu_stats.refresh(shop_ids)
+            catalog.bump()
+            snapshot.schedule()
+
+
+# 標準飲料（唯讀，由 canonicalize_drinks 維護）
+@admin.register(CanonicalDrink)
+class CanonicalDrinkAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'key', 'drink_count', 'created_at']
+    search_fields = ['name', 'key']
+    readonly_fields = ['key', 'created_at']
+    list_per_page = 50
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(drink_count=Count('drinks'))
+
+    def drink_count(self, obj):
+        """歸入此標準飲料的品項數"""
+        return obj.drink_count
+    drink_count.short_description = '品項數'
+    drink_count.admin_order_field = 'drink_count'
+
 
 # 自訂 Favorite 的 Admin 管理介面
 @admin.register(Favorite)
@@ -103,6 +176,14 @@ class FavoriteAdmin(admin.ModelAdmin):
     # 每頁顯示的項目數
     list_per_page = 20
 
+    # 列表頁一併載入使用者與收藏項目
+    list_select_related = ['user', 'tea_shop', 'drink']
+
+    # 外鍵改用自動完成，編輯頁不再渲染所有飲料的 <select>
+    autocomplete_fields = ['user', 'tea_shop', 'drink']
+
+    show_full_result_count = False
+
     def get_favorite_item(self, obj):
         """顯示收藏的項目"""
         if obj.favorite_type == 'shop':
@@ -111,3 +192,69 @@ class FavoriteAdmin(admin.ModelAdmin):
             return obj.drink.name if obj.drink else '-'
     get_favorite_item.short_description = '收藏項目'
 
+
+
+class JobForm(forms.ModelForm):
+    kind = forms.ChoiceField(choices=jobs.KIND_CHOICES, label='工作類型')
+
+    class Meta:
+        model = Job
+        fields = ['kind', 'arguments', 'max_attempts']
+        help_texts = {
+            'arguments': '指令參數（JSON 陣列），例如 ["--csv-path", "drinks.csv"]',
+        }
+
+    def clean_arguments(self):
+        arguments = self.cleaned_data['arguments'] or []
+        if not isinstance(arguments, list):
+            raise forms.ValidationError('指令參數必須是 JSON 陣列')
+        return [str(argument) for argument in arguments]
+
+
+# 背景工作（新增即排入佇列，由 run_jobs 執行）
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    form = JobForm
+    list_display = ['id', 'kind', 'status', 'progress_display', 'attempts', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    ordering = ['-created_at']
+    list_per_page = 50
+    actions = ['cancel_jobs', 'retry_jobs']
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return ['kind', 'arguments', 'max_attempts']
+        return [
+            'kind', 'arguments', 'status', 'progress_display', 'progress_message', 'attempts', 'max_attempts',
+            'worker', 'run_after', 'created_at', 'started_at', 'heartbeat_at', 'finished_at', 'output', 'error',
+        ]
+
+    def get_readonly_fields(self, request, obj=None):
+        # 已排入的工作只能取消或重試，不能修改
+        if obj is None:
+            return []
+        return self.get_fields(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            return
+        job, created = jobs.enqueue(obj.kind, obj.arguments, max_attempts=obj.max_attempts)
+        obj.pk = job.pk
+        obj._state.adding = False
+        if not created:
+            messages.warning(request, f'相同的工作已在佇列中（#{job.pk}，{job.get_status_display()}），未重複建立')
+
+    def progress_display(self, obj):
+        """顯示進度"""
+        return obj.get_progress_display()
+    progress_display.short_description = '進度'
+
+    @admin.action(description='取消選取的等待中工作')
+    def cancel_jobs(self, request, queryset):
+        count = jobs.cancel(queryset)
+        self.message_user(request, f'已取消 {count} 個工作')
+
+    @admin.action(description='重新排入選取的失敗/已取消工作')
+    def retry_jobs(self, request, queryset):
+        count = jobs.retry(queryset)
+        self.message_user(request, f'已重新排入 {count} 個工作')
@@ -0,0 +1,120 @@
+"""
+防止快取雪崩（cache stampede）的 single-flight 快取
+
+快取過期時只讓一個 worker 重新計算（以快取後端的 cache.add 當作鎖），
+其他請求先回傳舊值（保留 stale 期間），沒有舊值時短暫等待計算結果。
+另以 XFetch（probabilistic early expiration）在到期前隨機提早重算，
+越接近到期、計算越久的項目越容易被提早重算，避免大量請求同時遇到過期。
+
+key 帶有目錄版本（polls.catalog），店家、飲料或排名異動後改用新的 key，
+舊的項目不再被讀取、由快取自然淘汰，不會在到期前回傳已刪除或已變更的資料。
+
+cache.add 需在所有 worker 間為原子操作，多行程部署時請使用共用的快取後端
+（Redis / Memcached）；LocMemCache 只能防止同一行程內的重複計算。
+"""
+import functools
+import hashlib
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import catalog, metrics
+
+
+# 等待他人計算時的輪詢間隔（秒）
+WAIT_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[getattr(settings, 'SINGLE_FLIGHT_CACHE', 'default')]
+
+
+def make_key(name, args, kwargs):
+    """依函式名稱、目錄版本與參數產生快取 key"""
+    digest = hashlib.md5(repr((args, sorted(kwargs.items()))).encode('utf-8')).hexdigest()
+    return f'sf:{name}:{catalog.version()}:{digest}'
+
+
+def get_or_compute(key, compute, name, timeout=None, stale=None, lock_timeout=None, wait=None, beta=1.0):
+    """
+    取得快取值，過期或需要提早重算時只由取得鎖的那一個呼叫重新計算
+
+    timeout: 新鮮期間（秒）；stale: 過期後仍可回傳舊值的期間（秒）；
+    lock_timeout: 鎖的存活時間，計算的行程中止時鎖會自動釋放；
+    wait: 沒有舊值且鎖被佔用時最多等待的秒數，逾時則自行計算；
+    beta: XFetch 參數，越大越早重算，0 表示不提早。
+    """
+    timeout = settings.SINGLE_FLIGHT_TIMEOUT if timeout is None else timeout
+    stale = settings.SINGLE_FLIGHT_STALE if stale is None else stale
+    lock_timeout = settings.SINGLE_FLIGHT_LOCK_TIMEOUT if lock_timeout is None else lock_timeout
+    wait = settings.SINGLE_FLIGHT_WAIT if wait is None else wait
+
+    cache = get_cache()
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, expires_at, delta = entry
+        # XFetch: now - delta * beta * ln(rand) >= expires_at 時提早重算（ln(rand) <= 0）
+        if time.time() - delta * beta * math.log(1.0 - random.random()) < expires_at:
+            metrics.record_cache(name, True)
+            return value
+        if not cache.add(lock_key, 1, lock_timeout):
+            # 已有其他 worker 在重算：先回傳舊值
+            metrics.record_cache_lock(name, 'stale')
+            metrics.record_cache(name, True)
+            return value
+    elif not cache.add(lock_key, 1, lock_timeout):
+        # 沒有舊值可用：短暫等待取得鎖的那一方寫入結果
+        metrics.record_cache_lock(name, 'wait')
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                metrics.record_cache(name, True)
+                return entry[0]
+        metrics.record_cache_lock(name, 'timeout')
+        metrics.record_cache(name, False)
+        return compute()
+
+    metrics.record_cache_lock(name, 'acquired')
+    metrics.record_cache(name, False)
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        cache.set(key, (value, time.time() + timeout, delta), timeout + stale)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def single_flight(name=None, timeout=None, stale=None, lock_timeout=None, wait=None, beta=1.0, key=None):
+    """
+    single-flight 快取裝飾器
+
+    預設以函式的所有參數產生 key（參數需有穩定的 repr），回傳值需可 pickle；
+    key 可自訂為 key(*args, **kwargs)，回傳用來區分快取的值，例如包裝 view 時只取 request.GET。
+    被裝飾的函式另有 .uncached 可略過快取直接呼叫。
+    """
+    def decorator(func):
+        cache_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                cache_key = make_key(cache_name, (key(*args, **kwargs),), {})
+            else:
+                cache_key = make_key(cache_name, args, kwargs)
+            return get_or_compute(
+                cache_key, lambda: func(*args, **kwargs), cache_name,
+                timeout=timeout, stale=stale, lock_timeout=lock_timeout, wait=wait, beta=beta,
+            )
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""
+跨店家的標準飲料（CanonicalDrink）
+
+離線階段：把各店自由輸入的 Drink.name 正規化成比對用的 key
+（全形/半形、空白與標點、括號註記、已知同義詞），相同 key 的飲料歸為同一個標準飲料。
+之後跨店比價與價格統計都只是 canonical_id 上的 GROUP BY。
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min
+
+
+# 已知同義詞（長詞優先替換）
+SYNONYMS = {
+    '珍奶': '珍珠奶茶',
+    '波霸': '珍珠',
+    '粉圓': '珍珠',
+    '歐蕾': '拿鐵',
+    '歐雷': '拿鐵',
+    '奶紅': '奶茶',
+    '臺': '台',
+}
+
+# 括號內的註記，例如「(輕盈)」「(中焙)」
+ANNOTATION_PATTERN = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+
+# 空白與標點
+SEPARATOR_PATTERN = re.compile(r'[\s\.\|/\\+＋、,，·・:：\-–_~!！?？*]+')
+
+_synonym_pattern = re.compile('|'.join(re.escape(word) for word in sorted(SYNONYMS, key=len, reverse=True)))
+
+
+def normalize_name(name):
+    """飲料名稱 -> 比對用的 key（無法正規化時回傳空字串）"""
+    if not name:
+        return ''
+    # NFKC：全形英數與括號轉半形
+    key = unicodedata.normalize('NFKC', name).lower()
+    key = ANNOTATION_PATTERN.sub('', key)
+    key = SEPARATOR_PATTERN.sub('', key)
+    key = _synonym_pattern.sub(lambda match: SYNONYMS[match.group(0)], key)
+    return key
+
+
+def rebuild():
+    """
+    重新指派所有飲料的標準飲料
+
+    只寫入 canonical 有變動的飲料，並移除不再被使用的標準飲料。
+    回傳 {'groups', 'created', 'assigned', 'deleted'}。
+    """
+    from .models import CanonicalDrink, Drink
+
+    names_by_key = {}
+    drink_keys = {}
+    for drink_id, name, canonical_id in Drink.objects.values_list('id', 'name', 'canonical_id').iterator(chunk_size=2000):
+        key = normalize_name(name)
+        if not key:
+            continue
+        drink_keys[drink_id] = (key, canonical_id)
+        names_by_key.setdefault(key, Counter())[name.strip()] += 1
+
+    with transaction.atomic():
+        existing = dict(CanonicalDrink.objects.values_list('key', 'id'))
+
+        # 顯示名稱：該組最常見的原始名稱
+        to_create = [
+            CanonicalDrink(key=key, name=names.most_common(1)[0][0])
+            for key, names in names_by_key.items() if key not in existing
+        ]
+        CanonicalDrink.objects.bulk_create(to_create, batch_size=500)
+        if to_create:
+            existing = dict(CanonicalDrink.objects.values_list('key', 'id'))
+
+        changed = []
+        for drink_id, (key, canonical_id) in drink_keys.items():
+            if existing[key] != canonical_id:
+                changed.append(Drink(id=drink_id, canonical_id=existing[key]))
+        Drink.objects.bulk_update(changed, ['canonical'], batch_size=500)
+
+        deleted, _ = CanonicalDrink.objects.filter(drinks__isnull=True).delete()
+
+    return {
+        'groups': len(names_by_key),
+        'created': len(to_create),
+        'assigned': len(changed),
+        'deleted': deleted,
+    }
+
+
+def price_statistics(drinks=None):
+    """每個標準飲料的跨店價格統計（以 canonical_id GROUP BY）"""
+    from .models import Drink
+
+    drinks = Drink.objects.all() if drinks is None else drinks
+    return (
+        drinks.filter(canonical__isnull=False, min_price__isnull=False)
+        .order_by()
+        .values('canonical_id', 'canonical__name')
+        .annotate(
+            shop_count=Count('tea_shop_id', distinct=True),
+            drink_count=Count('id'),
+            lowest_price=Min('min_price'),
+            average_price=Avg('min_price'),
+            highest_price=Max('min_price'),
+        )
+    )
+
+
+def compare(canonical_id):
+    """同一個標準飲料在各店家的品項，依價格由低到高"""
+    from .models import Drink
+
+    return (
+        Drink.objects.filter(canonical_id=canonical_id)
+        .select_related('tea_shop')
+        .order_by(F('min_price').asc(nulls_last=True), '-tea_shop__rating', 'id')
+    )
@@ -0,0 +1,53 @@
+"""
+目錄版本（店家、飲料、排名的資料版本）
+
+- bump(): 資料異動後遞增；單筆異動由 signals 呼叫，批次作業（匯入、刪除、排名重建）結束後呼叫一次
+- version(): 目前版本；每個 worker 最多每 CATALOG_VERSION_CHECK_INTERVAL 秒查詢一次資料庫，
+  refresh=True 時直接查詢
+
+single-flight 快取的 key 帶有版本（polls.cache.make_key），資料異動後各 worker 改用新的 key，
+不必等快取到期；匯入檔案紀錄也以版本判斷資料庫在上次匯入後是否被改動（polls.importing）。
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion
+
+
+_lock = threading.Lock()
+_version = 0
+_checked_at = None
+
+
+def bump():
+    """遞增目錄版本（在交易中呼叫時，commit 後本行程才改用新版本）"""
+    if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1, updated_at=timezone.now()):
+        CatalogVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+    transaction.on_commit(expire)
+
+
+def expire():
+    """下次呼叫 version() 時重新查詢資料庫"""
+    global _checked_at
+    _checked_at = None
+
+
+def version(refresh=False):
+    """目前的目錄版本（尚未有任何異動時為 0）"""
+    global _version, _checked_at
+
+    now = time.monotonic()
+    checked_at = _checked_at
+    if not refresh and checked_at is not None and now - checked_at < settings.CATALOG_VERSION_CHECK_INTERVAL:
+        return _version
+
+    with _lock:
+        if refresh or _checked_at is None or now - _checked_at >= settings.CATALOG_VERSION_CHECK_INTERVAL:
+            _version = CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+            _checked_at = now
+    return _version
@@ -0,0 +1,305 @@
+"""
+飲料 CSV 的解析與驗證（只用標準函式庫，不匯入 Django model）
+
+validate() 串流讀取 CSV，分段交給 process pool 解析驗證，在寫入資料庫前得到
+型別正確的資料與完整的問題清單（行號、欄位、原始值、原因），可用 write_error_report() 寫成 CSV。
+worker 行程不需要初始化 Django，在 spawn 啟動方式（Windows）下也能使用。
+"""
+import csv
+import io
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+
+
+# CSV 欄位名稱
+SHOP_COLUMN = '所屬店家'
+COLUMNS = {
+    'name': '飲料名稱',
+    'description': '描述',
+    'milk_type': '奶類',
+    'tea_type': '茶類',
+    'topping': '配料',
+    'has_medium': '中杯',
+    'price_medium': '中杯價格',
+    'has_large': '大杯',
+    'price_large': '大杯價格',
+}
+
+MILK_TYPES = {
+    '奶精': 'creamer',
+    '鮮奶': 'fresh_milk',
+}
+
+TEA_TYPES = {
+    '紅茶': 'black_tea',
+    '綠茶': 'green_tea',
+    '烏龍茶': 'oolong_tea',
+    '青茶': 'blue_tea',
+    '抹茶': 'matcha',
+    '鐵觀音': 'tieguanyin',
+    '麥茶': 'barley_tea',
+    '四季春': 'season',
+    '茉莉花茶': 'jasmine',
+    '普洱茶': 'pu_erh',
+    '其他': 'other',
+}
+
+TOPPINGS = {
+    '有': 'yes',
+    '無': 'no',
+}
+
+# Drink 價格欄位為 max_digits=5
+MAX_PRICE = Decimal(99999)
+
+NAME_MAX_LENGTH = 100
+
+# 每個 worker 一次驗證的列數
+VALIDATION_CHUNK_SIZE = 5000
+
+# 錯誤報告中的一筆問題；level 為 error（整列略過）或 warning（該欄位視為空值，照常匯入）
+Issue = namedtuple('Issue', ['row', 'column', 'value', 'level', 'reason'])
+
+
+def parse_milk_type(value):
+    """解析奶類欄位"""
+    value = value.strip() if value else ''
+    return MILK_TYPES.get(value, 'none')  # 預設為無奶類
+
+
+def parse_boolean(value):
+    """解析有/無欄位"""
+    value = value.strip() if value else ''
+    return value == '有'
+
+
+def parse_tea_type(value):
+    """解析茶類欄位"""
+    value = value.strip() if value else ''
+    return TEA_TYPES.get(value)
+
+
+def parse_topping(value):
+    """解析配料欄位"""
+    value = value.strip() if value else ''
+    return TOPPINGS.get(value)
+
+
+def parse_price(value):
+    """解析價格欄位"""
+    value = value.strip() if value else ''
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def validate_row(row_number, row, shop_ids):
+    """
+    驗證單列 CSV（欄位名稱 -> 原始字串），回傳 (record, issues)
+
+    record 為 (row_number, tea_shop_id, drink_data)，有 error 時為 None。
+    無法辨識的值與原本的解析方式相同視為空值，但會列為 warning。
+    """
+    issues = []
+
+    def issue(column, level, reason):
+        issues.append(Issue(row_number, column, row.get(column) or '', level, reason))
+
+    shop_name = (row.get(SHOP_COLUMN) or '').strip()
+    name = (row.get(COLUMNS['name']) or '').strip()
+    if not shop_name:
+        issue(SHOP_COLUMN, 'error', '缺少店家')
+    elif shop_name not in shop_ids:
+        issue(SHOP_COLUMN, 'error', '店家不存在')
+    if not name:
+        issue(COLUMNS['name'], 'error', '缺少飲料名稱')
+    elif len(name) > NAME_MAX_LENGTH:
+        issue(COLUMNS['name'], 'error', f'飲料名稱超過 {NAME_MAX_LENGTH} 字')
+
+    for field, choices in (('milk_type', MILK_TYPES), ('tea_type', TEA_TYPES), ('topping', TOPPINGS)):
+        value = (row.get(COLUMNS[field]) or '').strip()
+        if value and value not in choices:
+            issue(COLUMNS[field], 'warning', f'無法辨識，應為 {"/".join(choices)}')
+
+    sizes = {}
+    for size in ('medium', 'large'):
+        has_column, price_column = COLUMNS[f'has_{size}'], COLUMNS[f'price_{size}']
+        has_value = (row.get(has_column) or '').strip()
+        if has_value not in ('', '有', '無'):
+            issue(has_column, 'warning', '應為 有/無')
+        price_value = (row.get(price_column) or '').strip()
+        price = parse_price(price_value)
+        if price_value and (price is None or not price.is_finite()):
+            issue(price_column, 'warning', '價格格式錯誤')
+            price = None
+        elif price is not None and not 0 <= price <= MAX_PRICE:
+            issue(price_column, 'warning', f'價格超出範圍 0 ~ {MAX_PRICE}')
+            price = None
+        elif has_value == '有' and price is None:
+            issue(price_column, 'warning', '有此杯型但沒有價格')
+        sizes[size] = (parse_boolean(has_value), price)
+
+    if any(item.level == 'error' for item in issues):
+        return None, issues
+
+    description = (row.get(COLUMNS['description']) or '').strip()
+    drink_data = {
+        'name': name,
+        'description': description or None,
+        'milk_type': parse_milk_type(row.get(COLUMNS['milk_type'])),
+        'tea_type': parse_tea_type(row.get(COLUMNS['tea_type'])),
+        'topping': parse_topping(row.get(COLUMNS['topping'])),
+        'has_medium': sizes['medium'][0],
+        'price_medium': sizes['medium'][1],
+        'has_large': sizes['large'][0],
+        'price_large': sizes['large'][1],
+    }
+    return (row_number, shop_ids[shop_name], drink_data), issues
+
+
+# worker 行程內的驗證設定（由 _init_worker 設定）
+_path = None
+_header = []
+_shop_ids = {}
+
+
+def _init_worker(path, header, shop_ids):
+    global _path, _header, _shop_ids
+    _path = path
+    _header = header
+    _shop_ids = shop_ids
+
+
+def _validate_range(chunk):
+    """
+    驗證檔案中的一段 (offset, length, line)，回傳 (records, issues, 列數)
+
+    由 worker 自行讀取並解析這一段，主行程只需要傳遞位置；
+    行號為該列在檔案中的起始行（與試算表看到的行號相同）。
+    """
+    offset, length, line = chunk
+    with open(_path, 'rb') as file:
+        file.seek(offset)
+        text = file.read(length).decode('utf-8')
+
+    records = []
+    issues = []
+    count = 0
+    reader = csv.reader(io.StringIO(text, newline=''))
+    consumed = 0
+    for cells in reader:
+        row_number = line + consumed
+        consumed = reader.line_num
+        if not any(cell.strip() for cell in cells):
+            continue  # 空白列
+        count += 1
+        record, row_issues = validate_row(row_number, dict(zip(_header, cells)), _shop_ids)
+        if record is not None:
+            records.append(record)
+        issues.extend(row_issues)
+    return records, issues, count
+
+
+def _records(file):
+    """
+    逐筆讀取 CSV 記錄的原始位元組，回傳 (記錄, 行數)
+
+    只計算引號的奇偶判斷記錄是否結束（引號內的換行屬於同一筆），不解析欄位。
+    """
+    record = b''
+    lines = 0
+    for raw in file:
+        record += raw
+        lines += 1
+        if record.count(b'"') % 2 == 0:
+            yield record, lines
+            record = b''
+            lines = 0
+    if record:
+        yield record, lines
+
+
+def _split(file, size, line):
+    """把標題列之後的內容切成每段 size 筆的 (offset, length, line)"""
+    offset = file.tell()
+    length = 0
+    rows = 0
+    start = line
+    for record, lines in _records(file):
+        length += len(record)
+        line += lines
+        rows += 1
+        if rows >= size:
+            yield offset, length, start
+            offset += length
+            length = 0
+            rows = 0
+            start = line
+    if length:
+        yield offset, length, start
+
+
+def _ordered_map(pool, func, items, window):
+    """與 pool.map 相同依序回傳，但最多只有 window 個工作在排隊（不必先切完整個檔案）"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def validate(path, shop_ids, workers=1, chunk_size=VALIDATION_CHUNK_SIZE, progress=None):
+    """
+    驗證整個 CSV，回傳 (records, issues, row_count)
+
+    shop_ids 為 {店家名稱: id}；workers > 1 且檔案超過一段時以 process pool 平行驗證，
+    結果依檔案順序回傳。缺少必要欄位時拋出 ValueError。
+    """
+    records = []
+    issues = []
+    row_count = 0
+    with open(path, 'rb') as file:
+        header_bytes, header_lines = next(_records(file), (b'', 0))
+        header = next(csv.reader(io.StringIO(header_bytes.decode('utf-8-sig'), newline='')), [])
+        header = [column.strip() for column in header]
+        missing = [column for column in [SHOP_COLUMN, *COLUMNS.values()] if column not in header]
+        if missing:
+            raise ValueError(f'CSV 缺少欄位: {", ".join(missing)}')
+
+        chunks = _split(file, chunk_size, header_lines + 1)
+        first = list(islice(chunks, 2))
+        chunks = chain(first, chunks)
+        if workers > 1 and len(first) > 1:
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path, header, shop_ids))
+            results = _ordered_map(pool, _validate_range, chunks, workers * 2)
+        else:
+            pool = None
+            _init_worker(path, header, shop_ids)
+            results = map(_validate_range, chunks)
+
+        try:
+            for chunk_records, chunk_issues, count in results:
+                records.extend(chunk_records)
+                issues.extend(chunk_issues)
+                row_count += count
+                if progress:
+                    progress(row_count, message=f'已驗證 {row_count} 筆')
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    return records, issues, row_count
+
+
+def write_error_report(path, issues):
+    """問題清單寫成 CSV（行號、欄位、原始值、等級、原因）"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['row', 'column', 'value', 'level', 'reason'])
+        writer.writerows(issues)
@@ -0,0 +1,113 @@
+"""
+飲料搜尋條件與「附近最便宜」查詢
+
+intent_q 為 search_drinks 的智能拆解規則（珍奶、鮮奶茶、茶類、奶類…），
+cheapest_nearby 以同一套規則，在單一查詢中找出半徑內最便宜的飲料。
+"""
+from django.db.models import Q
+
+from .geo import bounding_box_filter, distance_expression
+from .opening_hours import open_now_exists
+
+
+# 常見飲料組合關鍵字（完整詞優先）
+DRINK_COMBINATIONS = {
+    '鮮奶茶': Q(name__icontains='鮮奶') & Q(name__icontains='茶'),
+    '奶精茶': Q(name__icontains='奶精') & Q(name__icontains='茶'),
+    '珍珠奶茶': Q(name__icontains='珍珠') & Q(name__icontains='奶茶'),
+    '珍奶': Q(name__icontains='珍珠') | Q(name__icontains='奶茶'),
+    '奶綠': Q(name__icontains='奶綠') | (Q(name__icontains='綠茶') & Q(milk_type__isnull=False)),
+    '紅茶拿鐵': Q(name__icontains='紅茶') & Q(name__icontains='拿鐵'),
+    '綠茶拿鐵': Q(name__icontains='綠茶') & Q(name__icontains='拿鐵'),
+    '烏龍拿鐵': Q(name__icontains='烏龍') & Q(name__icontains='拿鐵'),
+    '抹茶拿鐵': Q(name__icontains='抹茶') & Q(name__icontains='拿鐵'),
+}
+
+TEA_TYPE_KEYWORDS = {
+    '紅茶': 'black_tea',
+    '綠茶': 'green_tea',
+    '烏龍茶': 'oolong_tea',
+    '烏龍': 'oolong_tea',
+    '青茶': 'blue_tea',
+    '抹茶': 'matcha',
+    '鐵觀音': 'tieguanyin',
+    '麥茶': 'barley_tea',
+    '四季春': 'season',
+    '茉莉花茶': 'jasmine',
+    '茉莉': 'jasmine',
+    '普洱茶': 'pu_erh',
+    '普洱': 'pu_erh',
+}
+
+DEFAULT_RADIUS_KM = 1
+MAX_RADIUS_KM = 20
+MAX_LIMIT = 50
+
+
+def intent_q(search_query):
+    """依搜尋詞的意圖（組合詞、茶類、奶類、配料）組成條件，沒有符合的意圖時回傳空的 Q()"""
+    query_conditions = Q()
+
+    # 檢查是否匹配組合關鍵字
+    for combo_keyword, combo_query in DRINK_COMBINATIONS.items():
+        if combo_keyword in search_query:
+            return combo_query
+
+    # 茶類搜尋（僅當搜尋詞是純茶類時）
+    tea_matched = False
+    for tea_name, tea_code in TEA_TYPE_KEYWORDS.items():
+        if search_query == tea_name or (tea_name in search_query and len(search_query) <= len(tea_name) + 2):
+            query_conditions |= Q(tea_type=tea_code)
+            tea_matched = True
+            break
+
+    # 奶類搜尋（僅當搜尋詞是純奶類時）
+    if search_query in ['鮮奶', '牛奶'] or (search_query.endswith('鮮奶') and len(search_query) <= 6):
+        query_conditions |= Q(milk_type='fresh_milk')
+    elif search_query == '奶精' or (search_query.endswith('奶精') and len(search_query) <= 6):
+        query_conditions |= Q(milk_type='creamer')
+
+    # 配料搜尋
+    if search_query in ['珍珠', '波霸', '配料'] or search_query.startswith('珍珠'):
+        query_conditions |= Q(topping='yes')
+
+    # 如果以上都沒匹配，嘗試部分匹配飲料名稱
+    if not tea_matched and not query_conditions:
+        if '拿鐵' in search_query:
+            query_conditions |= Q(name__icontains='拿鐵')
+        if '奶茶' in search_query and search_query != '奶茶':
+            query_conditions |= Q(name__icontains='奶茶')
+
+    return query_conditions
+
+
+def keyword_q(search_query):
+    """飲料名稱直接包含關鍵字，或符合關鍵字的意圖"""
+    return Q(name__icontains=search_query) | intent_q(search_query)
+
+
+def cheapest_nearby(search_query, lat, lng, radius_km=DEFAULT_RADIUS_KM, open_now=False, limit=10):
+    """
+    半徑內最便宜的飲料，回傳 Drink 查詢集（已附 distance 與 select_related('tea_shop')）
+
+    以經緯度範圍走 TeaShop 索引預篩，再以 (tea_shop, min_price) 索引取飲料，
+    價格相同時距離近者優先，只取前 limit 筆。
+    """
+    from .models import Drink
+
+    drinks = Drink.objects.select_related('tea_shop').filter(
+        min_price__isnull=False,
+        **bounding_box_filter(lat, lng, radius_km, prefix='tea_shop__'),
+    )
+    if search_query:
+        drinks = drinks.filter(keyword_q(search_query))
+    if open_now:
+        drinks = drinks.filter(open_now_exists(shop_ref='tea_shop_id'))
+
+    return (
+        drinks
+        .annotate(distance=distance_expression(lat, lng, prefix='tea_shop__'))
+        .filter(distance__lte=radius_km)
+        .order_by('min_price', 'distance', 'id')[:limit]
+    )
+
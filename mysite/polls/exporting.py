@@ -0,0 +1,160 @@
+"""
+目錄匯出（店家、飲料、收藏）
+
+- 店家與飲料的 CSV 欄位與 奶茶尋_店家.csv / 奶茶尋資料.csv 相同，可直接再匯入或與廠商檔案比對
+- JSONL 每行一筆，key 與 CSV 欄位相同
+- 以 .iterator(chunk_size=...) 逐段讀取並逐行產生輸出，記憶體用量與資料量無關
+"""
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from . import drink_csv
+from .models import Drink, Favorite, TeaShop
+
+
+KINDS = ['shops', 'drinks', 'favorites']
+FORMATS = ['csv', 'jsonl']
+
+CHUNK_SIZE = 2000
+
+# 與 奶茶尋_店家.csv 相同
+SHOP_COLUMNS = ['place_id', 'name', 'address', 'phone', 'latitude', 'longitude', 'rating', 'opening_hours']
+
+# 與 奶茶尋資料.csv 相同
+DRINK_COLUMNS = [
+    drink_csv.SHOP_COLUMN,
+    drink_csv.COLUMNS['name'],
+    drink_csv.COLUMNS['description'],
+    drink_csv.COLUMNS['milk_type'],
+    drink_csv.COLUMNS['has_medium'],
+    drink_csv.COLUMNS['price_medium'],
+    drink_csv.COLUMNS['has_large'],
+    drink_csv.COLUMNS['price_large'],
+    drink_csv.COLUMNS['tea_type'],
+    drink_csv.COLUMNS['topping'],
+]
+
+# 收藏的店家以 place_id 對應；收藏飲料時為該飲料的店家與飲料名稱
+FAVORITE_COLUMNS = [
+    'username', 'favorite_type', 'place_id', drink_csv.SHOP_COLUMN, drink_csv.COLUMNS['name'],
+    'notes', 'created_at',
+]
+
+COLUMNS = {
+    'shops': SHOP_COLUMNS,
+    'drinks': DRINK_COLUMNS,
+    'favorites': FAVORITE_COLUMNS,
+}
+
+# 代碼 -> CSV 原始值（匯入時的反向對應）
+MILK_LABELS = {value: label for label, value in drink_csv.MILK_TYPES.items()}
+TEA_LABELS = {value: label for label, value in drink_csv.TEA_TYPES.items()}
+TOPPING_LABELS = {value: label for label, value in drink_csv.TOPPINGS.items()}
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        # 去掉補上的尾數 0（4.0 -> 4、121.5290660 -> 121.529066），與原始檔案相同
+        return format(value.normalize(), 'f')
+    return str(value)
+
+
+def _yes_no(value):
+    return '有' if value else '無'
+
+
+def shop_rows():
+    """逐筆產生店家的欄位值（依 SHOP_COLUMNS 順序）"""
+    rows = TeaShop.objects.order_by('pk').values_list(*SHOP_COLUMNS)
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield [_text(value) for value in row]
+
+
+def drink_rows():
+    """逐筆產生飲料的欄位值（依 DRINK_COLUMNS 順序）"""
+    rows = Drink.objects.order_by('tea_shop_id', 'pk').values_list(
+        'tea_shop__name', 'name', 'description', 'milk_type', 'has_medium', 'price_medium',
+        'has_large', 'price_large', 'tea_type', 'topping',
+    )
+    for shop_name, name, description, milk_type, has_medium, price_medium, has_large, price_large, tea_type, topping in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield [
+            shop_name,
+            name,
+            _text(description),
+            MILK_LABELS.get(milk_type, ''),
+            _yes_no(has_medium),
+            _text(price_medium),
+            _yes_no(has_large),
+            _text(price_large),
+            TEA_LABELS.get(tea_type, ''),
+            TOPPING_LABELS.get(topping, ''),
+        ]
+
+
+def favorite_rows():
+    """逐筆產生收藏的欄位值（依 FAVORITE_COLUMNS 順序）"""
+    rows = Favorite.objects.order_by('pk').values_list(
+        'user__username', 'favorite_type', 'tea_shop__place_id', 'tea_shop__name',
+        'drink__tea_shop__place_id', 'drink__tea_shop__name', 'drink__name', 'notes', 'created_at',
+    )
+    for username, favorite_type, place_id, shop_name, drink_place_id, drink_shop_name, drink_name, notes, created_at in rows.iterator(chunk_size=CHUNK_SIZE):
+        if favorite_type == 'drink':
+            place_id, shop_name = drink_place_id, drink_shop_name
+        yield [
+            username, favorite_type, _text(place_id), _text(shop_name), _text(drink_name),
+            _text(notes), created_at.isoformat(),
+        ]
+
+
+ROWS = {
+    'shops': shop_rows,
+    'drinks': drink_rows,
+    'favorites': favorite_rows,
+}
+
+
+class _Line:
+    """csv.writer 的寫入目標：writerow() 直接回傳該行字串，不累積在記憶體"""
+
+    def write(self, value):
+        return value
+
+
+def lines(kind, fmt='csv'):
+    """逐行產生匯出內容（含換行）；CSV 第一行為欄位名稱"""
+    if kind not in ROWS:
+        raise ValueError(f'未知的匯出類型: {kind}')
+    if fmt not in FORMATS:
+        raise ValueError(f'未知的匯出格式: {fmt}')
+
+    columns = COLUMNS[kind]
+    if fmt == 'csv':
+        writer = csv.writer(_Line(), lineterminator='\n')
+        yield writer.writerow(columns)
+        for row in ROWS[kind]():
+            yield writer.writerow(row)
+    else:
+        for row in ROWS[kind]():
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+
+async def alines(kind, fmt='csv', batch=CHUNK_SIZE):
+    """
+    lines() 的 async 版本（ASGI 串流用）
+
+    每次在同一個執行緒（thread_sensitive）取出 batch 行，資料庫 cursor 不會跨執行緒使用；
+    直接把同步 iterator 交給 ASGI 的 StreamingHttpResponse 會先讀完整個回應。
+    """
+    iterator = lines(kind, fmt)
+    next_batch = sync_to_async(lambda: ''.join(islice(iterator, batch)))
+    try:
+        while chunk := await next_batch():
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close)()
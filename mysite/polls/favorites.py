@@ -0,0 +1,169 @@
+"""
+批次收藏（一次加入 / 移除多個店家或飲料）
+
+- 以 in_bulk 一次查出所有要加入的店家與飲料，不存在的 id 逐項回報 not_found
+- 在單一交易內以 bulk_create 新增、單一 DELETE 移除；讀取之後其他請求已建立相同收藏時
+  （唯一約束衝突）改為逐筆新增，衝突的項目回報 exists
+- bulk_create 與 QuerySet.delete() 的批次寫入期間以 deferred() 暫停逐筆更新收藏人數的 signals，
+  最後依收藏紀錄以每個模型一次 UPDATE 重算受影響項目的收藏人數
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Drink, Favorite, TeaShop
+
+
+# 單次請求最多處理的項目數
+MAX_ITEMS = 200
+
+# favorite_type -> (模型, Favorite 上的欄位)
+TARGETS = {
+    'shop': (TeaShop, 'tea_shop'),
+    'drink': (Drink, 'drink'),
+}
+
+_state = threading.local()
+
+
+@contextmanager
+def deferred():
+    """區塊內暫停 signals 逐筆更新收藏人數（由呼叫端在結束後自行 recount）"""
+    previous = getattr(_state, 'deferred', False)
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = previous
+
+
+def is_deferred():
+    return getattr(_state, 'deferred', False)
+
+
+def actual_count(field):
+    """依收藏紀錄計算的收藏人數（用於 model.objects.update(favorite_count=...)）"""
+    return Coalesce(Subquery(
+        Favorite.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount(favorite_type, ids):
+    """重算指定店家或飲料的收藏人數（單一 UPDATE）"""
+    if not ids:
+        return 0
+    model, field = TARGETS[favorite_type]
+    return model.objects.filter(pk__in=ids).update(favorite_count=actual_count(field))
+
+
+def parse_ids(values):
+    """回傳 (合法的 id 列表（去除重複、保留順序）, 無法解析的原始值列表)"""
+    ids, invalid = [], []
+    for value in values:
+        try:
+            item_id = int(value)
+        except (TypeError, ValueError):
+            invalid.append(value)
+            continue
+        if item_id not in ids:
+            ids.append(item_id)
+    return ids, invalid
+
+
+def _create(to_create):
+    """新增收藏，to_create 為 [(Favorite, 該項目的結果), ...]；已被其他請求建立的項目結果改為 exists"""
+    try:
+        with transaction.atomic():
+            Favorite.objects.bulk_create([favorite for favorite, _ in to_create])
+        return
+    except IntegrityError:
+        pass
+    for favorite, item in to_create:
+        favorite.pk = None
+        try:
+            with transaction.atomic():
+                favorite.save(force_insert=True)
+        except IntegrityError:
+            item['result'] = 'exists'
+
+
+def apply(user, add=None, remove=None):
+    """
+    批次加入與移除收藏
+
+    add / remove 為 {'shop': [id, ...], 'drink': [id, ...]}；同一項目同時出現在兩者時以移除為準。
+    回傳逐項結果 [{'action', 'type', 'id', 'result'}, ...]，result 為
+    added / exists / removed / not_favorited / not_found / invalid。
+    """
+    add = add or {}
+    remove = remove or {}
+    results = []
+    requested = {'add': {}, 'remove': {}}
+    for action, items in (('add', add), ('remove', remove)):
+        for favorite_type in TARGETS:
+            ids, invalid = parse_ids(items.get(favorite_type, []))
+            requested[action][favorite_type] = ids
+            results.extend(
+                {'action': action, 'type': favorite_type, 'id': value, 'result': 'invalid'}
+                for value in invalid
+            )
+    for favorite_type, ids in requested['add'].items():
+        removing = set(requested['remove'][favorite_type])
+        requested['add'][favorite_type] = [item_id for item_id in ids if item_id not in removing]
+
+    with transaction.atomic(), deferred():
+        # 使用者目前對這些項目的收藏：一次查詢
+        condition = Q(pk__in=[])
+        for favorite_type, (_, field) in TARGETS.items():
+            ids = requested['add'][favorite_type] + requested['remove'][favorite_type]
+            if ids:
+                condition |= Q(favorite_type=favorite_type, **{f'{field}_id__in': ids})
+        existing = {}
+        for favorite_id, favorite_type, shop_id, drink_id in Favorite.objects.filter(condition, user=user).values_list(
+            'id', 'favorite_type', 'tea_shop_id', 'drink_id'
+        ):
+            existing[(favorite_type, shop_id if favorite_type == 'shop' else drink_id)] = favorite_id
+
+        to_create = []
+        for favorite_type, (model, field) in TARGETS.items():
+            ids = requested['add'][favorite_type]
+            found = model.objects.order_by().only('pk').in_bulk(ids) if ids else {}
+            for item_id in ids:
+                if item_id not in found:
+                    result = 'not_found'
+                elif (favorite_type, item_id) in existing:
+                    result = 'exists'
+                else:
+                    result = 'added'
+                results.append({'action': 'add', 'type': favorite_type, 'id': item_id, 'result': result})
+                if result == 'added':
+                    favorite = Favorite(user=user, favorite_type=favorite_type, **{f'{field}_id': item_id})
+                    to_create.append((favorite, results[-1]))
+
+        to_delete = []
+        for favorite_type in TARGETS:
+            for item_id in requested['remove'][favorite_type]:
+                favorite_id = existing.get((favorite_type, item_id))
+                if favorite_id is None:
+                    result = 'not_favorited'
+                else:
+                    result = 'removed'
+                    to_delete.append(favorite_id)
+                results.append({'action': 'remove', 'type': favorite_type, 'id': item_id, 'result': result})
+
+        if to_create:
+            _create(to_create)
+        if to_delete:
+            Favorite.objects.filter(pk__in=to_delete, user=user).delete()
+
+        for favorite_type in TARGETS:
+            recount(favorite_type, [
+                item['id'] for item in results
+                if item['type'] == favorite_type and item['result'] in ('added', 'removed')
+            ])
+
+    return results
@@ -0,0 +1,86 @@
+"""
+距離計算工具
+
+calculate_distance 在 Python 端計算；bounding_box 與 distance_expression
+則讓距離篩選、排序直接在資料庫查詢中完成。
+"""
+from math import radians, sin, cos, sqrt, atan2, degrees, isfinite
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ATan2, Cast, Cos, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371  # 地球半徑（公里）
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """使用 Haversine 公式計算兩點間的距離（公里）"""
+    R = EARTH_RADIUS_KM
+
+    lat1_rad = radians(lat1)
+    lat2_rad = radians(lat2)
+    delta_lat = radians(lat2 - lat1)
+    delta_lon = radians(lon2 - lon1)
+
+    a = sin(delta_lat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    distance = R * c
+    return distance
+
+
+def parse_coordinates(lat, lng):
+    """
+    將經緯度字串轉為 (lat, lng)
+
+    非有限數值（inf、nan）或超出範圍（緯度 -90~90、經度 -180~180）時 ValueError。
+    """
+    lat, lng = float(lat), float(lng)
+    if not (isfinite(lat) and isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f'無效的座標: {lat}, {lng}')
+    return lat, lng
+
+
+def parse_radius(radius):
+    """將半徑字串轉為公里數；非有限數值或不大於 0 時 ValueError"""
+    radius = float(radius)
+    if not (isfinite(radius) and radius > 0):
+        raise ValueError(f'無效的半徑: {radius}')
+    return radius
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    回傳涵蓋半徑的經緯度範圍 (min_lat, max_lat, min_lng, max_lng)
+
+    用於 latitude / longitude 索引的範圍預篩，再以精確距離過濾。
+    """
+    delta_lat = degrees(radius_km / EARTH_RADIUS_KM)
+    # 高緯度時經度 1 度的距離變短，需放寬範圍
+    cos_lat = max(cos(radians(lat)), 1e-6)
+    delta_lng = degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    return lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng
+
+
+def bounding_box_filter(lat, lng, radius_km, prefix=''):
+    """bounding_box 的 filter() 參數（prefix 例如 'tea_shop__'）"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    return {
+        f'{prefix}latitude__gte': min_lat,
+        f'{prefix}latitude__lte': max_lat,
+        f'{prefix}longitude__gte': min_lng,
+        f'{prefix}longitude__lte': max_lng,
+    }
+
+
+def distance_expression(lat, lng, prefix=''):
+    """與 calculate_distance 相同的 Haversine 公式，作為資料庫運算式（公里）"""
+    shop_lat = Radians(Cast(F(f'{prefix}latitude'), FloatField()))
+    shop_lng = Radians(Cast(F(f'{prefix}longitude'), FloatField()))
+    user_lat = radians(lat)
+
+    a = (
+        Power(Sin((shop_lat - Value(user_lat)) / 2), 2)
+        + Value(cos(user_lat)) * Cos(shop_lat) * Power(Sin((shop_lng - Value(radians(lng))) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ATan2(Sqrt(a), Sqrt(Value(1.0) - a))
@@ -0,0 +1,55 @@
+"""
+店家照片清單
+
+get_shop_images 把照片存成 static/shop_images/<place_id>.jpg（或 .png）。
+原本樣板先載入 .jpg、失敗再以 onerror 改載 .png，沒有照片的店家每次都會多出兩個 404 請求；
+改為掃描一次目錄得到 place_id -> 檔名，樣板直接輸出正確的路徑或佔位圖。
+目錄的修改時間變動（新增或刪除照片）時重新掃描。
+"""
+import os
+
+from django.conf import settings
+
+
+IMAGE_DIR = 'shop_images'
+
+EXTENSIONS = ('.jpg', '.png')
+
+_manifest = None
+_mtime = None
+
+
+def image_dir():
+    return os.path.join(settings.BASE_DIR, 'static', IMAGE_DIR)
+
+
+def scan(path):
+    """掃描照片目錄，回傳 {place_id: 'shop_images/<檔名>'}（同一店家有多種格式時以 .jpg 優先）"""
+    manifest = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            place_id, extension = os.path.splitext(entry.name)
+            if extension.lower() not in EXTENSIONS or not entry.is_file():
+                continue
+            current = manifest.get(place_id)
+            if current is None or extension.lower() == EXTENSIONS[0]:
+                manifest[place_id] = f'{IMAGE_DIR}/{entry.name}'
+    return manifest
+
+
+def manifest():
+    """目前的照片清單（每個行程快取，目錄修改時間變動時重新掃描）"""
+    global _manifest, _mtime
+    path = image_dir()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _manifest is None or mtime != _mtime:
+        _manifest, _mtime = scan(path), mtime
+    return _manifest
+
+
+def shop_image(place_id):
+    """店家照片的 static 路徑，沒有照片時為 None"""
+    return manifest().get(place_id) if place_id else None
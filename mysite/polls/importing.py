@@ -0,0 +1,205 @@
+"""
+飲料匯入的差異比對與合併
+
+- fingerprint(): 正規化後的飲料內容雜湊，存於 Drink.fingerprint；比對時不必逐欄位比較
+- file_digest() / is_imported() / record_file(): 整個檔案的 SHA-256，內容未變更、
+  且目錄版本（polls.catalog）仍與上次匯入完成時相同的檔案直接略過
+- diff(): 以 (店家, 名稱) 對應 Drink，依指紋得到新增 / 變更 / 未變動 / 移除
+- publish(): 只把新增與變更的資料寫入 DrinkStaging，再於單一交易內以集合式的
+  UPDATE / INSERT / DELETE 合併，並一併重算菜單統計、推薦排名與標準飲料
+
+WAL 模式下讀取不會被寫入鎖住，且在 commit 前看到的都是舊的菜單，
+commit 後一次看到新的菜單，不會出現清空後逐筆補回的半完成狀態。
+"""
+import hashlib
+import os
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+
+from . import canonical, catalog, menu_stats, ranking
+from .models import Drink, DrinkStaging, ImportFile
+
+
+# 指紋涵蓋的欄位（min_price 由價格推導，不列入）
+FINGERPRINT_FIELDS = [
+    'name', 'description', 'milk_type', 'tea_type', 'topping',
+    'has_medium', 'price_medium', 'has_large', 'price_large',
+]
+
+# 匯入會覆寫的欄位（依 (店家, 名稱) 比對同一杯飲料）
+FIELDS = [
+    'description', 'milk_type', 'tea_type', 'topping',
+    'has_medium', 'price_medium', 'has_large', 'price_large', 'min_price', 'fingerprint',
+]
+
+BATCH_SIZE = 1000
+
+_ONE = Decimal(1)
+
+
+def _normalize(value):
+    """與寫入資料庫後讀回的值一致：None 與空字串相同、價格取整數"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, Decimal):
+        return str(value.quantize(_ONE)) if value.is_finite() else str(value)
+    return str(value).strip()
+
+
+def fingerprint(data):
+    """飲料欄位 dict -> 32 字元的內容指紋"""
+    payload = '\x1f'.join(_normalize(data.get(field)) for field in FINGERPRINT_FIELDS)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def instance_fingerprint(drink):
+    """Drink（或 migration 中的歷史模型）的內容指紋"""
+    return fingerprint({field: getattr(drink, field) for field in FINGERPRINT_FIELDS})
+
+
+def file_digest(path):
+    """回傳 (SHA-256, 檔案大小)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), os.path.getsize(path)
+
+
+def is_imported(kind, path, sha256):
+    """
+    同一路徑上次成功匯入的內容與此雜湊相同，且目錄版本在那之後沒有改變
+
+    匯入後飲料被刪除或修改、店家被重新匯入或新增時版本即遞增，
+    同一個檔案需要重新匯入（先前因店家不存在而略過的列也會重試）。
+    """
+    recorded = ImportFile.objects.filter(kind=kind, path=os.path.abspath(path), sha256=sha256).values_list(
+        'catalog_version', flat=True
+    ).first()
+    return recorded is not None and recorded == catalog.version(refresh=True)
+
+
+def record_file(kind, path, sha256, size, row_count):
+    """記錄所有列都成功匯入的檔案（在寫入資料庫之後呼叫）"""
+    ImportFile.objects.update_or_create(
+        kind=kind,
+        path=os.path.abspath(path),
+        defaults={
+            'sha256': sha256, 'size': size, 'row_count': row_count,
+            'catalog_version': catalog.version(refresh=True),
+        },
+    )
+
+
+def forget(kind):
+    """清除某類型的匯入紀錄，下次匯入不論檔案內容都重新比對"""
+    return ImportFile.objects.filter(kind=kind).delete()[0]
+
+
+def diff(rows, prune=False):
+    """
+    rows 與 Drink 的差異，rows 為 {(tea_shop_id, name): drink_data}
+
+    回傳 {'created': [key, ...], 'changed': {drink_id: key}, 'unchanged': 筆數, 'removed': [drink_id, ...]}；
+    prune 為 False 時不列出移除。
+    """
+    fingerprints = {key: fingerprint(data) for key, data in rows.items()}
+
+    seen = set()
+    changed = {}
+    removed = []
+    unchanged = 0
+    for drink_id, shop_id, name, current in (
+        Drink.objects.values_list('id', 'tea_shop_id', 'name', 'fingerprint').iterator(chunk_size=5000)
+    ):
+        key = (shop_id, name)
+        if key not in fingerprints:
+            if prune:
+                removed.append(drink_id)
+            continue
+        seen.add(key)
+        if fingerprints[key] == current:
+            unchanged += 1
+        else:
+            changed[drink_id] = key
+
+    return {
+        'created': [key for key in rows if key not in seen],
+        'changed': changed,
+        'unchanged': unchanged,
+        'removed': removed,
+    }
+
+
+def stage(rows, keys):
+    """清空暫存表後寫入 rows 中指定 keys 的資料"""
+    staged = []
+    for key in keys:
+        row_number, data = rows[key]
+        drink = DrinkStaging(row_number=row_number, tea_shop_id=key[0], **data)
+        drink.min_price = Drink(**data).calculate_min_price()
+        drink.fingerprint = fingerprint(data)
+        staged.append(drink)
+
+    DrinkStaging.objects.all().delete()
+    DrinkStaging.objects.bulk_create(staged, batch_size=BATCH_SIZE)
+
+
+def publish(rows, prune=False):
+    """
+    將 rows（{(tea_shop_id, name): (row_number, drink_data)}）合併到 Drink（單一交易），回傳各項筆數
+
+    prune 為 True 時刪除 rows 中已不存在的飲料（連帶刪除其收藏）。
+    沒有任何異動時不重算菜單統計、排名與標準飲料。
+    """
+    with transaction.atomic(), menu_stats.deferred():
+        changes = diff({key: data for key, (_, data) in rows.items()}, prune)
+        stage(rows, [*changes['created'], *set(changes['changed'].values())])
+        shop_ids = set()
+
+        if changes['changed']:
+            # 暫存表只有新增與變更的資料，能對應到暫存列的 Drink 即為需要更新的飲料；
+            # 單一 UPDATE，各欄位取暫存表中對應的值
+            staged = DrinkStaging.objects.filter(tea_shop_id=OuterRef('tea_shop_id'), name=OuterRef('name'))
+            Drink.objects.filter(Exists(staged)).update(
+                **{field: Subquery(staged.values(field)[:1]) for field in FIELDS}
+            )
+            shop_ids.update(shop_id for shop_id, _ in changes['changed'].values())
+
+        if changes['created']:
+            created = set(changes['created'])
+            staged = DrinkStaging.objects.values('tea_shop_id', 'name', *FIELDS).iterator(chunk_size=2000)
+            Drink.objects.bulk_create(
+                (Drink(**row) for row in staged if (row['tea_shop_id'], row['name']) in created),
+                batch_size=BATCH_SIZE,
+            )
+            shop_ids.update(shop_id for shop_id, _ in created)
+
+        # 分批刪除，避免 IN (...) 超過 SQLite 的參數上限
+        for offset in range(0, len(changes['removed']), BATCH_SIZE):
+            removed = Drink.objects.filter(pk__in=changes['removed'][offset:offset + BATCH_SIZE])
+            shop_ids.update(removed.values_list('tea_shop_id', flat=True))
+            removed.delete()
+
+        DrinkStaging.objects.all().delete()
+
+        stats = {
+            'created': len(changes['created']),
+            'updated': len(changes['changed']),
+            'unchanged': changes['unchanged'],
+            'deleted': len(changes['removed']),
+            'shops_updated': 0,
+            'ranking': None,
+            'canonical': None,
+        }
+        if shop_ids:
+            catalog.bump()
+            stats['shops_updated'] = menu_stats.refresh(shop_ids)
+            stats['ranking'] = ranking.rebuild()
+            stats['canonical'] = canonical.rebuild()
+
+    return stats
@@ -0,0 +1,290 @@
+"""
+背景工作佇列（資料庫為佇列，不需要外部 broker）
+
+- enqueue(): 相同類型與參數的工作已在等待或執行中時不會重複建立（Job 上的條件式唯一約束）
+- claim(): worker 以條件式 UPDATE 取得工作，同一工作只會被一個 worker 取得；
+  各 group（匯入、抓圖、重建）同時執行的數量受 settings.JOB_CONCURRENCY 限制，
+  計算執行中數量與取得工作在同一個先取得寫入鎖的交易中完成（見 write_lock）
+- run(): 以 call_command 執行對應的管理指令，擷取輸出並定期回報進度；
+  失敗時依 settings.JOB_RETRY_DELAY 延後重試，超過 max_attempts 次標記為失敗
+- 心跳超過 settings.JOB_STALE_AFTER 秒的執行中工作（worker 已中止）會被重新排入佇列
+"""
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command, get_commands, load_command_class
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# 工作類型 -> (管理指令, group)
+JOB_KINDS = {
+    'import_drinks': ('import_drinks', 'import'),
+    'import_teashops': ('import_teashops', 'import'),
+    'get_shop_images': ('get_shop_images', 'images'),
+    'rebuild_rankings': ('rebuild_rankings', 'rebuild'),
+    'refresh_menu_stats': ('refresh_menu_stats', 'rebuild'),
+    'canonicalize_drinks': ('canonicalize_drinks', 'rebuild'),
+    'build_recommendations': ('build_recommendations', 'rebuild'),
+    'reconcile_favorite_counts': ('reconcile_favorite_counts', 'rebuild'),
+    'build_snapshot': ('build_snapshot', 'rebuild'),
+    'warm_caches': ('warm_caches', 'rebuild'),
+}
+
+KIND_CHOICES = [(kind, kind) for kind in JOB_KINDS]
+
+# 輸出只保留最後這麼多字元
+OUTPUT_LIMIT = 20000
+
+# 進度寫入資料庫的最短間隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+# 執行中工作的心跳間隔（秒），需小於 settings.JOB_STALE_AFTER
+HEARTBEAT_INTERVAL = 30
+
+
+def dedup_key(kind, arguments):
+    return f'{kind}:{json.dumps(list(arguments), ensure_ascii=False)}'
+
+
+def enqueue(kind, arguments=(), max_attempts=None):
+    """
+    排入工作，回傳 (job, created)
+
+    相同工作已在等待或執行中時回傳既有的那一筆（created 為 False）。
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f'未知的工作類型: {kind}')
+
+    arguments = [str(argument) for argument in arguments]
+    key = dedup_key(kind, arguments)
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                kind=kind,
+                arguments=arguments,
+                dedup_key=key,
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+                run_after=timezone.now(),
+            )
+        return job, True
+    except IntegrityError:
+        return Job.objects.get(dedup_key=key, status__in=Job.ACTIVE_STATUSES), False
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+@contextmanager
+def write_lock():
+    """
+    一開始就取得寫入鎖的交易
+
+    先查詢再更新的流程（執行中數量、心跳逾時）若用 SQLite 預設的 DEFERRED 交易，
+    兩個 worker 可能都通過檢查，或在讀轉寫時直接 "database is locked"；
+    BEGIN IMMEDIATE 讓其他 worker 在 busy timeout 內排隊等待。
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    # transaction_mode 在建立連線時由設定帶入，需先連線再暫時改為 IMMEDIATE
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def requeue_stale():
+    """心跳逾時的執行中工作（worker 已中止）重新排入佇列"""
+    stale_before = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER)
+    count = 0
+    with write_lock():
+        for job_id in list(Job.objects.filter(status='running', heartbeat_at__lt=stale_before).values_list('id', flat=True)):
+            if _requeue(job_id, run_after=timezone.now()) == 'queued':
+                count += 1
+    return count
+
+
+def _requeue(job_id, **fields):
+    """重新排入佇列；若已有相同工作在等待中則改標記為失敗（由那一筆執行即可）"""
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job_id).update(status='queued', worker='', finished_at=None, **fields)
+        return 'queued'
+    except IntegrityError:
+        Job.objects.filter(pk=job_id).update(
+            status='failed', worker='', finished_at=timezone.now(),
+            progress_message='已有相同的工作在佇列中',
+        )
+        return 'failed'
+
+
+def full_groups():
+    """執行中數量已達 settings.JOB_CONCURRENCY 上限的 group"""
+    running = {}
+    for kind in Job.objects.filter(status='running').values_list('kind', flat=True):
+        group = JOB_KINDS.get(kind, (None, kind))[1]
+        running[group] = running.get(group, 0) + 1
+    return {
+        group for group, count in running.items()
+        if count >= settings.JOB_CONCURRENCY.get(group, 1)
+    }
+
+
+def claim(worker):
+    """取得下一個可執行的工作（沒有時回傳 None）"""
+    now = timezone.now()
+    with write_lock():
+        blocked = full_groups()
+        blocked_kinds = [kind for kind, (_, group) in JOB_KINDS.items() if group in blocked]
+
+        candidates = (
+            Job.objects.filter(status='queued', run_after__lte=now, kind__in=list(JOB_KINDS))
+            .exclude(kind__in=blocked_kinds)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:10]
+        )
+        for job_id in candidates:
+            # 條件式 UPDATE：只有一個 worker 能把 queued 改為 running
+            claimed = Job.objects.filter(pk=job_id, status='queued').update(
+                status='running',
+                worker=worker,
+                attempts=F('attempts') + 1,
+                started_at=now,
+                heartbeat_at=now,
+                finished_at=None,
+                progress_current=0,
+                progress_total=None,
+                progress_message='',
+            )
+            if claimed:
+                return Job.objects.get(pk=job_id)
+    return None
+
+
+class ProgressReporter:
+    """傳給管理指令的 progress 回呼：progress(current, total=None, message='')"""
+
+    def __init__(self, job):
+        self.job = job
+        self.last_write = 0
+        self.pending = None
+
+    def __call__(self, current, total=None, message=''):
+        self.pending = (current, total, message)
+        now = time.monotonic()
+        if now - self.last_write < PROGRESS_INTERVAL and (total is None or current < total):
+            return
+        self.last_write = now
+        self.flush()
+
+    def flush(self):
+        """寫入最後一次回報的進度（節流期間略過的那些）"""
+        if self.pending is None:
+            return
+        current, total, message = self.pending
+        self.pending = None
+        Job.objects.filter(pk=self.job.pk).update(
+            progress_current=current,
+            progress_total=total,
+            progress_message=message[:255],
+            heartbeat_at=timezone.now(),
+        )
+
+
+def run(job):
+    """執行工作並記錄結果；回傳最終狀態"""
+    command_name, _ = JOB_KINDS[job.kind]
+    command = load_command_class(get_commands()[command_name], command_name)
+    output = io.StringIO()
+    options = {'stdout': output, 'stderr': output}
+    progress = ProgressReporter(job)
+    # 支援進度回報的指令會在 stealth_options 宣告 progress
+    if 'progress' in command.stealth_options:
+        options['progress'] = progress
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job.pk, stop), daemon=True)
+    heartbeat.start()
+    try:
+        call_command(command, *job.arguments, **options)
+    except BaseException as exc:
+        stop.set()
+        heartbeat.join()
+        progress.flush()
+        fields = {
+            'output': output.getvalue()[-OUTPUT_LIMIT:],
+            'error': traceback.format_exc()[-OUTPUT_LIMIT:],
+        }
+        if job.attempts < job.max_attempts and not isinstance(exc, KeyboardInterrupt):
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            status = _requeue(job.pk, run_after=timezone.now() + timedelta(seconds=delay), **fields)
+        else:
+            status = 'failed'
+            Job.objects.filter(pk=job.pk).update(status='failed', worker='', finished_at=timezone.now(), **fields)
+        logger.warning('工作 #%s %s 失敗（第 %s 次）: %s', job.pk, job.kind, job.attempts, exc)
+        if isinstance(exc, KeyboardInterrupt):
+            raise
+        return status
+
+    stop.set()
+    heartbeat.join()
+    progress.flush()
+    Job.objects.filter(pk=job.pk).update(
+        status='succeeded',
+        output=output.getvalue()[-OUTPUT_LIMIT:],
+        error='',
+        heartbeat_at=timezone.now(),
+        finished_at=timezone.now(),
+    )
+    return 'succeeded'
+
+
+def _heartbeat(job_id, stop):
+    """工作執行期間定期更新 heartbeat_at，避免長時間、未回報進度的工作被視為中止"""
+    from django.db import connection
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            Job.objects.filter(pk=job_id, status='running').update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def cancel(queryset):
+    """取消尚未開始的工作"""
+    return queryset.filter(status='queued').update(status='cancelled', finished_at=timezone.now())
+
+
+def retry(queryset):
+    """把失敗或已取消的工作重新排入佇列（已有相同工作在佇列中的會略過）"""
+    count = 0
+    for job in queryset.filter(status__in=['failed', 'cancelled']):
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status='queued', attempts=0, run_after=timezone.now(), finished_at=None, error='',
+                )
+            count += 1
+        except IntegrityError:
+            continue
+    return count
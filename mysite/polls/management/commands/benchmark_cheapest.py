@@ -0,0 +1,221 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from polls.drink_search import cheapest_nearby, keyword_q
+from polls.geo import calculate_distance
+from polls.models import Drink, OpeningPeriod, TeaShop
+from polls.opening_hours import parse_periods
+
+
+# 產生測試資料用的飲料 (名稱, 茶類, 奶類, 配料)
+SAMPLE_DRINKS = [
+    ('珍珠奶茶', 'black_tea', 'creamer', 'yes'),
+    ('珍珠鮮奶茶', 'black_tea', 'fresh_milk', 'yes'),
+    ('波霸奶綠', 'green_tea', 'creamer', 'yes'),
+    ('紅茶拿鐵', 'black_tea', 'fresh_milk', 'no'),
+    ('鐵觀音拿鐵', 'tieguanyin', 'fresh_milk', 'no'),
+    ('四季春青茶', 'season', None, 'no'),
+    ('茉莉綠茶', 'jasmine', None, 'no'),
+    ('烏龍奶茶', 'oolong_tea', 'creamer', 'no'),
+    ('抹茶拿鐵', 'matcha', 'fresh_milk', 'no'),
+    ('冬瓜檸檬', 'other', None, 'no'),
+]
+
+SAMPLE_HOURS = [
+    '24 小時營業',
+    ' | '.join(f'{day}: 10:00 – 22:00' for day in ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']),
+    ' | '.join(f'{day}: 08:00 – 20:00' for day in ['星期一', '星期二', '星期三', '星期四', '星期五']) + ' | 星期六: 休息 | 星期日: 休息',
+    ' | '.join(f'{day}: 18:00 – 02:00' for day in ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']),
+]
+
+# 台北市中心附近
+CENTER_LAT = 25.0330
+CENTER_LNG = 121.5654
+
+
+class Command(BaseCommand):
+    help = '在暫時的測試資料庫中產生大量店家，測量「附近最便宜」查詢與逐店計算距離做法的延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shops',
+            type=int,
+            default=100000,
+            help='產生的店家數量 (預設: 100000)'
+        )
+        parser.add_argument(
+            '--drinks-per-shop',
+            type=int,
+            default=5,
+            help='每家店的飲料數量 (預設: 5)'
+        )
+        parser.add_argument(
+            '--span-km',
+            type=float,
+            default=30,
+            help='店家分布範圍的邊長（公里，預設: 30）'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='查詢次數 (預設: 200)'
+        )
+        parser.add_argument(
+            '--baseline-queries',
+            type=int,
+            default=5,
+            help='逐店計算距離做法的查詢次數，0 表示略過 (預設: 5)'
+        )
+        parser.add_argument(
+            '--keyword',
+            type=str,
+            default='珍珠奶茶',
+            help='搜尋關鍵字 (預設: 珍珠奶茶)'
+        )
+        parser.add_argument(
+            '--radius',
+            type=float,
+            default=1,
+            help='搜尋半徑（公里，預設: 1）'
+        )
+
+    def handle(self, *args, **options):
+        # 使用與測試相同的暫時資料庫，不影響正式資料
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        rng = random.Random(42)
+        half_lat = options['span_km'] / 2 / 111.0
+        half_lng = options['span_km'] / 2 / 100.6
+
+        started = time.perf_counter()
+        self.populate(rng, options['shops'], options['drinks_per_shop'], half_lat, half_lng)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(
+            f'產生 {TeaShop.objects.count()} 家店、{Drink.objects.count()} 杯飲料 '
+            f'({time.perf_counter() - started:.1f} 秒)'
+        )
+
+        keyword = options['keyword']
+        radius = options['radius']
+        points = [
+            (CENTER_LAT + rng.uniform(-half_lat, half_lat), CENTER_LNG + rng.uniform(-half_lng, half_lng))
+            for _ in range(options['queries'])
+        ]
+
+        # 查詢計畫
+        sql, params = cheapest_nearby(keyword, *points[0], radius).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.stdout.write('查詢計畫:')
+        for line in plan:
+            self.stdout.write(f'  {line}')
+        self.stdout.write('-' * 80)
+
+        results = {}
+        results['cheapest_nearby'] = self.measure(
+            points, lambda lat, lng: list(cheapest_nearby(keyword, lat, lng, radius))
+        )
+        results['cheapest_nearby (營業中)'] = self.measure(
+            points, lambda lat, lng: list(cheapest_nearby(keyword, lat, lng, radius, open_now=True))
+        )
+        if options['baseline_queries']:
+            results['逐店計算距離'] = self.measure(
+                points[:options['baseline_queries']], lambda lat, lng: self.baseline(keyword, lat, lng, radius)
+            )
+
+        # 確認兩種做法的結果相同
+        if options['baseline_queries']:
+            lat, lng = points[0]
+            fast = [(d.id, d.min_price) for d in cheapest_nearby(keyword, lat, lng, radius)]
+            slow = [(d.id, d.min_price) for d in self.baseline(keyword, lat, lng, radius)]
+            if [price for _, price in fast] != [price for _, price in slow]:
+                self.stdout.write(self.style.ERROR('兩種做法的價格排序不一致'))
+
+        for label, result in results.items():
+            self.stdout.write(
+                f'{label}: {result["count"]} 次, p50 {result["p50"] * 1000:.2f}ms, '
+                f'p95 {result["p95"] * 1000:.2f}ms, 平均結果 {result["rows"]:.1f} 筆'
+            )
+
+        if '逐店計算距離' in results:
+            before = results['逐店計算距離']['p50']
+            after = results['cheapest_nearby']['p50']
+            if after:
+                self.stdout.write('-' * 80)
+                self.stdout.write(self.style.SUCCESS(f'p50 延遲: {before * 1000:.1f}ms → {after * 1000:.2f}ms ({before / after:.0f}x)'))
+
+    def populate(self, rng, shop_count, drinks_per_shop, half_lat, half_lng):
+        """以 bulk_create 產生店家、營業時段與飲料"""
+        batch = 5000
+        for offset in range(0, shop_count, batch):
+            shops = TeaShop.objects.bulk_create([
+                TeaShop(
+                    place_id=f'bench-{index}',
+                    name=f'測試店家 {index}',
+                    address=f'測試地址 {index}',
+                    latitude=round(CENTER_LAT + rng.uniform(-half_lat, half_lat), 7),
+                    longitude=round(CENTER_LNG + rng.uniform(-half_lng, half_lng), 7),
+                    rating=round(rng.uniform(3, 5), 1),
+                    opening_hours=rng.choice(SAMPLE_HOURS),
+                )
+                for index in range(offset, min(offset + batch, shop_count))
+            ])
+
+            periods = []
+            drinks = []
+            for shop in shops:
+                periods += [
+                    OpeningPeriod(tea_shop=shop, weekday=weekday, open_minute=open_minute, close_minute=close_minute)
+                    for weekday, open_minute, close_minute in parse_periods(shop.opening_hours)
+                ]
+                for name, tea_type, milk_type, topping in rng.sample(SAMPLE_DRINKS, min(drinks_per_shop, len(SAMPLE_DRINKS))):
+                    price = rng.randrange(30, 90, 5)
+                    drink = Drink(
+                        tea_shop=shop, name=name, tea_type=tea_type, milk_type=milk_type, topping=topping,
+                        has_medium=True, price_medium=price, has_large=True, price_large=price + 10,
+                    )
+                    # bulk_create 不會呼叫 save()，需自行設定
+                    drink.min_price = drink.calculate_min_price()
+                    drinks.append(drink)
+            OpeningPeriod.objects.bulk_create(periods, batch_size=batch)
+            Drink.objects.bulk_create(drinks, batch_size=batch)
+
+    def baseline(self, keyword, lat, lng, radius):
+        """改寫前的做法：逐店計算距離，再查飲料並在 Python 中依價格排序"""
+        shop_distance = {}
+        for shop in TeaShop.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+            distance = calculate_distance(lat, lng, float(shop.latitude), float(shop.longitude))
+            if distance <= radius:
+                shop_distance[shop.id] = distance
+
+        drinks = Drink.objects.select_related('tea_shop').filter(keyword_q(keyword), tea_shop_id__in=list(shop_distance))
+        drinks = [d for d in drinks if d.min_price is not None]
+        drinks.sort(key=lambda d: (d.min_price, shop_distance[d.tea_shop_id], d.id))
+        return drinks[:10]
+
+    def measure(self, points, query):
+        latencies = []
+        rows = []
+        for lat, lng in points:
+            start = time.perf_counter()
+            result = query(lat, lng)
+            latencies.append(time.perf_counter() - start)
+            rows.append(len(result))
+        latencies.sort()
+        return {
+            'count': len(latencies),
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95)],
+            'rows': statistics.mean(rows),
+        }
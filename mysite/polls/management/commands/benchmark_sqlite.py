@@ -0,0 +1,167 @@
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from polls.models import Drink
+
+
+class Command(BaseCommand):
+    help = '比較 SQLite 預設設定與 production 設定在「匯入寫入 + 多執行緒讀取」下的吞吐量'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=8,
+            help='讀取執行緒數量 (預設: 8)'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='每種設定的測試秒數 (預設: 10)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='寫入端每筆交易更新的飲料數 (預設: 50)'
+        )
+
+    def handle(self, *args, **options):
+        readers = options['readers']
+        duration = options['duration']
+        batch_size = options['batch_size']
+
+        # 讀取端：與 recommended_drinks 預設查詢相同的 SQL
+        queryset = Drink.objects.select_related('tea_shop').filter(tea_shop__rating__gte=4.0)
+        sql, params = queryset.query.sql_with_params()
+        read_sql = sql.replace('%s', '?')
+
+        source = str(settings.DATABASES['default']['NAME'])
+        # 關閉目前連線，確保複製到的是完整檔案
+        connection.close()
+
+        self.stdout.write(f'讀取執行緒: {readers}, 每種設定 {duration} 秒, 寫入批次: {batch_size} 筆')
+        self.stdout.write('-' * 80)
+
+        results = {}
+        for profile in ('default', 'production'):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                db_path = os.path.join(tmp_dir, 'bench.sqlite3')
+                shutil.copyfile(source, db_path)
+                results[profile] = self.run_profile(
+                    profile, db_path, read_sql, params, readers, duration, batch_size
+                )
+            self.print_result(profile, results[profile])
+
+        before = results['default']
+        after = results['production']
+        if before['reads']:
+            self.stdout.write('-' * 80)
+            self.stdout.write(self.style.SUCCESS(
+                f'讀取吞吐量: {before["reads_per_sec"]:.1f} → {after["reads_per_sec"]:.1f} 次/秒 '
+                f'({after["reads_per_sec"] / before["reads_per_sec"]:.2f}x)'
+            ))
+
+    def connect(self, profile, db_path):
+        """依設定檔建立連線（與 settings.SQLITE_PROFILES 相同的 PRAGMA）"""
+        if profile == 'production':
+            conn = sqlite3.connect(db_path, timeout=settings.SQLITE_PRAGMAS['busy_timeout'] / 1000,
+                                   isolation_level=None, check_same_thread=False)
+            for key, value in settings.SQLITE_PRAGMAS.items():
+                conn.execute(f'PRAGMA {key}={value}')
+        else:
+            conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        return conn
+
+    def run_profile(self, profile, db_path, read_sql, params, readers, duration, batch_size):
+        # 先切換 journal mode（會寫入檔案標頭，之後的連線沿用）
+        conn = self.connect(profile, db_path)
+        if profile == 'default':
+            conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {'reads': 0, 'read_errors': 0, 'latencies': [], 'writes': 0, 'write_errors': 0}
+
+        def reader():
+            persistent = self.connect(profile, db_path) if profile == 'production' else None
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    # default 設定模擬每個請求重新開檔；production 使用持久連線
+                    conn = persistent or self.connect(profile, db_path)
+                    conn.execute(read_sql, params).fetchall()
+                    if persistent is None:
+                        conn.close()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        result['reads'] += 1
+                        result['latencies'].append(elapsed)
+                except sqlite3.OperationalError:
+                    with lock:
+                        result['read_errors'] += 1
+            if persistent is not None:
+                persistent.close()
+
+        def writer():
+            # 模擬 import_drinks：逐筆更新飲料資料並分批提交
+            conn = self.connect(profile, db_path)
+            drink_ids = [row[0] for row in conn.execute('SELECT id FROM polls_drink')]
+            position = 0
+            while not stop.is_set() and drink_ids:
+                batch = drink_ids[position:position + batch_size] or drink_ids[:batch_size]
+                position = (position + batch_size) % len(drink_ids)
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    for drink_id in batch:
+                        conn.execute(
+                            'UPDATE polls_drink SET description = ? WHERE id = ?',
+                            (f'bench {time.time()}', drink_id)
+                        )
+                    conn.execute('COMMIT')
+                    with lock:
+                        result['writes'] += len(batch)
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    with lock:
+                        result['write_errors'] += 1
+            conn.close()
+
+        threads = [threading.Thread(target=writer)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(result['latencies'])
+        result['reads_per_sec'] = result['reads'] / elapsed
+        result['writes_per_sec'] = result['writes'] / elapsed
+        result['p50'] = statistics.median(latencies) if latencies else 0
+        result['p95'] = latencies[int(len(latencies) * 0.95)] if latencies else 0
+        return result
+
+    def print_result(self, profile, result):
+        self.stdout.write(self.style.SUCCESS(f'[{profile}]'))
+        self.stdout.write(f'  讀取: {result["reads"]} 次 ({result["reads_per_sec"]:.1f} 次/秒), '
+                          f'p50 {result["p50"] * 1000:.1f}ms, p95 {result["p95"] * 1000:.1f}ms')
+        self.stdout.write(f'  寫入: {result["writes"]} 筆 ({result["writes_per_sec"]:.1f} 筆/秒)')
+        if result['read_errors'] or result['write_errors']:
+            self.stdout.write(self.style.ERROR(
+                f'  database is locked: 讀取 {result["read_errors"]} 次, 寫入 {result["write_errors"]} 次'
+            ))
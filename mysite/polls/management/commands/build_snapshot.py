@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polls import snapshot
+
+
+class Command(BaseCommand):
+    help = '產生各 worker 以 mmap 共用的二進位目錄快照（內容未變時不改寫）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=str,
+            help='快照檔路徑（預設: settings.CATALOG_SNAPSHOT_PATH）'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.CATALOG_SNAPSHOT_PATH
+        version, written = snapshot.build(path)
+        if written:
+            self.stdout.write(self.style.SUCCESS(f'目錄快照已更新: {path}（版本 {version}）'))
+        else:
+            self.stdout.write(f'目錄快照未變動（版本 {version}）')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from polls import canonical, metrics
+
+
+class Command(BaseCommand):
+    help = '依名稱正規化（全形/半形、空白、同義詞）將各店飲料歸入跨店家的標準飲料'
+
+    def handle(self, *args, **kwargs):
+        stats = canonical.rebuild()
+        metrics.record_job('canonicalize_drinks', items={'assigned': stats['assigned']})
+        self.stdout.write(self.style.SUCCESS(
+            f'標準飲料更新完成! 共 {stats["groups"]} 種, 新增 {stats["created"]} 種, '
+            f'重新歸類 {stats["assigned"]} 杯, 移除 {stats["deleted"]} 種'
+        ))
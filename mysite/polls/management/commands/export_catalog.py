@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from polls import exporting
+
+
+class Command(BaseCommand):
+    help = '匯出店家、飲料或收藏（CSV 欄位與匯入檔相同，或 JSONL），逐筆串流輸出'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind',
+            choices=exporting.KINDS,
+            help='匯出的資料類型'
+        )
+        parser.add_argument(
+            '--format',
+            choices=exporting.FORMATS,
+            default='csv',
+            help='輸出格式 (預設: csv)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='輸出檔案路徑（預設輸出到 stdout）'
+        )
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        fmt = options['format']
+        output = options['output']
+
+        if not output:
+            for line in exporting.lines(kind, fmt):
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        try:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                for line in exporting.lines(kind, fmt):
+                    file.write(line)
+                    count += 1
+        except OSError as e:
+            raise CommandError(f'無法寫入 {output}: {e}')
+
+        if fmt == 'csv':
+            count -= 1  # 欄位名稱列
+        self.stdout.write(self.style.SUCCESS(f'已匯出 {count} 筆到 {output}'))
@@ -2,13 +2,17 @@ import csv
 import os
 import time
 import requests
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from polls import metrics
 
 
 class Command(BaseCommand):
     help = '根據奶茶尋_店家.csv抓取店家招牌照片'
 
+    # 由背景工作執行時傳入 progress(current, total=None, message='') 回報進度
+    stealth_options = ('progress',)
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--csv-path',
@@ -39,6 +43,7 @@ class Command(BaseCommand):
         api_key = options['api_key']
         delay = options['delay']
         skip_existing = options['skip_existing']
+        progress = options.get('progress')
 
         # 建立圖片儲存目錄
         # 使用專案根目錄下的 static/shop_images
@@ -54,8 +59,8 @@ class Command(BaseCommand):
             csv_path = os.path.join(base_dir, csv_path)
 
         if not os.path.exists(csv_path):
-            self.stdout.write(self.style.ERROR(f'找不到CSV檔案: {csv_path}'))
-            return
+            metrics.record_job('get_shop_images', 'failure')
+            raise CommandError(f'找不到CSV檔案: {csv_path}')
 
         # 統計資訊
         total = 0
@@ -74,6 +79,8 @@ class Command(BaseCommand):
                 total += 1
                 place_id = row['place_id']
                 shop_name = row['name']
+                if progress:
+                    progress(total, message=f'{shop_name} ({place_id})')
 
                 # 檢查檔案是否已存在
                 jpg_path = os.path.join(images_dir, f'{place_id}.jpg')
@@ -125,6 +132,12 @@ class Command(BaseCommand):
                 # 延遲以避免超過API請求限制
                 time.sleep(delay)
 
+        metrics.record_job('get_shop_images', items={
+            'downloaded': success,
+            'skipped': skipped,
+            'failed': failed,
+        })
+
         # 顯示統計資訊
         self.stdout.write('-' * 80)
         self.stdout.write(self.style.SUCCESS('處理完成！'))
@@ -1,12 +1,16 @@
-import csv
-from decimal import Decimal, InvalidOperation
-from django.core.management.base import BaseCommand
+import os
+
+from django.core.management.base import BaseCommand, CommandError
 from polls.models import TeaShop, Drink
+from polls import canonical, catalog, drink_csv, favorites, importing, menu_stats, metrics, ranking, snapshot
 
 
 class Command(BaseCommand):
     help = '從 CSV 檔案匯入飲料資料，支援新增與更新'
 
+    # 由背景工作執行時傳入 progress(current, total=None, message='') 回報進度
+    stealth_options = ('progress',)
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--clear',
@@ -24,200 +28,254 @@ class Command(BaseCommand):
             action='store_true',
             help='模擬執行，不實際寫入資料庫'
         )
+        parser.add_argument(
+            '--staged',
+            action='store_true',
+            help='先寫入暫存表並比對差異，再以單一交易合併（匯入期間讀取端看到的仍是完整的舊菜單）；'
+                 '搭配 --clear 時改為刪除 CSV 中已不存在的飲料'
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='刪除 CSV 中已不存在的飲料（連帶刪除其收藏）'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='CSV 內容與上次匯入相同時仍重新比對匯入'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='平行驗證 CSV 的行程數，1 表示不使用 process pool（預設: CPU 核心數）'
+        )
+        parser.add_argument(
+            '--error-report',
+            type=str,
+            help='將所有有問題的列（行號、欄位、原始值、原因）寫入此 CSV 檔'
+        )
+
 
     def handle(self, *args, **options):
         csv_path = options['csv_path']
         clear = options['clear']
         dry_run = options['dry_run']
+        progress = options.get('progress')
 
         if dry_run:
             self.stdout.write(self.style.WARNING('--- 乾跑模式：不會實際寫入資料庫 ---'))
 
-        # 清空現有資料（選擇性）
-        if clear and not dry_run:
-            Drink.objects.all().delete()
-            self.stdout.write(self.style.WARNING('已清空現有飲料資料'))
+        # 整個檔案與上次成功匯入的內容相同時直接略過
+        try:
+            file_hash, file_size = importing.file_digest(csv_path)
+        except FileNotFoundError:
+            if not dry_run:
+                metrics.record_job('import_drinks', 'failure')
+            raise CommandError(f'找不到 CSV 檔案: {csv_path}')
+        if not (options['force'] or clear) and importing.is_imported('drinks', csv_path, file_hash):
+            self.stdout.write(self.style.SUCCESS('CSV 內容與上次匯入相同，略過匯入（--force 可強制重新匯入）'))
+            if not dry_run:
+                metrics.record_job('import_drinks', 'skipped')
+            return
+
+        shop_ids = dict(TeaShop.objects.values_list('name', 'id'))
+        self.stdout.write(f'已載入 {len(shop_ids)} 家店家')
+
+        # 1. 解析驗證整個檔案（寫入資料庫前），有 error 的列略過、warning 的欄位視為未填
+        try:
+            records, issues, row_count = drink_csv.validate(
+                csv_path, shop_ids, workers=max(options['workers'], 1), progress=progress
+            )
+        except Exception as e:
+            if not dry_run:
+                metrics.record_job('import_drinks', 'failure')
+            raise CommandError(f'讀取 CSV 時發生錯誤: {str(e)}')
+        self.stdout.write(f'CSV 共 {row_count} 筆，有效資料 {len(records)} 筆')
 
-        # 建立店家快取
-        self.shop_cache = {shop.name: shop for shop in TeaShop.objects.all()}
-        self.stdout.write(f'已載入 {len(self.shop_cache)} 家店家')
+        if options['error_report']:
+            drink_csv.write_error_report(options['error_report'], issues)
+            self.stdout.write(f'錯誤報告已寫入: {options["error_report"]}（{len(issues)} 筆）')
 
-        # 統計資訊
         stats = {
             'created': 0,
             'updated': 0,
             'skipped': 0,
-            'shop_not_found': [],
-            'errors': []
+            'deleted': 0,
+            'shop_not_found': [
+                f'店家不存在: {issue.value.strip()}' for issue in issues if issue.reason == '店家不存在'
+            ],
+            'errors': [
+                f'第 {issue.row} 行 {issue.column}: {issue.reason}'
+                for issue in issues if issue.level == 'error' and issue.reason != '店家不存在'
+            ],
+            'warnings': [
+                f'第 {issue.row} 行 {issue.column}「{issue.value}」: {issue.reason}'
+                for issue in issues if issue.level == 'warning'
+            ],
         }
 
-        try:
-            with open(csv_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-
-                for row_num, row in enumerate(reader, start=2):
-                    try:
-                        result = self.process_drink_row(row, dry_run)
-                        if result['status'] == 'created':
-                            stats['created'] += 1
-                        elif result['status'] == 'updated':
-                            stats['updated'] += 1
-                        elif result['status'] == 'skipped':
-                            stats['skipped'] += 1
-                        elif result['status'] == 'shop_not_found':
-                            stats['shop_not_found'].append(result['detail'])
-                    except Exception as e:
-                        error_msg = f'第 {row_num} 行: {str(e)}'
-                        stats['errors'].append(error_msg)
-                        self.stdout.write(self.style.ERROR(f'錯誤 - {error_msg}'))
+        # 2. 寫入
+        if options['staged']:
+            prune = clear or options['prune']
+            derived = self.write_staged(records, prune, dry_run, stats)
+        else:
+            prune = options['prune']
+            derived = self.write_rows(records, clear, prune, dry_run, stats, progress)
 
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f'找不到 CSV 檔案: {csv_path}'))
-            return
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'讀取 CSV 時發生錯誤: {str(e)}'))
-            return
+        if not dry_run:
+            metrics.record_job('import_drinks', items={
+                'created': stats['created'],
+                'updated': stats['updated'],
+                'skipped': stats['skipped'],
+                'deleted': stats['deleted'],
+                'shop_not_found': len(stats['shop_not_found']),
+                'error': len(stats['errors']),
+            })
+            # 有列寫入失敗時不記錄，下次匯入同一個檔案會重試那些列
+            if not stats['errors']:
+                importing.record_file('drinks', csv_path, file_hash, file_size, row_count=row_count)
 
         # 顯示統計報告
         self.stdout.write('\n' + '=' * 50)
-        self.stdout.write(self.style.SUCCESS('匯入完成統計:'))
+        self.stdout.write(self.style.SUCCESS('匯入完成統計:' if not dry_run else '預計變更:'))
         self.stdout.write(f'  新增: {stats["created"]} 筆')
         self.stdout.write(f'  更新: {stats["updated"]} 筆')
         self.stdout.write(f'  跳過(無變更): {stats["skipped"]} 筆')
+        if prune:
+            self.stdout.write(self.style.WARNING(f'  刪除(CSV 中已不存在): {stats["deleted"]} 筆'))
 
         if stats['shop_not_found']:
             self.stdout.write(self.style.WARNING(f'  店家不存在: {len(stats["shop_not_found"])} 筆'))
             for detail in stats['shop_not_found']:  # 顯示全部
                 self.stdout.write(f'    - {detail}')
 
-        if stats['errors']:
-            self.stdout.write(self.style.ERROR(f'  錯誤: {len(stats["errors"])} 筆'))
-            for error in stats['errors'][:5]:  # 只顯示前 5 筆
-                self.stdout.write(f'    - {error}')
-            if len(stats['errors']) > 5:
-                self.stdout.write(f'    ... 還有 {len(stats["errors"]) - 5} 筆')
+        for key, label, style in (
+            ('errors', '錯誤', self.style.ERROR),
+            ('warnings', '警告(該欄位視為未填)', self.style.WARNING),
+        ):
+            if stats[key]:
+                self.stdout.write(style(f'  {label}: {len(stats[key])} 筆'))
+                for message in stats[key][:5]:  # 只顯示前 5 筆
+                    self.stdout.write(f'    - {message}')
+                if len(stats[key]) > 5:
+                    hint = '' if options['error_report'] else '（--error-report 可輸出完整清單）'
+                    self.stdout.write(f'    ... 還有 {len(stats[key]) - 5} 筆{hint}')
 
         self.stdout.write('=' * 50)
 
-    def process_drink_row(self, row, dry_run=False):
-        """處理單筆飲料資料"""
-        # 1. 查詢店家
-        shop_name = row['所屬店家'].strip()
-        tea_shop = self.shop_cache.get(shop_name)
+        if derived:
+            self.stdout.write(f'店家菜單統計: 更新 {derived["shops_updated"]} 家')
+            self.stdout.write(
+                f'推薦排名: 新增 {derived["ranking"]["created"]} 筆, 更新 {derived["ranking"]["updated"]} 筆'
+            )
+            self.stdout.write(
+                f'標準飲料: 共 {derived["canonical"]["groups"]} 種, 重新歸類 {derived["canonical"]["assigned"]} 杯'
+            )
+            built = snapshot.refresh()
+            if built:
+                self.stdout.write(f'目錄快照: 版本 {built[0]}' + ('' if built[1] else '（未變動）'))
 
-        if not tea_shop:
-            return {
-                'status': 'shop_not_found',
-                'detail': f'店家不存在: {shop_name}'
-            }
+    def write_rows(self, records, clear, prune, dry_run, stats, progress=None):
+        """逐筆寫入，依內容指紋略過未變更的飲料；回傳重算結果（沒有異動時為 None）"""
+        # 清空現有資料（選擇性）；連帶的菜單統計與目錄快照於匯入後統一重算，
+        # 連帶刪除的收藏屬於被刪除的飲料，不必逐筆扣回收藏人數
+        if clear and not dry_run:
+            importing.forget('drinks')
+            with menu_stats.deferred(), favorites.deferred():
+                Drink.objects.all().delete()
+            self.stdout.write(self.style.WARNING('已清空現有飲料資料'))
 
-        # 2. 解析所有欄位
-        drink_data = {
-            'name': row['飲料名稱'].strip(),
-            'description': row['描述'].strip() if row['描述'].strip() else None,
-            'milk_type': self.parse_milk_type(row['奶類']),
-            'tea_type': self.parse_tea_type(row['茶類']),
-            'topping': self.parse_topping(row['配料']),
-            'has_medium': self.parse_boolean(row['中杯']),
-            'price_medium': self.parse_price(row['中杯價格']),
-            'has_large': self.parse_boolean(row['大杯']),
-            'price_large': self.parse_price(row['大杯價格']),
+        # 現有飲料的內容指紋：(店家, 名稱) -> (id, 指紋)，未變更的列不必查詢資料庫
+        self.existing = {
+            (shop_id, name): (drink_id, fingerprint)
+            for drink_id, shop_id, name, fingerprint in Drink.objects.values_list(
+                'id', 'tea_shop_id', 'name', 'fingerprint'
+            ).iterator(chunk_size=5000)
         }
+        seen = set()
 
-        # 3. 查詢是否已存在
-        try:
-            existing_drink = Drink.objects.get(
-                tea_shop=tea_shop,
-                name=drink_data['name']
-            )
+        # 逐筆寫入期間暫停店家菜單統計的更新，匯入後再批次重算
+        with menu_stats.deferred():
+            for index, (row_num, shop_id, drink_data) in enumerate(records, start=1):
+                if progress:
+                    progress(index, len(records), message=f'已寫入 {index} 筆')
+                seen.add((shop_id, drink_data['name']))
+                try:
+                    stats[self.process_drink_row(shop_id, drink_data, dry_run)] += 1
+                except Exception as e:
+                    error_msg = f'第 {row_num} 行: {str(e)}'
+                    stats['errors'].append(error_msg)
+                    self.stdout.write(self.style.ERROR(f'錯誤 - {error_msg}'))
 
-            # 4. 檢查是否需要更新
-            needs_update = False
-            for field, new_value in drink_data.items():
-                if field == 'name':  # Skip name (already matched)
-                    continue
-                old_value = getattr(existing_drink, field)
-
-                # 比較值時處理 Decimal 和 None
-                if isinstance(old_value, Decimal) and isinstance(new_value, Decimal):
-                    if old_value != new_value:
-                        needs_update = True
-                        break
-                elif old_value != new_value:
-                    needs_update = True
-                    break
-
-            if needs_update:
+            # 刪除 CSV 中已不存在的飲料
+            if prune and seen:
+                vanished = [drink_id for key, (drink_id, _) in self.existing.items() if key not in seen]
+                stats['deleted'] = len(vanished)
                 if not dry_run:
-                    for field, value in drink_data.items():
-                        setattr(existing_drink, field, value)
-                    existing_drink.save()
-                return {
-                    'status': 'updated',
-                    'detail': f'{shop_name} - {drink_data["name"]}'
-                }
-            else:
-                return {
-                    'status': 'skipped',
-                    'detail': f'{shop_name} - {drink_data["name"]}'
-                }
+                    for offset in range(0, len(vanished), importing.BATCH_SIZE):
+                        Drink.objects.filter(pk__in=vanished[offset:offset + importing.BATCH_SIZE]).delete()
 
-        except Drink.DoesNotExist:
-            # 5. 建立新飲料
-            if not dry_run:
-                Drink.objects.create(tea_shop=tea_shop, **drink_data)
-            return {
-                'status': 'created',
-                'detail': f'{shop_name} - {drink_data["name"]}'
+        # 匯入後重算店家菜單統計、推薦排名與標準飲料（沒有任何異動時略過）
+        if dry_run or not (clear or stats['created'] or stats['updated'] or stats['deleted']):
+            return None
+        catalog.bump()
+        return {
+            'shops_updated': menu_stats.refresh(),
+            'ranking': ranking.rebuild(),
+            'canonical': canonical.rebuild(),
+        }
+
+    def write_staged(self, records, prune, dry_run, stats):
+        """分段匯入：依內容指紋比對 -> 差異寫入暫存表 -> 單一交易合併"""
+        # (店家, 名稱) -> (行號, 欄位)；同一店家同名的飲料以最後一列為準
+        rows = {(shop_id, data['name']): (row_num, data) for row_num, shop_id, data in records}
+        if prune and not rows:
+            raise CommandError('CSV 沒有任何有效資料，為避免清空菜單已中止匯入')
+
+        if dry_run:
+            changes = importing.diff({key: data for key, (_, data) in rows.items()}, prune=prune)
+            result = {
+                'created': len(changes['created']),
+                'updated': len(changes['changed']),
+                'unchanged': changes['unchanged'],
+                'deleted': len(changes['removed']),
+                'ranking': None,
             }
+        else:
+            result = importing.publish(rows, prune=prune)
 
-    def parse_milk_type(self, value):
-        """解析奶類欄位"""
-        value = value.strip() if value else ''
-        if value == '奶精':
-            return 'creamer'
-        elif value == '鮮奶':
-            return 'fresh_milk'
-        return 'none'  # 預設為無奶類
-
-    def parse_boolean(self, value):
-        """解析有/無欄位"""
-        value = value.strip() if value else ''
-        return value == '有'
-
-    def parse_tea_type(self, value):
-        """解析茶類欄位"""
-        value = value.strip() if value else ''
-        mapping = {
-            '紅茶': 'black_tea',
-            '綠茶': 'green_tea',
-            '烏龍茶': 'oolong_tea',
-            '青茶': 'blue_tea',
-            '抹茶': 'matcha',
-            '鐵觀音': 'tieguanyin',
-            '麥茶': 'barley_tea',
-            '四季春': 'season',
-            '茉莉花茶': 'jasmine',
-            '普洱茶': 'pu_erh',
-            '其他': 'other',
-        }
-        return mapping.get(value, None)
-
-    def parse_topping(self, value):
-        """解析配料欄位"""
-        value = value.strip() if value else ''
-        if value == '有':
-            return 'yes'
-        elif value == '無':
-            return 'no'
-        return None
-
-    def parse_price(self, value):
-        """解析價格欄位"""
-        value = value.strip() if value else ''
-        if not value:
-            return None
-        try:
-            return Decimal(value)
-        except (InvalidOperation, ValueError):
-            return None
+        stats['created'] = result['created']
+        stats['updated'] = result['updated']
+        stats['skipped'] = result['unchanged']
+        stats['deleted'] = result['deleted']
+        return result if result['ranking'] is not None else None
+
+    def process_drink_row(self, shop_id, drink_data, dry_run=False):
+        """處理單筆已驗證的飲料資料，回傳 created / updated / skipped"""
+        # 以內容指紋判斷是否已存在、是否需要更新
+        key = (shop_id, drink_data['name'])
+        existing = self.existing.get(key)
+        new_fingerprint = importing.fingerprint(drink_data)
+
+        if existing is None:
+            # 建立新飲料
+            if not dry_run:
+                drink = Drink.objects.create(tea_shop_id=shop_id, **drink_data)
+                self.existing[key] = (drink.id, drink.fingerprint)
+            else:
+                self.existing[key] = (None, new_fingerprint)
+            return 'created'
+
+        drink_id, fingerprint = existing
+        if fingerprint == new_fingerprint:
+            return 'skipped'
+
+        # 內容有變動才讀取並更新
+        if not dry_run:
+            drink = Drink.objects.get(pk=drink_id)
+            for field, value in drink_data.items():
+                setattr(drink, field, value)
+            drink.save()
+        self.existing[key] = (drink_id, new_fingerprint)
+        return 'updated'
@@ -1,25 +1,36 @@
 import csv
 from django.core.management.base import BaseCommand
 from polls.models import TeaShop
+from polls import catalog, favorites, importing, menu_stats, metrics, ranking, snapshot
 
 
 class Command(BaseCommand):
     help = '從 CSV 檔案匯入奶茶店資料'
 
+    # 由背景工作執行時傳入 progress(current, total=None, message='') 回報進度
+    stealth_options = ('progress',)
+
     def handle(self, *args, **kwargs):
+        progress = kwargs.get('progress')
         csv_path = r"C:\Users\love7\OneDrive\桌面\angus'\djagggg\奶茶尋_店家.csv"
 
-        # 清空現有資料（可選）
-        TeaShop.objects.all().delete()
+        # 清空現有資料（可選）；連帶刪除的飲料不需逐筆重算菜單統計，連帶刪除的收藏也不必逐筆扣回收藏人數
+        with menu_stats.deferred(), favorites.deferred():
+            TeaShop.objects.all().delete()
+        # 飲料隨店家一併刪除，下次匯入飲料不可因檔案未變更而略過
+        importing.forget('drinks')
         self.stdout.write(self.style.WARNING('已清空現有資料'))
 
         success_count = 0
         error_count = 0
 
-        with open(csv_path, 'r', encoding='utf-8') as file:
+        # 逐筆建立期間不排入目錄快照重建，匯入後再重建一次
+        with menu_stats.deferred(), open(csv_path, 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
 
-            for row in reader:
+            for row_num, row in enumerate(reader, start=1):
+                if progress:
+                    progress(row_num, message=f'已處理 {row_num} 家')
                 try:
                     # 處理空值的電話欄位
                     phone = row['phone'].strip() if row['phone'] else None
@@ -41,6 +52,16 @@ class Command(BaseCommand):
                         self.style.ERROR(f'匯入失敗: {row["name"]} - {str(e)}')
                     )
 
+        metrics.record_job('import_teashops', items={
+            'created': success_count,
+            'error': error_count,
+        })
+
         self.stdout.write(
             self.style.SUCCESS(f'匯入完成! 成功: {success_count}, 失敗: {error_count}')
         )
+
+        # 店家評分會影響推薦排名
+        catalog.bump()
+        ranking.rebuild()
+        snapshot.refresh()
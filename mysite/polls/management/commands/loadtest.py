@@ -0,0 +1,178 @@
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        '對執行中的伺服器發送並行請求，比較 WSGI 與 ASGI 的吞吐量。'
+        '例如先以 `manage.py runserver 8000`（WSGI）與 '
+        '`uvicorn mysite.asgi:application --port 8001`（ASGI）啟動，再用 '
+        '--base-url http://127.0.0.1:8000 --base-url http://127.0.0.1:8001 比較。'
+        '伺服器的限流（settings.RATE_LIMITS）會以 429 拒絕超過額度的請求，'
+        '比較吞吐量時請以 DJANGO_RATE_LIMIT=0 啟動伺服器關閉限流'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            action='append',
+            required=True,
+            help='伺服器網址，可指定多次以互相比較'
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            help='要測試的路徑，可指定多次 (預設: /nearby/?lat=25.0216&lng=121.5280 與 /favorites/check/?type=shop&id=1)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=20,
+            help='並行請求數 (預設: 20)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='每個路徑的總請求數 (預設: 500)'
+        )
+        parser.add_argument(
+            '--username',
+            type=str,
+            help='登入帳號（測試收藏相關端點時需要）'
+        )
+        parser.add_argument(
+            '--password',
+            type=str,
+            help='登入密碼'
+        )
+
+    def handle(self, *args, **options):
+        paths = options['path'] or [
+            '/nearby/?lat=25.0216&lng=121.5280',
+            '/favorites/check/?type=shop&id=1',
+        ]
+        concurrency = options['concurrency']
+        total_requests = options['requests']
+
+        results = {}
+        rate_limited = False
+        for base_url in options['base_url']:
+            base_url = base_url.rstrip('/')
+            cookie = ''
+            if options['username']:
+                cookie = self.login(base_url, options['username'], options['password'] or '')
+                if not cookie:
+                    self.stdout.write(self.style.ERROR(f'{base_url}: 登入失敗'))
+                    continue
+
+            self.stdout.write(self.style.SUCCESS(f'[{base_url}]'))
+            for path in paths:
+                result = self.run(base_url + path, cookie, concurrency, total_requests)
+                results[(base_url, path)] = result
+                rate_limited = rate_limited or result['rate_limited']
+                self.stdout.write(
+                    f'  {path}: {result["rps"]:.1f} req/s, '
+                    f'p50 {result["p50"] * 1000:.1f}ms, p95 {result["p95"] * 1000:.1f}ms, '
+                    f'失敗 {result["errors"]}, 限流 (429) {result["rate_limited"]}'
+                )
+
+        if rate_limited:
+            self.stdout.write(self.style.WARNING(
+                '有請求被伺服器限流（429），req/s 與延遲只計算成功的請求，無法代表實際處理能力；'
+                '請以 DJANGO_RATE_LIMIT=0 重新啟動伺服器後再測'
+            ))
+
+        # 與第一個伺服器比較
+        base_urls = [url.rstrip('/') for url in options['base_url']]
+        if len(base_urls) > 1:
+            self.stdout.write('-' * 80)
+            baseline = base_urls[0]
+            for other in base_urls[1:]:
+                for path in paths:
+                    before = results.get((baseline, path))
+                    after = results.get((other, path))
+                    if before and after and before['rps']:
+                        self.stdout.write(
+                            f'{path}: {other} 為 {baseline} 的 {after["rps"] / before["rps"]:.2f}x'
+                        )
+
+    def login(self, base_url, username, password):
+        """透過登入頁面取得 session cookie"""
+        jar = CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        login_url = f'{base_url}/login/'
+        opener.open(login_url).read()
+        csrf_token = next((c.value for c in jar if c.name == 'csrftoken'), '')
+
+        data = urllib.parse.urlencode({
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': csrf_token,
+        }).encode()
+        request = urllib.request.Request(login_url, data=data, headers={'Referer': login_url})
+        opener.open(request).read()
+
+        cookies = {c.name: c.value for c in jar}
+        if 'sessionid' not in cookies:
+            return ''
+        return '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+    def run(self, url, cookie, concurrency, total_requests):
+        """以固定並行數送出請求，回傳吞吐量與延遲統計"""
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+        rate_limited = 0
+        remaining = total_requests
+
+        def worker():
+            nonlocal remaining, errors, rate_limited
+            while True:
+                with lock:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                request = urllib.request.Request(url, headers={'Cookie': cookie} if cookie else {})
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                except urllib.error.HTTPError as e:
+                    e.close()
+                    # 被限流的請求另外計算，不列入失敗與延遲
+                    with lock:
+                        if e.code == 429:
+                            rate_limited += 1
+                        else:
+                            errors += 1
+                except (urllib.error.URLError, OSError):
+                    with lock:
+                        errors += 1
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'rps': len(latencies) / elapsed if elapsed else 0,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+            'errors': errors,
+            'rate_limited': rate_limited,
+        }
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from polls import ranking
+
+
+class Command(BaseCommand):
+    help = '重新計算飲料推薦排名（只寫入有變動的飲料）'
+
+    def handle(self, *args, **kwargs):
+        stats = ranking.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'推薦排名更新完成! 新增: {stats["created"]}, '
+            f'更新: {stats["updated"]}, 未變動: {stats["unchanged"]}'
+        ))
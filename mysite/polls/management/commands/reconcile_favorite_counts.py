@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from polls import favorites
+from polls.models import TeaShop, Drink
+
+
+class Command(BaseCommand):
+    help = '依收藏紀錄批次修正店家與飲料的收藏人數'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只列出有誤差的筆數，不實際寫入資料庫'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        for model, field, label in ((TeaShop, 'tea_shop', '店家'), (Drink, 'drink', '飲料')):
+            actual = favorites.actual_count(field)
+
+            drifted = model.objects.annotate(actual=actual).exclude(favorite_count=F('actual'))
+            drift_count = drifted.count()
+
+            if drift_count and not dry_run:
+                # 以單一 UPDATE 修正所有誤差
+                with transaction.atomic():
+                    model.objects.filter(pk__in=drifted.values('pk')).update(favorite_count=actual)
+
+            style = self.style.WARNING if drift_count else self.style.SUCCESS
+            self.stdout.write(style(f'{label}: {drift_count} 筆收藏人數有誤差' + ('' if dry_run or not drift_count else '，已修正')))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from polls import menu_stats
+
+
+class Command(BaseCommand):
+    help = '批次重算所有店家的菜單統計（品項數、價格範圍、茶類、鮮奶/配料）'
+
+    def handle(self, *args, **kwargs):
+        updated = menu_stats.refresh()
+        self.stdout.write(self.style.SUCCESS(f'菜單統計更新完成! 更新 {updated} 家店家'))
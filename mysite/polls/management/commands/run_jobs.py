@@ -0,0 +1,86 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from polls import jobs
+
+
+class Command(BaseCommand):
+    help = '執行背景工作佇列（匯入、抓圖、重建排名/統計/推薦）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='worker 行程數；各類工作同時執行的數量另受 JOB_CONCURRENCY 限制 (預設: 1)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='佇列中沒有可執行的工作時即結束（適合排程呼叫）'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='佇列為空時等待的秒數 (預設: 5)'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            self.work(options['once'], options['poll_interval'])
+            return
+
+        # 子行程不能沿用父行程的資料庫連線
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=self.work, args=(options['once'], options['poll_interval']))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+
+    def work(self, once, poll_interval):
+        """單一 worker：重新排入中止的工作、取得工作並執行，直到佇列為空（--once）或被中斷"""
+        worker = jobs.worker_name()
+        self.stdout.write(f'worker {worker} 開始')
+        try:
+            while True:
+                try:
+                    requeued = jobs.requeue_stale()
+                    job = jobs.claim(worker)
+                except OperationalError as exc:
+                    # 其他行程持有寫入鎖超過 busy timeout（例如大量匯入），稍後再試
+                    self.stderr.write(self.style.WARNING(f'[{worker}] 無法取得工作，稍後重試: {exc}'))
+                    time.sleep(poll_interval)
+                    continue
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'重新排入 {requeued} 個中止的工作'))
+
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f'[{worker}] 開始工作 #{job.pk} {job.kind} {" ".join(job.arguments)}')
+                started = time.perf_counter()
+                status = jobs.run(job)
+                style = self.style.SUCCESS if status == 'succeeded' else self.style.ERROR
+                self.stdout.write(style(
+                    f'[{worker}] 工作 #{job.pk} {job.kind}: {status} ({time.perf_counter() - started:.1f} 秒)'
+                ))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connections.close_all()
+        self.stdout.write(f'worker {worker} 結束')
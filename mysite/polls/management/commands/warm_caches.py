@@ -0,0 +1,175 @@
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+
+from polls import canonical, images, metrics, opening_hours, ranking, snapshot, warmup
+from polls.cache import get_cache
+from polls.models import Drink, DrinkRanking, OpeningPeriod, TeaShop
+
+
+class Command(BaseCommand):
+    help = '部署後預熱：重建缺少的衍生資料，並依最近的請求統計預先計算最常見的查詢（有時間上限）'
+
+    # 由背景工作執行時傳入 progress(current, total=None, message='') 回報進度
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=float,
+            default=settings.WARM_CACHES_BUDGET,
+            help=f'時間上限，秒 (預設: {settings.WARM_CACHES_BUDGET})'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=settings.WARM_CACHES_TOP,
+            help=f'預熱最常被請求的前幾個參數組合 (預設: {settings.WARM_CACHES_TOP})'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.WARM_CACHES_DAYS,
+            help=f'參考最近幾天的請求統計 (預設: {settings.WARM_CACHES_DAYS})'
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            help='改以 HTTP 請求預熱執行中的伺服器（例如 http://127.0.0.1:8000），用於各 worker 各自的快取'
+        )
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help='只預熱查詢，不檢查衍生資料'
+        )
+
+    def handle(self, *args, **options):
+        budget = options['budget']
+        top = options['top']
+        days = options['days']
+        base_url = (options['base_url'] or '').rstrip('/')
+        progress = options.get('progress')
+
+        if budget <= 0 or top < 0 or days <= 0:
+            raise CommandError('--budget、--days 需大於 0，--top 不可小於 0')
+        if not base_url and isinstance(get_cache(), LocMemCache):
+            self.stdout.write(self.style.WARNING(
+                '快取後端為 LocMemCache：只會填入此行程的快取，請改用共用的快取後端或 --base-url'
+            ))
+
+        deadline = time.monotonic() + budget
+        counts = {'derived': 0, 'warmed': 0, 'skipped': 0, 'failed': 0}
+
+        if not options['skip_derived']:
+            self.stdout.write('衍生資料:')
+            for name, step in self.derived_steps():
+                if time.monotonic() >= deadline:
+                    self.stdout.write(self.style.WARNING(f'  {name}: 已超過時間上限，略過'))
+                    counts['skipped'] += 1
+                    continue
+                started = time.perf_counter()
+                result = step()
+                elapsed = (time.perf_counter() - started) * 1000
+                self.stdout.write(f'  {name}: {result} ({elapsed:.0f} ms)')
+                counts['derived'] += 1
+
+        combinations = [
+            (view, params) for view, params, _ in metrics.top_accesses(list(warmup.VIEW_PARAMS), days, top)
+        ] if top else []
+        if not combinations and top:
+            self.stdout.write('沒有請求統計，預熱各頁面的預設查詢')
+            combinations = warmup.default_combinations()
+
+        self.stdout.write(f'查詢組合（{len(combinations)} 個）:')
+        for index, (view, params) in enumerate(combinations, 1):
+            label = f'{view} [{warmup.describe(params)}]'
+            if time.monotonic() >= deadline:
+                self.stdout.write(self.style.WARNING(
+                    f'  已超過時間上限 {budget:g} 秒，略過其餘 {len(combinations) - index + 1} 個組合'
+                ))
+                counts['skipped'] += len(combinations) - index + 1
+                break
+            if progress:
+                progress(index, len(combinations), label)
+
+            started = time.perf_counter()
+            try:
+                if base_url:
+                    warmed = self.fetch(base_url, view, params, deadline)
+                else:
+                    warmed = warmup.warm(view, params)
+            except (urllib.error.URLError, OSError) as e:
+                self.stdout.write(self.style.ERROR(f'  {label}: 失敗 ({e})'))
+                counts['failed'] += 1
+                continue
+            elapsed = (time.perf_counter() - started) * 1000
+            if warmed:
+                self.stdout.write(f'  {label}: {elapsed:.0f} ms')
+                counts['warmed'] += 1
+            else:
+                self.stdout.write(f'  {label}: 不使用快取，略過')
+                counts['skipped'] += 1
+
+        pruned = metrics.prune_accesses(days)
+        metrics.record_job('warm_caches', 'failure' if counts['failed'] else 'success', items=counts)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'預熱完成! 衍生資料: {counts["derived"]}, 查詢: {counts["warmed"]}, '
+            f'略過: {counts["skipped"]}, 失敗: {counts["failed"]}, 清除過期統計: {pruned}'
+        ))
+
+    def derived_steps(self):
+        """(名稱, 函式)；函式回傳報告用的說明"""
+        return [
+            ('營業時段', self.compile_opening_hours),
+            ('推薦排名', self.rebuild_rankings),
+            ('標準飲料', self.rebuild_canonical),
+            ('目錄快照', self.refresh_snapshot),
+            ('店家照片清單', lambda: f'{len(images.manifest())} 張照片'),
+        ]
+
+    def compile_opening_hours(self):
+        """編譯尚未有營業時段的店家（無營業時間資訊的店家本來就沒有時段）"""
+        shops = TeaShop.objects.exclude(opening_hours__isnull=True).exclude(opening_hours='').filter(
+            ~Exists(OpeningPeriod.objects.filter(tea_shop=OuterRef('pk')))
+        ).only('pk', 'opening_hours')
+        compiled = 0
+        for shop in shops:
+            if opening_hours.parse_periods(shop.opening_hours):
+                opening_hours.compile_shop(shop)
+                compiled += 1
+        return f'編譯 {compiled} 間店家' if compiled else '已是最新'
+
+    def rebuild_rankings(self):
+        if DrinkRanking.objects.count() == Drink.objects.count():
+            return '已是最新'
+        stats = ranking.rebuild()
+        return f'新增 {stats["created"]}, 更新 {stats["updated"]}'
+
+    def rebuild_canonical(self):
+        if not Drink.objects.filter(canonical__isnull=True).exists():
+            return '已是最新'
+        stats = canonical.rebuild()
+        return f'指派 {stats["assigned"]}, 新增 {stats["created"]}'
+
+    def refresh_snapshot(self):
+        result = snapshot.refresh()
+        if result is None:
+            return '未啟用'
+        version, written = result
+        return f'已更新（版本 {version}）' if written else f'未變動（版本 {version}）'
+
+    def fetch(self, base_url, view, params, deadline):
+        """以 HTTP 請求預熱（帶 WARMUP_HEADER，不列入請求統計）"""
+        url = f'{base_url}{reverse(view)}' + (f'?{params}' if params else '')
+        request = urllib.request.Request(url, headers={warmup.WARMUP_HEADER: '1'})
+        timeout = max(deadline - time.monotonic(), 1)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+        return True
@@ -0,0 +1,120 @@
+"""
+店家菜單統計（TeaShop.menu_* 欄位）
+
+單筆 Drink 異動時由 signals 呼叫 refresh([shop_id])；
+大量匯入時以 deferred() 暫停逐筆更新，結束後再呼叫 refresh() 批次重算。
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+
+
+MENU_FIELDS = [
+    'menu_drink_count', 'menu_min_price', 'menu_max_price', 'menu_tea_types',
+    'menu_has_fresh_milk', 'menu_has_topping', 'menu_min_fresh_milk_price',
+]
+
+_state = threading.local()
+
+
+@contextmanager
+def deferred():
+    """區塊內暫停逐筆更新（由呼叫端在結束後自行 refresh）"""
+    previous = getattr(_state, 'deferred', False)
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = previous
+
+
+def is_deferred():
+    return getattr(_state, 'deferred', False)
+
+
+def _valid_price(size):
+    """與 get_min_price 相同：有該杯型且價格大於 0 才計入"""
+    return Q(**{f'has_{size}': True, f'price_{size}__gt': 0})
+
+
+def _min_of(*values):
+    values = [v for v in values if v is not None]
+    return min(values) if values else None
+
+
+def _max_of(*values):
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+
+def refresh(shop_ids=None, shop_model=None, drink_model=None):
+    """
+    重算指定店家（預設為全部）的菜單統計
+
+    以 GROUP BY tea_shop 的單一彙總查詢取得所有數值，只更新有變動的店家。
+    shop_model / drink_model 供 migration 傳入歷史模型。
+    """
+    if shop_model is None or drink_model is None:
+        from .models import TeaShop, Drink
+        shop_model = shop_model or TeaShop
+        drink_model = drink_model or Drink
+
+    drinks = drink_model.objects.all()
+    shops = shop_model.objects.all()
+    if shop_ids is not None:
+        shop_ids = list(shop_ids)
+        drinks = drinks.filter(tea_shop_id__in=shop_ids)
+        shops = shops.filter(pk__in=shop_ids)
+
+    fresh_milk = Q(milk_type='fresh_milk')
+    aggregates = drinks.order_by().values('tea_shop_id').annotate(
+        drink_count=Count('id'),
+        min_medium=Min('price_medium', filter=_valid_price('medium')),
+        min_large=Min('price_large', filter=_valid_price('large')),
+        max_medium=Max('price_medium', filter=_valid_price('medium')),
+        max_large=Max('price_large', filter=_valid_price('large')),
+        fresh_milk_count=Count('id', filter=fresh_milk),
+        topping_count=Count('id', filter=Q(topping='yes')),
+        fresh_min_medium=Min('price_medium', filter=fresh_milk & _valid_price('medium')),
+        fresh_min_large=Min('price_large', filter=fresh_milk & _valid_price('large')),
+    )
+    stats = {row['tea_shop_id']: row for row in aggregates}
+
+    tea_types = {}
+    for shop_id, tea_type in drinks.order_by().filter(tea_type__isnull=False).values_list('tea_shop_id', 'tea_type').distinct():
+        tea_types.setdefault(shop_id, set()).add(tea_type)
+
+    changed = []
+    for shop in shops.only('pk', *MENU_FIELDS).iterator(chunk_size=2000):
+        row = stats.get(shop.pk)
+        if row:
+            values = {
+                'menu_drink_count': row['drink_count'],
+                'menu_min_price': _min_of(row['min_medium'], row['min_large']),
+                'menu_max_price': _max_of(row['max_medium'], row['max_large']),
+                'menu_tea_types': ','.join(sorted(tea_types.get(shop.pk, ()))),
+                'menu_has_fresh_milk': row['fresh_milk_count'] > 0,
+                'menu_has_topping': row['topping_count'] > 0,
+                'menu_min_fresh_milk_price': _min_of(row['fresh_min_medium'], row['fresh_min_large']),
+            }
+        else:
+            values = {
+                'menu_drink_count': 0,
+                'menu_min_price': None,
+                'menu_max_price': None,
+                'menu_tea_types': '',
+                'menu_has_fresh_milk': False,
+                'menu_has_topping': False,
+                'menu_min_fresh_milk_price': None,
+            }
+
+        if any(getattr(shop, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(shop, field, value)
+            changed.append(shop)
+
+    with transaction.atomic():
+        shop_model.objects.bulk_update(changed, MENU_FIELDS, batch_size=500)
+    return len(changed)
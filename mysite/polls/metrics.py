@@ -0,0 +1,296 @@
+"""
+Prometheus 文字格式的指標收集
+
+各 worker 行程把計數寫入同一個本機 SQLite 檔（settings.METRICS_DB），
+/metrics 讀取時即為所有行程的加總，不需要額外的收集服務。
+
+請求、快取與限流的計數先累加在行程記憶體中，每 METRICS_FLUSH_INTERVAL 秒
+（背景執行緒）或累積 METRICS_FLUSH_EVERY 批後才以一個交易寫入，
+各 worker 不會在每個請求都排隊等待同一把 SQLite 寫入鎖。
+"""
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+logger = logging.getLogger('polls.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 指標定義: 名稱 -> (類型, 說明, histogram buckets)
+METRICS = {
+    'polls_http_requests_total': ('counter', '依 URL 名稱統計的請求數', None),
+    'polls_http_request_duration_seconds': ('histogram', '依 URL 名稱統計的回應時間（秒）', LATENCY_BUCKETS),
+    'polls_db_queries_per_request': ('histogram', '每個請求執行的 SQL 數量', QUERY_COUNT_BUCKETS),
+    'polls_cache_requests_total': ('counter', '快取查詢次數（hit / miss）', None),
+    'polls_cache_lock_total': ('counter', '快取重算鎖（acquired / stale / wait / timeout）', None),
+    'polls_jobs_total': ('counter', '匯入與抓圖工作的執行次數', None),
+    'polls_job_items_total': ('counter', '匯入與抓圖工作處理的項目數', None),
+    'polls_rate_limited_total': ('counter', '超過限流額度被拒絕（429）的請求數', None),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+)
+"""
+
+# 各檢視最近被請求的參數組合（warm_caches 依此決定要預熱哪些）
+ACCESS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_stats (
+    view TEXT NOT NULL,
+    params TEXT NOT NULL,
+    day TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (view, params, day)
+)
+"""
+
+ACCESS_UPSERT = """
+INSERT INTO access_stats (view, params, day, hits) VALUES (?, ?, date('now'), ?)
+ON CONFLICT (view, params, day) DO UPDATE SET hits = hits + excluded.hits
+"""
+
+UPSERT = """
+INSERT INTO samples (name, labels, value) VALUES (?, ?, ?)
+ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value
+"""
+
+LE_LABEL_PATTERN = re.compile(r'(?:^|,)le="([^"]*)"')
+
+_local = threading.local()
+
+# 尚未寫入的計數：(name, labels) -> 累加值、(view, params) -> 次數
+_pending = Counter()
+_pending_accesses = Counter()
+_pending_batches = 0
+_pending_lock = threading.Lock()
+_flusher_pid = None
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def get_connection():
+    """每個執行緒各自持有一條連線（METRICS_DB 變更時重新連線）"""
+    path = str(settings.METRICS_DB)
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != path:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(SCHEMA)
+        conn.execute(ACCESS_SCHEMA)
+        _local.conn, _local.path = conn, path
+    return conn
+
+
+def _write(updates, accesses):
+    """以單一交易寫入；updates 為 [(name, labels, amount)]，accesses 為 [(view, params, hits)]"""
+    if not (updates or accesses):
+        return
+    try:
+        conn = get_connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(UPSERT, updates)
+            conn.executemany(ACCESS_UPSERT, accesses)
+    except sqlite3.Error as e:
+        # 指標寫入失敗不應影響正常請求
+        logger.warning('寫入指標失敗: %s', e)
+
+
+def flush_pending():
+    """把此行程累積的計數寫入指標檔"""
+    global _pending, _pending_accesses, _pending_batches
+    with _pending_lock:
+        if not (_pending or _pending_accesses):
+            return
+        pending, accesses = _pending, _pending_accesses
+        _pending, _pending_accesses, _pending_batches = Counter(), Counter(), 0
+    _write(
+        [(name, labels, amount) for (name, labels), amount in pending.items()],
+        [(view, params, hits) for (view, params), hits in accesses.items()],
+    )
+
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        flush_pending()
+
+
+def _ensure_flusher():
+    """每個行程（包含 fork 出來的 worker）啟動一次定期寫入的背景執行緒"""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _pending_lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+    threading.Thread(target=_flush_loop, args=(interval,), name='metrics-flush', daemon=True).start()
+
+
+atexit.register(flush_pending)
+
+
+def format_labels(labels):
+    """將 labels dict 轉成 Prometheus 格式（依鍵排序，值需跳脫）"""
+    if not labels:
+        return ''
+    parts = []
+    for key in sorted(labels):
+        value = str(labels[key]).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return ','.join(parts)
+
+
+class Batch:
+    """累積多筆更新，最後以單一交易寫入"""
+
+    def __init__(self):
+        self.updates = []
+        self.accesses = []
+
+    def inc(self, name, labels=None, amount=1):
+        self.updates.append((name, format_labels(labels), amount))
+
+    def observe(self, name, value, labels=None):
+        buckets = METRICS[name][2]
+        labels = dict(labels or {})
+        for bound in buckets:
+            # 未落入的 bucket 也寫入 0，確保每個 bucket 都有樣本
+            self.updates.append((f'{name}_bucket', format_labels({**labels, 'le': bound}), int(value <= bound)))
+        self.updates.append((f'{name}_bucket', format_labels({**labels, 'le': '+Inf'}), 1))
+        self.updates.append((f'{name}_sum', format_labels(labels), value))
+        self.updates.append((f'{name}_count', format_labels(labels), 1))
+
+    def access(self, view, params):
+        """記錄一次 view 以 params（正規化後的查詢字串）被請求"""
+        self.accesses.append((view, params))
+
+    def flush(self):
+        """累加到行程記憶體，累積 METRICS_FLUSH_EVERY 批時立即寫入，否則由背景執行緒定期寫入"""
+        global _pending_batches
+        if not (self.updates or self.accesses) or not is_enabled():
+            return
+        _ensure_flusher()
+        with _pending_lock:
+            for name, labels, amount in self.updates:
+                _pending[name, labels] += amount
+            _pending_accesses.update(self.accesses)
+            _pending_batches += 1
+            due = _pending_batches >= getattr(settings, 'METRICS_FLUSH_EVERY', 500)
+        self.updates = []
+        self.accesses = []
+        if due:
+            flush_pending()
+
+    def write(self):
+        """立即寫入（管理指令執行完畢即結束，不等待定期寫入）"""
+        if not (self.updates or self.accesses) or not is_enabled():
+            return
+        _write(self.updates, [(view, params, hits) for (view, params), hits in Counter(self.accesses).items()])
+        self.updates = []
+        self.accesses = []
+
+
+def inc(name, labels=None, amount=1):
+    """單筆計數器累加"""
+    batch = Batch()
+    batch.inc(name, labels, amount)
+    batch.flush()
+
+
+def record_cache(cache_name, hit):
+    """記錄快取命中 / 未命中"""
+    inc('polls_cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+def record_cache_lock(cache_name, result):
+    """記錄 single-flight 重算鎖：acquired 取得鎖、stale 回傳舊值、wait 等待他人計算、timeout 等待逾時"""
+    inc('polls_cache_lock_total', {'cache': cache_name, 'result': result})
+
+
+def record_job(job, outcome='success', items=None):
+    """記錄管理指令（匯入、抓圖）的執行結果與處理項目數"""
+    batch = Batch()
+    batch.inc('polls_jobs_total', {'job': job, 'outcome': outcome})
+    for result, count in (items or {}).items():
+        if count:
+            batch.inc('polls_job_items_total', {'job': job, 'result': result}, count)
+    batch.write()
+
+
+def top_accesses(views, days=7, limit=50):
+    """最近 days 天內請求次數最多的 (view, params, hits)，由多到少"""
+    if not is_enabled() or not views:
+        return []
+    flush_pending()
+    placeholders = ','.join('?' * len(views))
+    return get_connection().execute(
+        f"""
+        SELECT view, params, SUM(hits) AS total FROM access_stats
+        WHERE view IN ({placeholders}) AND day >= date('now', ?)
+        GROUP BY view, params ORDER BY total DESC, view, params LIMIT ?
+        """,
+        [*views, f'-{int(days)} days', limit],
+    ).fetchall()
+
+
+def prune_accesses(days=7):
+    """刪除超過 days 天的請求統計，回傳刪除筆數"""
+    if not is_enabled():
+        return 0
+    conn = get_connection()
+    with conn:
+        return conn.execute("DELETE FROM access_stats WHERE day < date('now', ?)", [f'-{int(days)} days']).rowcount
+
+
+def bucket_sort_key(sample):
+    """bucket 依其他 labels 分組後，再依 le 數值由小到大排列"""
+    labels, _ = sample
+    match = LE_LABEL_PATTERN.search(labels)
+    bound = float(match.group(1)) if match else float('inf')
+    return LE_LABEL_PATTERN.sub('', labels), bound
+
+
+def render():
+    """輸出 Prometheus text exposition format（其他行程尚未寫入的計數最多延遲 METRICS_FLUSH_INTERVAL 秒）"""
+    flush_pending()
+    rows = get_connection().execute('SELECT name, labels, value FROM samples ORDER BY name, labels').fetchall()
+    samples = {}
+    for name, labels, value in rows:
+        samples.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'histogram':
+            sample_names = [f'{name}_bucket', f'{name}_sum', f'{name}_count']
+        else:
+            sample_names = [name]
+        for sample_name in sample_names:
+            rows = samples.get(sample_name, [])
+            if sample_name.endswith('_bucket'):
+                rows = sorted(rows, key=bucket_sort_key)
+            for labels, value in rows:
+                value = int(value) if float(value).is_integer() else value
+                lines.append(f'{sample_name}{{{labels}}} {value}' if labels else f'{sample_name} {value}')
+    return '\n'.join(lines) + '\n'
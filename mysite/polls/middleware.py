@@ -0,0 +1,251 @@
+import functools
+import logging
+import re
+import time
+import traceback
+import warnings
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics, warmup
+
+
+logger = logging.getLogger('polls.nplusone')
+
+
+class NPlusOneError(Exception):
+    """偵測到 N+1 查詢（raise 模式）"""
+
+
+class NPlusOneWarning(UserWarning):
+    """偵測到 N+1 查詢（warn 模式）"""
+
+
+# 將 IN (%s, %s, ...) 收斂成同一種形狀，避免清單長度不同被視為不同查詢
+IN_LIST_PATTERN = re.compile(r'IN \((?:%s, )*%s\)')
+# 字面數字與字串（raw SQL 可能直接寫入數值）
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """把 SQL 正規化成「形狀」，同形狀的查詢代表同一種逐筆查找"""
+    sql = IN_LIST_PATTERN.sub('IN (...)', sql)
+    sql = LITERAL_PATTERN.sub('?', sql)
+    return ' '.join(sql.split())
+
+
+def find_call_site():
+    """找出專案內最接近查詢的程式位置（略過 Django 與第三方套件）"""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if not filename.startswith(base_dir) or 'site-packages' in filename:
+            continue
+        if filename == __file__:
+            continue
+        return f'{filename[len(base_dir) + 1:]}:{frame.lineno} ({frame.name})'
+    return '<unknown>'
+
+
+# 目前 context 內有效的 execute_wrapper。
+# async view 的 ORM 查詢在 sync_to_async 的執行緒上以另一條連線執行，裝在 event loop 執行緒連線上的
+# wrapper 看不到這些查詢；改為每條連線固定掛上 _dispatch，依 ContextVar（會隨 sync_to_async 傳遞）
+# 找出目前請求的 wrapper
+_query_wrappers = ContextVar('polls_query_wrappers', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    # 與 Django 相同：先加入的 wrapper 在最外層
+    for wrapper in reversed(_query_wrappers.get()):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_dispatch(connection):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install_dispatch(connection)
+
+
+connection_created.connect(_on_connection_created, dispatch_uid='polls_query_wrappers')
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """在區塊內（包含其中 sync_to_async 執行的程式）對所有資料庫查詢套用 execute_wrapper"""
+    # 此模組載入前就已建立的連線不會觸發 connection_created
+    for alias in connections:
+        install_dispatch(connections[alias])
+    token = _query_wrappers.set(_query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+class QueryRecorder:
+    """記錄單一請求內執行的 SQL，依（正規化語句, 呼叫位置）分組"""
+
+    def __init__(self):
+        self.groups = defaultdict(int)
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        self.groups[(normalize_sql(sql), find_call_site())] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """回傳重複次數達門檻的查詢組"""
+        return sorted(
+            ((count, sql, call_site) for (sql, call_site), count in self.groups.items()
+             if count >= threshold),
+            reverse=True,
+        )
+
+
+class NPlusOneMiddleware:
+    """
+    開發 / 測試環境用的 N+1 查詢偵測器
+
+    設定:
+        NPLUSONE_ENABLED   是否啟用（預設跟隨 DEBUG）
+        NPLUSONE_MODE      warn / log / raise
+        NPLUSONE_THRESHOLD 同一形狀、同一位置重複幾次視為 N+1
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'NPLUSONE_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.mode = getattr(settings, 'NPLUSONE_MODE', 'warn')
+        self.threshold = getattr(settings, 'NPLUSONE_THRESHOLD', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        with wrap_queries(recorder):
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        with wrap_queries(recorder):
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        repeated = recorder.repeated(self.threshold)
+        if repeated:
+            self.report(request, recorder, repeated)
+
+    def report(self, request, recorder, repeated):
+        """依模式回報偵測結果"""
+        lines = [f'{request.method} {request.path}: 偵測到 N+1 查詢（共 {recorder.total} 次查詢）']
+        for count, sql, call_site in repeated:
+            lines.append(f'  {count} 次 @ {call_site}: {sql[:300]}')
+        message = '\n'.join(lines)
+
+        if self.mode == 'raise':
+            raise NPlusOneError(message)
+        elif self.mode == 'log':
+            logger.warning(message)
+        else:  # warn
+            warnings.warn(message, NPlusOneWarning, stacklevel=2)
+
+
+
+class MetricsMiddleware:
+    """記錄每個請求的次數、回應時間與 SQL 數量（依 URL 名稱分組；不含靜態檔案）"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.static_prefix = urlsplit(settings.STATIC_URL).path
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def is_static(self, request):
+        return bool(self.static_prefix) and request.path.startswith(self.static_prefix)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_static(request):
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with wrap_queries(counter):
+            response = self.get_response(request)
+        self.build_batch(request, response, time.perf_counter() - start, counter.count).flush()
+        return response
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            return await self.get_response(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with wrap_queries(counter):
+            response = await self.get_response(request)
+        batch = self.build_batch(request, response, time.perf_counter() - start, counter.count)
+        # 累積到一定批數時會寫入 SQLite（阻塞操作），移到執行緒池避免卡住 event loop
+        await sync_to_async(batch.flush, thread_sensitive=False)()
+        return response
+
+    def build_batch(self, request, response, duration, query_count):
+        match = request.resolver_match
+        view = (match.view_name if match else None) or 'unmatched'
+
+        batch = metrics.Batch()
+        batch.inc('polls_http_requests_total', {
+            'view': view,
+            'method': request.method,
+            'status': response.status_code,
+        })
+        batch.observe('polls_http_request_duration_seconds', duration, {'view': view})
+        batch.observe('polls_db_queries_per_request', query_count, {'view': view})
+        # 可預熱 view 的參數組合（warm_caches 依此決定要預熱哪些）
+        if (
+            view in warmup.VIEW_PARAMS
+            and request.method == 'GET'
+            and response.status_code == 200
+            and warmup.WARMUP_HEADER not in request.headers
+        ):
+            batch.access(view, warmup.normalize(view, request.GET))
+        return batch
+
+
+class QueryCounter:
+    """計算請求內執行的 SQL 數量"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
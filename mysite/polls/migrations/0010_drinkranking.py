@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_remove_drink_has_small_remove_drink_price_small_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrinkRanking',
+            fields=[
+                ('drink', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='polls.drink', verbose_name='飲料')),
+                ('score', models.FloatField(verbose_name='推薦分數')),
+                ('rating_score', models.FloatField(verbose_name='店家評分分數')),
+                ('popularity_score', models.FloatField(verbose_name='收藏熱度分數')),
+                ('value_score', models.FloatField(verbose_name='價格划算分數')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '推薦排名',
+                'verbose_name_plural': '推薦排名列表',
+                'ordering': ['-score'],
+                'indexes': [models.Index(fields=['-score'], name='polls_ranking_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_favorite_counts(apps, schema_editor):
+    """依現有收藏紀錄回填收藏人數"""
+    TeaShop = apps.get_model('polls', 'TeaShop')
+    Drink = apps.get_model('polls', 'Drink')
+    Favorite = apps.get_model('polls', 'Favorite')
+
+    for model, field in ((TeaShop, 'tea_shop'), (Drink, 'drink')):
+        counts = (
+            Favorite.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field).annotate(count=Count('pk')).values('count')
+        )
+        model.objects.update(favorite_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_drinkranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drink',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='收藏人數'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='收藏人數'),
+        ),
+        migrations.RunPython(backfill_favorite_counts, migrations.RunPython.noop),
+    ]
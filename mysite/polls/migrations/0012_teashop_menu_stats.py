@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:29
+
+from django.db import migrations, models
+
+
+def backfill_menu_stats(apps, schema_editor):
+    from polls import menu_stats
+    menu_stats.refresh(
+        shop_model=apps.get_model('polls', 'TeaShop'),
+        drink_model=apps.get_model('polls', 'Drink'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0011_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_drink_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='飲料品項數'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_has_fresh_milk',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='有鮮奶飲品'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_has_topping',
+            field=models.BooleanField(db_index=True, default=False, verbose_name='有配料飲品'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_max_price',
+            field=models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True, verbose_name='菜單最高價'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_min_fresh_milk_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=0, max_digits=5, null=True, verbose_name='鮮奶飲品最低價'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_min_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=0, max_digits=5, null=True, verbose_name='菜單最低價'),
+        ),
+        migrations.AddField(
+            model_name='teashop',
+            name='menu_tea_types',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='提供茶類'),
+        ),
+        migrations.RunPython(backfill_menu_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def compile_opening_hours(apps, schema_editor):
+    from polls import opening_hours
+    TeaShop = apps.get_model('polls', 'TeaShop')
+    OpeningPeriod = apps.get_model('polls', 'OpeningPeriod')
+    for shop in TeaShop.objects.only('pk', 'opening_hours').iterator(chunk_size=2000):
+        opening_hours.compile_shop(shop, period_model=OpeningPeriod)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0012_teashop_menu_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpeningPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(verbose_name='星期')),
+                ('open_minute', models.PositiveSmallIntegerField(verbose_name='開始（分鐘）')),
+                ('close_minute', models.PositiveSmallIntegerField(verbose_name='結束（分鐘）')),
+            ],
+            options={
+                'verbose_name': '營業時段',
+                'verbose_name_plural': '營業時段列表',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['tea_shop', 'milk_type'], name='polls_drink_shop_milk_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['tea_shop', 'tea_type'], name='polls_drink_shop_tea_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['tea_shop', 'topping'], name='polls_drink_shop_topping_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='teashop',
+            index=models.Index(fields=['latitude', 'longitude'], name='polls_shop_lat_lng_idx'),
+        ),
+        migrations.AddField(
+            model_name='openingperiod',
+            name='tea_shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_periods', to='polls.teashop', verbose_name='所屬店家'),
+        ),
+        migrations.AddIndex(
+            model_name='openingperiod',
+            index=models.Index(fields=['tea_shop', 'weekday', 'open_minute'], name='polls_period_lookup_idx'),
+        ),
+        migrations.RunPython(compile_opening_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:33
+
+from django.db import migrations, models
+
+
+def backfill_min_price(apps, schema_editor):
+    Drink = apps.get_model('polls', 'Drink')
+    changed = []
+    for drink in Drink.objects.only('pk', 'has_medium', 'price_medium', 'has_large', 'price_large').iterator(chunk_size=2000):
+        prices = []
+        if drink.has_medium and drink.price_medium:
+            prices.append(drink.price_medium)
+        if drink.has_large and drink.price_large:
+            prices.append(drink.price_large)
+        if prices:
+            drink.min_price = min(prices)
+            changed.append(drink)
+    Drink.objects.bulk_update(changed, ['min_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0013_menu_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drink',
+            name='min_price',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=0, editable=False, max_digits=5, null=True, verbose_name='最低價格'),
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['tea_shop', 'min_price'], name='polls_drink_shop_price_idx'),
+        ),
+        migrations.RunPython(backfill_min_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0014_drink_min_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalDrink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='正規化名稱')),
+                ('name', models.CharField(max_length=100, verbose_name='顯示名稱')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '標準飲料',
+                'verbose_name_plural': '標準飲料列表',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='drink',
+            name='canonical',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='drinks', to='polls.canonicaldrink', verbose_name='標準飲料'),
+        ),
+        migrations.AddIndex(
+            model_name='drink',
+            index=models.Index(fields=['canonical', 'min_price'], name='polls_drink_canonical_idx'),
+        ),
+    ]
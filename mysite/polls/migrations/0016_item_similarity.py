@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_canonical_drink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('shop', '店家'), ('drink', '飲料')], max_length=10, verbose_name='項目類型')),
+                ('item_id', models.PositiveIntegerField(verbose_name='項目 ID')),
+                ('neighbor_type', models.CharField(choices=[('shop', '店家'), ('drink', '飲料')], max_length=10, verbose_name='相似項目類型')),
+                ('neighbor_id', models.PositiveIntegerField(verbose_name='相似項目 ID')),
+                ('score', models.FloatField(verbose_name='相似度')),
+                ('co_count', models.PositiveIntegerField(verbose_name='共同收藏人數')),
+            ],
+            options={
+                'verbose_name': '相似項目',
+                'verbose_name_plural': '相似項目列表',
+                'ordering': ['item_type', 'item_id', '-score'],
+                'indexes': [models.Index(fields=['item_type', 'item_id', '-score'], name='polls_similarity_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0016_item_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='工作類型')),
+                ('arguments', models.JSONField(blank=True, default=list, verbose_name='指令參數')),
+                ('dedup_key', models.CharField(max_length=255, verbose_name='重複判斷鍵')),
+                ('status', models.CharField(choices=[('queued', '等待中'), ('running', '執行中'), ('succeeded', '成功'), ('failed', '失敗'), ('cancelled', '已取消')], default='queued', max_length=10, verbose_name='狀態')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='已嘗試次數')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3, verbose_name='最多嘗試次數')),
+                ('run_after', models.DateTimeField(verbose_name='最早執行時間')),
+                ('progress_current', models.PositiveIntegerField(default=0, verbose_name='進度')),
+                ('progress_total', models.PositiveIntegerField(blank=True, null=True, verbose_name='總數')),
+                ('progress_message', models.CharField(blank=True, default='', max_length=255, verbose_name='進度說明')),
+                ('worker', models.CharField(blank=True, default='', max_length=100, verbose_name='執行者')),
+                ('output', models.TextField(blank=True, default='', verbose_name='輸出')),
+                ('error', models.TextField(blank=True, default='', verbose_name='錯誤訊息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='最後回報時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='結束時間')),
+            ],
+            options={
+                'verbose_name': '背景工作',
+                'verbose_name_plural': '背景工作列表',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='polls_job_claim_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('dedup_key',), name='polls_job_active_dedup')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrinkStaging',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField(verbose_name='CSV 行號')),
+                ('name', models.CharField(max_length=100, verbose_name='飲料名稱')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='描述')),
+                ('milk_type', models.CharField(blank=True, choices=[('creamer', '奶精'), ('fresh_milk', '鮮奶')], max_length=20, null=True, verbose_name='使用奶類')),
+                ('tea_type', models.CharField(blank=True, choices=[('black_tea', '紅茶'), ('green_tea', '綠茶'), ('oolong_tea', '烏龍茶'), ('blue_tea', '青茶'), ('matcha', '抹茶'), ('tieguanyin', '鐵觀音'), ('barley_tea', '麥茶'), ('season', '四季春'), ('jasmine', '茉莉花茶'), ('pu_erh', '普洱茶'), ('other', '其他')], max_length=20, null=True, verbose_name='茶類')),
+                ('topping', models.CharField(blank=True, choices=[('yes', '有'), ('no', '無')], max_length=10, null=True, verbose_name='配料')),
+                ('has_medium', models.BooleanField(default=False, verbose_name='有中杯')),
+                ('price_medium', models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True, verbose_name='中杯價格')),
+                ('has_large', models.BooleanField(default=False, verbose_name='有大杯')),
+                ('price_large', models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True, verbose_name='大杯價格')),
+                ('min_price', models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True, verbose_name='最低價格')),
+                ('tea_shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls.teashop', verbose_name='所屬店家')),
+            ],
+            options={
+                'verbose_name': '飲料匯入暫存',
+                'verbose_name_plural': '飲料匯入暫存列表',
+                'constraints': [models.UniqueConstraint(fields=('tea_shop', 'name'), name='polls_drinkstaging_unique_drink')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+def backfill_fingerprints(apps, schema_editor):
+    from polls.importing import FINGERPRINT_FIELDS, instance_fingerprint
+    Drink = apps.get_model('polls', 'Drink')
+    changed = []
+    for drink in Drink.objects.only('pk', *FINGERPRINT_FIELDS).iterator(chunk_size=2000):
+        drink.fingerprint = instance_fingerprint(drink)
+        changed.append(drink)
+    Drink.objects.bulk_update(changed, ['fingerprint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0018_drink_staging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drink',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='內容指紋'),
+        ),
+        migrations.AddField(
+            model_name='drinkstaging',
+            name='fingerprint',
+            field=models.CharField(default='', max_length=32, verbose_name='內容指紋'),
+        ),
+        migrations.CreateModel(
+            name='ImportFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='匯入類型')),
+                ('path', models.CharField(max_length=500, verbose_name='檔案路徑')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='檔案大小')),
+                ('row_count', models.PositiveIntegerField(default=0, verbose_name='資料筆數')),
+                ('imported_at', models.DateTimeField(auto_now=True, verbose_name='匯入時間')),
+            ],
+            options={
+                'verbose_name': '匯入檔案',
+                'verbose_name_plural': '匯入檔案列表',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'path'), name='polls_importfile_unique_path')],
+            },
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
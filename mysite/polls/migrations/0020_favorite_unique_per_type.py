@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def dedup_favorites(apps, schema_editor):
+    """
+    每組 (使用者, 類型, 項目) 只保留最早的收藏；保留的那筆沒有備註時沿用最新一筆重複收藏的備註，
+    再重算受影響店家與飲料的收藏人數
+    """
+    Favorite = apps.get_model('polls', 'Favorite')
+    TeaShop = apps.get_model('polls', 'TeaShop')
+    Drink = apps.get_model('polls', 'Drink')
+
+    for favorite_type, model, field in (('shop', TeaShop, 'tea_shop'), ('drink', Drink, 'drink')):
+        groups = (
+            Favorite.objects.filter(favorite_type=favorite_type)
+            .order_by().values('user_id', f'{field}_id')
+            .annotate(count=Count('pk'), keep=Min('pk')).filter(count__gt=1)
+        )
+        affected = set()
+        for group in groups:
+            duplicates = Favorite.objects.filter(
+                favorite_type=favorite_type, user_id=group['user_id'], **{f'{field}_id': group[f'{field}_id']}
+            ).exclude(pk=group['keep'])
+            kept = Favorite.objects.get(pk=group['keep'])
+            if not kept.notes:
+                notes = (
+                    duplicates.exclude(notes__isnull=True).exclude(notes='')
+                    .order_by('-pk').values_list('notes', flat=True).first()
+                )
+                if notes:
+                    kept.notes = notes
+                    kept.save(update_fields=['notes'])
+            duplicates.delete()
+            affected.add(group[f'{field}_id'])
+
+        if affected:
+            counts = (
+                Favorite.objects.filter(**{field: OuterRef('pk')})
+                .order_by().values(field).annotate(count=Count('pk')).values('count')
+            )
+            model.objects.filter(pk__in=affected).update(favorite_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0019_import_fingerprints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedup_favorites, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='favorite',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(condition=models.Q(('favorite_type', 'shop')), fields=('user', 'tea_shop'), name='polls_favorite_unique_shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(condition=models.Q(('favorite_type', 'drink')), fields=('user', 'drink'), name='polls_favorite_unique_drink'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_favorite_unique_per_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importfile',
+            name='catalog_state',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='資料庫狀態摘要'),
+        ),
+    ]
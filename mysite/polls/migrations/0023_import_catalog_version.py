@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0022_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='importfile',
+            name='catalog_state',
+        ),
+        migrations.AddField(
+            model_name='importfile',
+            name='catalog_version',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='目錄版本'),
+        ),
+    ]
@@ -15,16 +15,61 @@ class TeaShop(models.Model):
     longitude = models.DecimalField(max_digits=10, decimal_places=7, verbose_name='經度')
     rating = models.DecimalField(max_digits=2, decimal_places=1, verbose_name='評分')
     opening_hours = models.TextField(verbose_name='營業時間')
+    favorite_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='收藏人數')
+
+    # 菜單統計（由 polls.menu_stats 依 Drink 異動維護，匯入後批次重算）
+    menu_drink_count = models.PositiveIntegerField(default=0, verbose_name='飲料品項數')
+    menu_min_price = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, db_index=True, verbose_name='菜單最低價')
+    menu_max_price = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, verbose_name='菜單最高價')
+    menu_tea_types = models.CharField(max_length=200, blank=True, default='', verbose_name='提供茶類')
+    menu_has_fresh_milk = models.BooleanField(default=False, db_index=True, verbose_name='有鮮奶飲品')
+    menu_has_topping = models.BooleanField(default=False, db_index=True, verbose_name='有配料飲品')
+    menu_min_fresh_milk_price = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, db_index=True, verbose_name='鮮奶飲品最低價')
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
 
     class Meta:
         verbose_name = '奶茶店'
         verbose_name_plural = '奶茶店列表'
         ordering = ['-rating', 'name']  # 按評分降冪、店名排序
+        indexes = [
+            # 附近店家的經緯度範圍預篩
+            models.Index(fields=['latitude', 'longitude'], name='polls_shop_lat_lng_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.rating}分)"
 
+    def delete(self, *args, **kwargs):
+        """
+        連帶刪除的飲料不逐筆重算菜單統計（店家本身也被刪除）、不逐筆排入目錄快照重建，
+        連帶刪除的收藏也不必逐筆扣回收藏人數；刪除後遞增一次目錄版本並排入一次目錄快照重建
+        """
+        from django.db import transaction
+        from . import catalog, favorites, menu_stats, snapshot
+        with transaction.atomic(using=kwargs.get('using')), menu_stats.deferred(), favorites.deferred():
+            result = super().delete(*args, **kwargs)
+            catalog.bump()
+            snapshot.schedule()
+        return result
+
+    def get_menu_price_range(self):
+        """取得菜單價格範圍"""
+        if self.menu_min_price is None:
+            return "價格未定"
+
+        min_price = int(self.menu_min_price)
+        max_price = int(self.menu_max_price)
+
+        if min_price == max_price:
+            return f"${min_price}"
+        return f"${min_price}-${max_price}"
+
+    def get_menu_tea_types_display(self):
+        """取得提供的茶類名稱"""
+        names = dict(Drink.TEA_TYPE_CHOICES)
+        return [names.get(code, code) for code in self.menu_tea_types.split(',') if code]
+
     def is_open_now(self):
         """判斷店家目前是否營業中"""
         if not self.opening_hours or '無資訊' in self.opening_hours:
@@ -92,6 +137,39 @@ class TeaShop(models.Model):
             return None
 
 
+
+class OpeningPeriod(models.Model):
+    """店家營業時段 - 由 opening_hours 字串編譯而來（polls.opening_hours）"""
+    tea_shop = models.ForeignKey(TeaShop, on_delete=models.CASCADE, related_name='opening_periods', verbose_name='所屬店家')
+    weekday = models.PositiveSmallIntegerField(verbose_name='星期')  # 0=星期一, 6=星期日
+    open_minute = models.PositiveSmallIntegerField(verbose_name='開始（分鐘）')
+    close_minute = models.PositiveSmallIntegerField(verbose_name='結束（分鐘）')
+
+    class Meta:
+        verbose_name = '營業時段'
+        verbose_name_plural = '營業時段列表'
+        indexes = [
+            models.Index(fields=['tea_shop', 'weekday', 'open_minute'], name='polls_period_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tea_shop_id} {self.weekday}: {self.open_minute}-{self.close_minute}"
+
+class CanonicalDrink(models.Model):
+    """跨店家的標準飲料（由 polls.canonical 依名稱正規化產生）"""
+    key = models.CharField(max_length=100, unique=True, verbose_name='正規化名稱')
+    name = models.CharField(max_length=100, verbose_name='顯示名稱')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
+
+    class Meta:
+        verbose_name = '標準飲料'
+        verbose_name_plural = '標準飲料列表'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Drink(models.Model):
     """飲料品項模型"""
     MILK_TYPE_CHOICES = [
@@ -115,6 +193,7 @@ class Drink(models.Model):
 
     tea_shop = models.ForeignKey(TeaShop, on_delete=models.CASCADE, related_name='drinks', verbose_name='所屬店家')
     name = models.CharField(max_length=100, verbose_name='飲料名稱')
+    canonical = models.ForeignKey(CanonicalDrink, on_delete=models.SET_NULL, blank=True, null=True, related_name='drinks', verbose_name='標準飲料')
     description = models.TextField(blank=True, null=True, verbose_name='描述')
     milk_type = models.CharField(max_length=20, choices=MILK_TYPE_CHOICES, blank=True, null=True, verbose_name='使用奶類')
     tea_type = models.CharField(max_length=20, choices=TEA_TYPE_CHOICES, blank=True, null=True, verbose_name='茶類')
@@ -127,16 +206,52 @@ class Drink(models.Model):
     has_large = models.BooleanField(default=False, verbose_name='有大杯')
     price_large = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, verbose_name='大杯價格')
 
+    # 由 save() 依杯型價格計算，供「最便宜」查詢走索引
+    min_price = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, db_index=True, editable=False, verbose_name='最低價格')
+
+    # 由 save() 依匯入欄位計算，import_drinks 以此判斷是否需要更新
+    fingerprint = models.CharField(max_length=32, blank=True, default='', editable=False, verbose_name='內容指紋')
+
+    favorite_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='收藏人數')
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
 
     class Meta:
         verbose_name = '飲料品項'
         verbose_name_plural = '飲料品項列表'
         ordering = ['tea_shop', 'name']
+        indexes = [
+            # 店家菜單條件的 EXISTS 子查詢（依店家 + 條件查找）
+            models.Index(fields=['tea_shop', 'milk_type'], name='polls_drink_shop_milk_idx'),
+            models.Index(fields=['tea_shop', 'tea_type'], name='polls_drink_shop_tea_idx'),
+            models.Index(fields=['tea_shop', 'topping'], name='polls_drink_shop_topping_idx'),
+            # 附近最便宜：範圍內店家依價格取飲料
+            models.Index(fields=['tea_shop', 'min_price'], name='polls_drink_shop_price_idx'),
+            # 同一標準飲料的跨店比價與價格統計
+            models.Index(fields=['canonical', 'min_price'], name='polls_drink_canonical_idx'),
+        ]
 
     def __str__(self):
         return f"{self.tea_shop.name} - {self.name}"
 
+    def save(self, *args, **kwargs):
+        from .importing import instance_fingerprint
+        self.min_price = self.calculate_min_price()
+        self.fingerprint = instance_fingerprint(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = [*update_fields, *(f for f in ('min_price', 'fingerprint') if f not in update_fields)]
+        super().save(*args, **kwargs)
+
+    def calculate_min_price(self):
+        """有該杯型且價格大於 0 的最低價格，無價格時為 None"""
+        prices = []
+        if self.has_medium and self.price_medium:
+            prices.append(self.price_medium)
+        if self.has_large and self.price_large:
+            prices.append(self.price_large)
+        return min(prices) if prices else None
+
     def get_price_range(self):
         """取得價格範圍"""
         prices = []
@@ -174,10 +289,193 @@ class Favorite(models.Model):
         verbose_name = '收藏'
         verbose_name_plural = '收藏列表'
         ordering = ['-created_at']
-        unique_together = [['user', 'tea_shop', 'drink']]  # 避免重複收藏
+        # 避免重複收藏：另一個外鍵固定為 NULL，而 NULL 彼此不相等，
+        # (user, tea_shop, drink) 的 unique_together 擋不住重複，改為依收藏類型的部分唯一索引；
+        # 也是 check_favorite / 批次收藏查詢 (user, 類型, 項目) 使用的索引
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'tea_shop'],
+                condition=models.Q(favorite_type='shop'),
+                name='polls_favorite_unique_shop',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'drink'],
+                condition=models.Q(favorite_type='drink'),
+                name='polls_favorite_unique_drink',
+            ),
+        ]
 
     def __str__(self):
         if self.favorite_type == 'shop':
             return f"{self.user.username} 收藏 {self.tea_shop.name}"
         else:
             return f"{self.user.username} 收藏 {self.drink.name}"
+
+
+class DrinkRanking(models.Model):
+    """飲料推薦排名 - 由 rebuild_rankings 指令（或匯入後）預先計算"""
+    drink = models.OneToOneField(Drink, on_delete=models.CASCADE, primary_key=True, related_name='ranking', verbose_name='飲料')
+    score = models.FloatField(verbose_name='推薦分數')
+    rating_score = models.FloatField(verbose_name='店家評分分數')
+    popularity_score = models.FloatField(verbose_name='收藏熱度分數')
+    value_score = models.FloatField(verbose_name='價格划算分數')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+
+    class Meta:
+        verbose_name = '推薦排名'
+        verbose_name_plural = '推薦排名列表'
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['-score'], name='polls_ranking_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.drink_id}: {self.score:.4f}"
+
+
+class DrinkStaging(models.Model):
+    """飲料匯入暫存表 - import_drinks --staged 先寫入此表，驗證比對後再一次合併到 Drink"""
+    row_number = models.PositiveIntegerField(verbose_name='CSV 行號')
+    tea_shop = models.ForeignKey(TeaShop, on_delete=models.CASCADE, related_name='+', verbose_name='所屬店家')
+    name = models.CharField(max_length=100, verbose_name='飲料名稱')
+    description = models.TextField(blank=True, null=True, verbose_name='描述')
+    milk_type = models.CharField(max_length=20, choices=Drink.MILK_TYPE_CHOICES, blank=True, null=True, verbose_name='使用奶類')
+    tea_type = models.CharField(max_length=20, choices=Drink.TEA_TYPE_CHOICES, blank=True, null=True, verbose_name='茶類')
+    topping = models.CharField(max_length=10, choices=[('yes', '有'), ('no', '無')], blank=True, null=True, verbose_name='配料')
+    has_medium = models.BooleanField(default=False, verbose_name='有中杯')
+    price_medium = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, verbose_name='中杯價格')
+    has_large = models.BooleanField(default=False, verbose_name='有大杯')
+    price_large = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, verbose_name='大杯價格')
+    min_price = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True, verbose_name='最低價格')
+    fingerprint = models.CharField(max_length=32, default='', verbose_name='內容指紋')
+
+    class Meta:
+        verbose_name = '飲料匯入暫存'
+        verbose_name_plural = '飲料匯入暫存列表'
+        constraints = [
+            # 同一店家同名飲料只保留 CSV 中最後一筆（與逐筆匯入時後面的列覆蓋前面相同）
+            models.UniqueConstraint(fields=['tea_shop', 'name'], name='polls_drinkstaging_unique_drink'),
+        ]
+
+    def __str__(self):
+        return f"{self.row_number}: {self.name}"
+
+
+class ImportFile(models.Model):
+    """已匯入檔案的雜湊 - 內容未變更的檔案再次匯入時直接略過"""
+    kind = models.CharField(max_length=50, verbose_name='匯入類型')
+    path = models.CharField(max_length=500, verbose_name='檔案路徑')
+    sha256 = models.CharField(max_length=64, verbose_name='SHA-256')
+    size = models.PositiveBigIntegerField(verbose_name='檔案大小')
+    row_count = models.PositiveIntegerField(default=0, verbose_name='資料筆數')
+    # 匯入完成時的目錄版本（polls.catalog）；資料庫之後被改動時不可略過匯入
+    catalog_version = models.PositiveBigIntegerField(blank=True, null=True, verbose_name='目錄版本')
+    imported_at = models.DateTimeField(auto_now=True, verbose_name='匯入時間')
+
+    class Meta:
+        verbose_name = '匯入檔案'
+        verbose_name_plural = '匯入檔案列表'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'path'], name='polls_importfile_unique_path'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.path}"
+
+
+class CatalogVersion(models.Model):
+    """目錄版本 - 店家、飲料或排名異動時遞增（見 polls.catalog），只有一筆"""
+    version = models.PositiveBigIntegerField(default=0, verbose_name='版本')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+
+    class Meta:
+        verbose_name = '目錄版本'
+        verbose_name_plural = '目錄版本'
+
+    def __str__(self):
+        return f"目錄版本 {self.version}"
+
+
+class ItemSimilarity(models.Model):
+    """「收藏這個的人也喜歡」- 由 build_recommendations 指令依收藏共現預先計算"""
+    item_type = models.CharField(max_length=10, choices=Favorite.FAVORITE_TYPE_CHOICES, verbose_name='項目類型')
+    item_id = models.PositiveIntegerField(verbose_name='項目 ID')
+    neighbor_type = models.CharField(max_length=10, choices=Favorite.FAVORITE_TYPE_CHOICES, verbose_name='相似項目類型')
+    neighbor_id = models.PositiveIntegerField(verbose_name='相似項目 ID')
+    score = models.FloatField(verbose_name='相似度')
+    co_count = models.PositiveIntegerField(verbose_name='共同收藏人數')
+
+    class Meta:
+        verbose_name = '相似項目'
+        verbose_name_plural = '相似項目列表'
+        ordering = ['item_type', 'item_id', '-score']
+        indexes = [
+            # 依項目取前 N 個相似項目
+            models.Index(fields=['item_type', 'item_id', '-score'], name='polls_similarity_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_type}:{self.item_id} -> {self.neighbor_type}:{self.neighbor_id} ({self.score:.4f})"
+
+
+class Job(models.Model):
+    """背景工作佇列（由 run_jobs 指令的 worker 執行，見 polls.jobs）"""
+    STATUS_CHOICES = [
+        ('queued', '等待中'),
+        ('running', '執行中'),
+        ('succeeded', '成功'),
+        ('failed', '失敗'),
+        ('cancelled', '已取消'),
+    ]
+    ACTIVE_STATUSES = ['queued', 'running']
+
+    kind = models.CharField(max_length=50, verbose_name='工作類型')
+    arguments = models.JSONField(default=list, blank=True, verbose_name='指令參數')
+    dedup_key = models.CharField(max_length=255, verbose_name='重複判斷鍵')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name='狀態')
+
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='已嘗試次數')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='最多嘗試次數')
+    run_after = models.DateTimeField(verbose_name='最早執行時間')
+
+    progress_current = models.PositiveIntegerField(default=0, verbose_name='進度')
+    progress_total = models.PositiveIntegerField(blank=True, null=True, verbose_name='總數')
+    progress_message = models.CharField(max_length=255, blank=True, default='', verbose_name='進度說明')
+
+    worker = models.CharField(max_length=100, blank=True, default='', verbose_name='執行者')
+    output = models.TextField(blank=True, default='', verbose_name='輸出')
+    error = models.TextField(blank=True, default='', verbose_name='錯誤訊息')
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='開始時間')
+    heartbeat_at = models.DateTimeField(blank=True, null=True, verbose_name='最後回報時間')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='結束時間')
+
+    class Meta:
+        verbose_name = '背景工作'
+        verbose_name_plural = '背景工作列表'
+        ordering = ['-created_at']
+        indexes = [
+            # worker 依狀態與時間取下一個工作
+            models.Index(fields=['status', 'run_after'], name='polls_job_claim_idx'),
+        ]
+        constraints = [
+            # 相同的工作同時只能有一筆在等待或執行中
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='polls_job_active_dedup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.get_status_display()})"
+
+    def get_progress_display(self):
+        """顯示進度"""
+        if self.progress_total:
+            percent = self.progress_current * 100 // self.progress_total
+            return f"{self.progress_current}/{self.progress_total} ({percent}%)"
+        if self.progress_current:
+            return f"{self.progress_current}"
+        return "-"
@@ -0,0 +1,95 @@
+"""
+營業時間編譯
+
+把 TeaShop.opening_hours 字串轉成 OpeningPeriod 資料列（星期, 開始分鐘, 結束分鐘），
+「營業中」篩選即可在資料庫以 EXISTS 子查詢完成，不必逐店解析字串。
+解析規則與 TeaShop.is_open_now 相同。
+"""
+import re
+from datetime import datetime
+
+from django.db.models import Exists, OuterRef
+
+
+WEEKDAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+
+TIME_RANGE_PATTERN = re.compile(r'(\d{1,2}:\d{2})\s*[–-]\s*(\d{1,2}:\d{2})')
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minutes(value):
+    """'HH:MM' -> 當天第幾分鐘"""
+    parsed = datetime.strptime(value, '%H:%M')
+    return parsed.hour * 60 + parsed.minute
+
+
+def parse_periods(opening_hours):
+    """
+    解析營業時間字串，回傳 [(weekday, open_minute, close_minute), ...]
+
+    - 24 小時營業：每天 0 ~ 1440
+    - 跨午夜（例如 23:00 – 02:00）：與 is_open_now 相同，視為同一天的 23:00 ~ 24:00 與 00:00 ~ 02:00
+    - 休息或無法解析的日子沒有任何時段
+    """
+    if not opening_hours or '無資訊' in opening_hours:
+        return []
+
+    if '24 小時營業' in opening_hours:
+        return [(weekday, 0, MINUTES_PER_DAY) for weekday in range(7)]
+
+    periods = []
+    seen = set()
+    for day in opening_hours.split('|'):
+        day = day.strip()
+        for weekday, name in enumerate(WEEKDAY_NAMES):
+            # is_open_now 只採用第一個符合的星期
+            if name not in day or weekday in seen:
+                continue
+            seen.add(weekday)
+            if '休息' in day:
+                continue
+            try:
+                for open_str, close_str in TIME_RANGE_PATTERN.findall(day):
+                    open_minute = to_minutes(open_str)
+                    close_minute = to_minutes(close_str)
+                    if close_minute < open_minute:
+                        periods.append((weekday, open_minute, MINUTES_PER_DAY))
+                        periods.append((weekday, 0, close_minute))
+                    else:
+                        periods.append((weekday, open_minute, close_minute))
+            except ValueError:
+                continue
+    return periods
+
+
+def compile_shop(shop, period_model=None):
+    """重建單一店家的營業時段"""
+    if period_model is None:
+        from .models import OpeningPeriod
+        period_model = OpeningPeriod
+
+    period_model.objects.filter(tea_shop_id=shop.pk).delete()
+    period_model.objects.bulk_create([
+        period_model(tea_shop_id=shop.pk, weekday=weekday, open_minute=open_minute, close_minute=close_minute)
+        for weekday, open_minute, close_minute in parse_periods(shop.opening_hours)
+    ])
+
+
+def open_now_exists(now=None, shop_ref='pk'):
+    """「目前營業中」的 EXISTS 子查詢，用於 TeaShop 查詢集的 filter()（其他模型以 shop_ref 指定店家欄位）"""
+    from .models import OpeningPeriod
+
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    periods = OpeningPeriod.objects.filter(
+        tea_shop=OuterRef(shop_ref),
+        weekday=now.weekday(),
+        open_minute__lte=minute,
+    )
+    # 與 is_open_now 相同：結束時間當分鐘的 00 秒仍算營業
+    if now.second or now.microsecond:
+        periods = periods.filter(close_minute__gt=minute)
+    else:
+        periods = periods.filter(close_minute__gte=minute)
+    return Exists(periods)
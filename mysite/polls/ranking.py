@@ -0,0 +1,124 @@
+"""
+推薦排名計算
+
+分數 = 店家評分 × RATING_WEIGHT + 收藏熱度 × POPULARITY_WEIGHT + 價格划算度 × VALUE_WEIGHT
+
+- 店家評分: rating / 5
+- 收藏熱度: 收藏比例的 Wilson 下界，收藏數少時不會因偶然的一兩筆收藏而排到最前面
+- 價格划算度: 與同茶類飲料的中位數價格相比，越便宜越高（無價格時為中性 0.5）
+"""
+import statistics
+from math import sqrt
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import catalog
+from .models import Drink, DrinkRanking, Favorite
+
+
+RATING_WEIGHT = 0.6
+POPULARITY_WEIGHT = 0.25
+VALUE_WEIGHT = 0.15
+
+# 判斷分數是否變動的精度，避免浮點誤差造成不必要的更新
+SCORE_PRECISION = 6
+
+
+def wilson_lower_bound(positive, total, z=1.96):
+    """二項比例的 Wilson 信賴區間下界（預設 95%）"""
+    if total <= 0:
+        return 0.0
+    p = positive / total
+    denominator = 1 + z * z / total
+    centre = p + z * z / (2 * total)
+    margin = z * sqrt((p * (1 - p) + z * z / (4 * total)) / total)
+    return max(0.0, (centre - margin) / denominator)
+
+
+def price_value(price, median_price):
+    """價格划算度：等於中位數為 0.5，越便宜越接近 1"""
+    if not price or not median_price:
+        return 0.5
+    value = 0.5 + (median_price - price) / (2 * median_price)
+    return min(1.0, max(0.0, value))
+
+
+def compute_scores():
+    """計算所有飲料的分數，回傳 {drink_id: (score, rating, popularity, value)}"""
+    # 最低價使用 Drink.min_price 欄位（儲存時由 calculate_min_price 計算）
+    rows = Drink.objects.values_list('id', 'tea_type', 'min_price', 'tea_shop__rating', 'favorite_count')
+
+    drinks = []
+    prices_by_tea = {}
+    for drink_id, tea_type, price, shop_rating, favorite_count in rows.iterator(chunk_size=2000):
+        price = float(price) if price else None
+        drinks.append((drink_id, tea_type, price, shop_rating, favorite_count))
+        if price:
+            prices_by_tea.setdefault(tea_type, []).append(price)
+
+    median_by_tea = {tea: statistics.median(prices) for tea, prices in prices_by_tea.items()}
+
+    # 以「有收藏紀錄的使用者數」作為樣本數
+    active_users = Favorite.objects.values('user_id').distinct().count()
+
+    scores = {}
+    for drink_id, tea_type, price, shop_rating, favorite_count in drinks:
+        rating_score = float(shop_rating or 0) / 5
+        popularity_score = wilson_lower_bound(favorite_count, active_users)
+        value_score = price_value(price, median_by_tea.get(tea_type))
+        score = (
+            rating_score * RATING_WEIGHT
+            + popularity_score * POPULARITY_WEIGHT
+            + value_score * VALUE_WEIGHT
+        )
+        scores[drink_id] = tuple(round(x, SCORE_PRECISION) for x in (score, rating_score, popularity_score, value_score))
+    return scores
+
+
+def rebuild():
+    """
+    增量重建排名表：只寫入新增或分數有變動的飲料
+
+    已刪除飲料的排名會隨 CASCADE 一起刪除。
+    """
+    scores = compute_scores()
+    existing = {
+        row[0]: tuple(round(x, SCORE_PRECISION) for x in row[1:])
+        for row in DrinkRanking.objects.values_list(
+            'drink_id', 'score', 'rating_score', 'popularity_score', 'value_score'
+        ).iterator(chunk_size=2000)
+    }
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for drink_id, values in scores.items():
+        score, rating_score, popularity_score, value_score = values
+        ranking = DrinkRanking(
+            drink_id=drink_id,
+            score=score,
+            rating_score=rating_score,
+            popularity_score=popularity_score,
+            value_score=value_score,
+            updated_at=now,
+        )
+        if drink_id not in existing:
+            to_create.append(ranking)
+        elif existing[drink_id] != values:
+            to_update.append(ranking)
+
+    with transaction.atomic():
+        DrinkRanking.objects.bulk_create(to_create, batch_size=500)
+        DrinkRanking.objects.bulk_update(
+            to_update, ['score', 'rating_score', 'popularity_score', 'value_score', 'updated_at'], batch_size=500
+        )
+        # 推薦頁依排名排序，排名有變動時快取改用新的 key
+        if to_create or to_update:
+            catalog.bump()
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'unchanged': len(scores) - len(to_create) - len(to_update),
+    }
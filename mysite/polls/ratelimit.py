@@ -0,0 +1,109 @@
+"""
+AJAX 與搜尋端點的限流（token bucket）
+
+每個 (端點, 使用者或 IP) 一個桶：容量為可連續送出的請求數，依每分鐘補充數持續補回；
+沒有 token 時回傳 429 與 Retry-After（秒）。設定見 settings.RATE_LIMITS。
+
+桶存放在行程內的 dict，以一把鎖完成「補充 + 扣除」，每個請求不需要額外的快取或資料庫往返；
+多個 worker 行程時各自計算，單一用戶端最多取得 worker 數倍的額度，但仍無法佔滿所有 worker。
+"""
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from . import metrics
+
+
+# 最多保留的桶數，超過時淘汰最久未使用的桶（等同於桶已補滿）
+MAX_BUCKETS = 10000
+
+MESSAGE = '請求過於頻繁，請稍後再試'
+
+_buckets = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_limit(endpoint):
+    """回傳 (容量, 每秒補充數)；未設定或已停用時為 None"""
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return None
+    limit = getattr(settings, 'RATE_LIMITS', {}).get(endpoint)
+    if not limit:
+        return None
+    capacity, per_minute = limit
+    return capacity, per_minute / 60
+
+
+def take(key, capacity, rate, now=None):
+    """
+    從桶中取一個 token，回傳 0（允許）或需要等待的秒數
+
+    新的桶是滿的；補充量依距離上次請求的時間計算，不超過容量。
+    """
+    now = time.monotonic() if now is None else now
+    with _lock:
+        tokens, updated_at = _buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / rate
+        _buckets[key] = (tokens, now)
+        if len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    return wait
+
+
+def client_key(request, user):
+    """登入使用者以帳號區分，匿名使用者以 IP 區分"""
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def limited_response(request, endpoint, wait):
+    metrics.inc('polls_rate_limited_total', {'endpoint': endpoint})
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = JsonResponse({'success': False, 'message': MESSAGE}, status=429)
+    else:
+        response = HttpResponse(f'{MESSAGE}。', status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def rate_limit(endpoint):
+    """
+    限流裝飾器（同步與 async view 皆可），額度為 settings.RATE_LIMITS[endpoint]
+
+    同一端點的所有請求共用 endpoint 名稱的桶，未設定額度的端點不限流。
+    """
+    def check(request, user):
+        limit = get_limit(endpoint)
+        if limit is None:
+            return None
+        wait = take((endpoint, client_key(request, user)), *limit)
+        return limited_response(request, endpoint, wait) if wait else None
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                response = check(request, await request.auser())
+                if response is not None:
+                    return response
+                return await view(request, *args, **kwargs)
+        else:
+            def wrapper(request, *args, **kwargs):
+                response = check(request, request.user)
+                if response is not None:
+                    return response
+                return view(request, *args, **kwargs)
+
+        return functools.wraps(view)(wrapper)
+    return decorator
@@ -0,0 +1,182 @@
+"""
+收藏共現推薦（item-to-item）
+
+離線：逐位使用者讀取收藏（依 user_id 排序串流，不一次載入），累計任兩個項目
+（店家或飲料）被同一人收藏的次數，得到稀疏的共現矩陣；相似度為
+cosine = 共同收藏人數 / sqrt(收藏 A 人數 × 收藏 B 人數)，再依共同人數收縮，
+每個項目只保留前 NEIGHBORS 個相似項目寫入 ItemSimilarity。
+
+線上：依 (item_type, item_id, -score) 索引取出預先算好的相似項目。
+"""
+import heapq
+from collections import Counter, defaultdict
+from itertools import groupby
+from math import sqrt
+from operator import itemgetter
+
+from django.db import transaction
+from django.db.models import Q, Sum
+
+from .models import Drink, Favorite, ItemSimilarity, TeaShop
+
+
+NEIGHBORS = 20
+
+# 單一使用者只取最近的 N 筆收藏，避免少數重度使用者產生 O(N²) 組合
+MAX_ITEMS_PER_USER = 200
+
+# 共同收藏人數少時降低相似度：score × co / (co + SHRINKAGE)
+SHRINKAGE = 2
+
+# 共同收藏人數低於此值的組合不列入
+MIN_CO_COUNT = 1
+
+# 兩個項目編號合併成單一整數作為 Counter 的 key，比 tuple 省記憶體
+_PAIR_SHIFT = 32
+
+
+def favorite_baskets(max_items=MAX_ITEMS_PER_USER):
+    """依使用者產生收藏項目清單 [(item_type, item_id), ...]（最近收藏優先）"""
+    rows = (
+        Favorite.objects.order_by('user_id', '-created_at', '-id')
+        .values_list('user_id', 'favorite_type', 'tea_shop_id', 'drink_id')
+        .iterator(chunk_size=5000)
+    )
+    for _, group in groupby(rows, key=itemgetter(0)):
+        items = []
+        seen = set()
+        for _, favorite_type, shop_id, drink_id in group:
+            item = ('shop', shop_id) if favorite_type == 'shop' else ('drink', drink_id)
+            if item[1] is None or item in seen:
+                continue
+            seen.add(item)
+            items.append(item)
+            if len(items) >= max_items:
+                break
+        yield items
+
+
+def build(neighbors=NEIGHBORS, max_items=MAX_ITEMS_PER_USER, shards=1):
+    """
+    重建 ItemSimilarity 表
+
+    shards > 1 時把項目組合分成多組，每組重新串流一次收藏資料，只累計該組的共現次數，
+    共現計數的記憶體約為 1 / shards（代價是多讀幾次資料）；相似項目 heap 的大小固定為 項目數 × N。
+    回傳 {'users', 'items', 'pairs', 'rows'}。
+    """
+    item_index = {}
+    item_counts = Counter()
+    heaps = defaultdict(list)
+    users = 0
+    pairs = 0
+
+    for shard in range(shards):
+        pair_counts = Counter()
+        for basket in favorite_baskets(max_items):
+            indexes = sorted(item_index.setdefault(item, len(item_index)) for item in basket)
+            if shard == 0:
+                users += 1
+                item_counts.update(indexes)
+            for position, a in enumerate(indexes):
+                for b in indexes[position + 1:]:
+                    if (a + b) % shards == shard:
+                        pair_counts[(a << _PAIR_SHIFT) | b] += 1
+
+        pairs += len(pair_counts)
+        _push_neighbors(heaps, pair_counts, item_counts, neighbors)
+        del pair_counts
+
+    items = list(item_index)
+    rows = []
+    for item, heap in heaps.items():
+        item_type, item_id = items[item]
+        for score, co_count, neighbor in heap:
+            neighbor_type, neighbor_id = items[neighbor]
+            rows.append(ItemSimilarity(
+                item_type=item_type,
+                item_id=item_id,
+                neighbor_type=neighbor_type,
+                neighbor_id=neighbor_id,
+                score=score,
+                co_count=co_count,
+            ))
+
+    with transaction.atomic():
+        ItemSimilarity.objects.all().delete()
+        ItemSimilarity.objects.bulk_create(rows, batch_size=1000)
+
+    return {
+        'users': users,
+        'items': len(item_index),
+        'pairs': pairs,
+        'rows': len(rows),
+    }
+
+
+def _push_neighbors(heaps, pair_counts, item_counts, neighbors):
+    """把共現組合的相似度放入兩個項目各自的 heap（每個 heap 只保留前 N 個）"""
+    mask = (1 << _PAIR_SHIFT) - 1
+    for pair, co_count in pair_counts.items():
+        if co_count < MIN_CO_COUNT:
+            continue
+        a, b = pair >> _PAIR_SHIFT, pair & mask
+        score = co_count / sqrt(item_counts[a] * item_counts[b]) * co_count / (co_count + SHRINKAGE)
+        for item, neighbor in ((a, b), (b, a)):
+            heap = heaps[item]
+            entry = (score, co_count, neighbor)
+            if len(heap) < neighbors:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+
+def also_liked(item_type, item_id, limit=10):
+    """收藏此項目的人也收藏了…（依相似度由高到低）"""
+    rows = (
+        ItemSimilarity.objects.filter(item_type=item_type, item_id=item_id)
+        .order_by('-score')
+        .values_list('neighbor_type', 'neighbor_id', 'score')[:limit]
+    )
+    return resolve(rows)
+
+
+def for_user(favorite_items, limit=10):
+    """
+    依使用者目前的收藏推薦（加總各收藏項目的相似項目分數，排除已收藏的項目）
+
+    favorite_items 為 [(item_type, item_id), ...]。
+    """
+    owned = set(favorite_items)
+    if not owned:
+        return []
+
+    shop_ids = [item_id for item_type, item_id in owned if item_type == 'shop']
+    drink_ids = [item_id for item_type, item_id in owned if item_type == 'drink']
+    rows = (
+        ItemSimilarity.objects.filter(
+            Q(item_type='shop', item_id__in=shop_ids) | Q(item_type='drink', item_id__in=drink_ids)
+        )
+        .order_by()
+        .values('neighbor_type', 'neighbor_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'neighbor_type', 'neighbor_id')
+        .values_list('neighbor_type', 'neighbor_id', 'total')[:limit + len(owned)]
+    )
+    rows = [row for row in rows if (row[0], row[1]) not in owned][:limit]
+    return resolve(rows)
+
+
+def resolve(rows):
+    """[(type, id, score), ...] -> [{'type', 'object', 'score'}, ...]，略過已刪除的項目"""
+    rows = list(rows)
+    shops = TeaShop.objects.in_bulk([item_id for item_type, item_id, _ in rows if item_type == 'shop'])
+    drinks = Drink.objects.select_related('tea_shop').in_bulk(
+        [item_id for item_type, item_id, _ in rows if item_type == 'drink']
+    )
+
+    results = []
+    for item_type, item_id, score in rows:
+        obj = shops.get(item_id) if item_type == 'shop' else drinks.get(item_id)
+        if obj is not None:
+            results.append({'type': item_type, 'object': obj, 'score': score})
+    return results
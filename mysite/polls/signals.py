@@ -0,0 +1,72 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog, favorites, menu_stats, opening_hours, snapshot
+from .models import Drink, Favorite, TeaShop
+
+
+def favorite_target(favorite):
+    """回傳收藏對應的 (model, id)"""
+    if favorite.favorite_type == 'shop':
+        return TeaShop, favorite.tea_shop_id
+    return Drink, favorite.drink_id
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorite_count(sender, instance, created, **kwargs):
+    """新增收藏時累加收藏人數（與建立收藏在同一交易內；批次收藏期間改由結束後統一重算）"""
+    if not created or favorites.is_deferred():
+        return
+    model, pk = favorite_target(instance)
+    if pk:
+        model.objects.filter(pk=pk).update(favorite_count=F('favorite_count') + 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorite_count(sender, instance, **kwargs):
+    """刪除收藏時（包含使用者被刪除的 CASCADE）扣回收藏人數"""
+    if favorites.is_deferred():
+        return
+    model, pk = favorite_target(instance)
+    if pk:
+        model.objects.filter(pk=pk, favorite_count__gt=0).update(favorite_count=F('favorite_count') - 1)
+
+
+@receiver(post_save, sender=Drink)
+@receiver(post_delete, sender=Drink)
+def refresh_shop_menu_stats(sender, instance, **kwargs):
+    """飲料異動時重算所屬店家的菜單統計（批次匯入期間改由匯入結束後統一重算）"""
+    if menu_stats.is_deferred():
+        return
+    menu_stats.refresh([instance.tea_shop_id])
+
+
+@receiver(post_save, sender=TeaShop)
+def compile_shop_opening_hours(sender, instance, update_fields=None, **kwargs):
+    """店家營業時間變更時重新編譯營業時段"""
+    if update_fields is not None and 'opening_hours' not in update_fields:
+        return
+    opening_hours.compile_shop(instance)
+
+
+@receiver(post_save, sender=TeaShop)
+@receiver(post_delete, sender=TeaShop)
+@receiver(post_save, sender=Drink)
+@receiver(post_delete, sender=Drink)
+def schedule_snapshot_build(sender, instance, **kwargs):
+    """店家或飲料異動時排入目錄快照重建（批次匯入期間改由匯入結束後重建）"""
+    if menu_stats.is_deferred():
+        return
+    snapshot.schedule()
+
+
+@receiver(post_save, sender=TeaShop)
+@receiver(post_delete, sender=TeaShop)
+@receiver(post_save, sender=Drink)
+@receiver(post_delete, sender=Drink)
+def bump_catalog_version(sender, instance, **kwargs):
+    """店家或飲料異動時遞增目錄版本，快取改用新的 key（批次作業期間改由結束後遞增一次）"""
+    if menu_stats.is_deferred():
+        return
+    catalog.bump()
@@ -0,0 +1,343 @@
+"""
+唯讀的二進位目錄快照（店家、飲料、座標、營業時段），各 worker 以 mmap 共用
+
+- build(): 從資料庫產生快照檔；內容未變時不改寫，有變動時寫入暫存檔後以 os.replace 原子替換
+- current(): 回傳目前的 Snapshot（沒有快照檔時為 None）；每 CATALOG_SNAPSHOT_CHECK_INTERVAL 秒
+  以 os.stat 檢查檔案是否被替換，有新版本時切換（進行中的請求仍使用舊的 mmap）
+
+檔案格式（little-endian）：標頭、區段目錄，之後為各欄位的連續陣列（struct-of-arrays，8 位元組對齊），
+讀取時直接以 memoryview.cast() 對應到 mmap，不複製、不反序列化；開檔只需讀取標頭，
+頁面由作業系統的 page cache 在各 worker 間共用，常駐記憶體不隨目錄大小成長。
+店家依緯度排序，半徑查詢以二分搜尋取出緯度範圍，再計算精確距離。
+"""
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from . import drink_csv
+from .geo import bounding_box, calculate_distance
+
+
+MAGIC = b'MTSNAP\x00\x01'
+FORMAT_VERSION = 1
+
+# 標頭：magic, 格式版本, 區段數, 目錄版本（內容雜湊）, 建立時間
+HEADER = struct.Struct('<8sII16sd')
+# 區段目錄：名稱, offset, 長度
+SECTION = struct.Struct('<24sQQ')
+
+# 區段名稱 -> memoryview.cast 的格式；*_start 為 n+1 筆的起訖索引
+SECTIONS = {
+    'shop_id': 'q',
+    'shop_lat': 'd',
+    'shop_lng': 'd',
+    'shop_rating': 'f',
+    'shop_name_start': 'I',
+    'shop_period_start': 'I',
+    'shop_drink_start': 'I',
+    'id_order': 'q',  # 依店家 id 排序的 id
+    'id_index': 'I',  # id_order 對應的店家索引
+    'period_weekday': 'B',
+    'period_open': 'H',
+    'period_close': 'H',
+    'drink_id': 'q',
+    'drink_min_price': 'i',  # 沒有價格時為 -1
+    'drink_milk': 'B',
+    'drink_tea': 'B',
+    'drink_topping': 'B',
+    'drink_name_start': 'I',
+    'shop_names': 'B',  # UTF-8 字串區
+    'drink_names': 'B',
+}
+
+# 代碼 <-> 位元組；0 表示未填
+MILK_CODES = [None, *drink_csv.MILK_TYPES.values(), 'none']
+TEA_CODES = [None, *drink_csv.TEA_TYPES.values()]
+TOPPING_CODES = [None, *drink_csv.TOPPINGS.values()]
+
+
+def _encode(codes, value):
+    try:
+        return codes.index(value)
+    except ValueError:
+        return 0
+
+
+def _version(body):
+    return hashlib.blake2b(body, digest_size=8).hexdigest().encode('ascii')
+
+
+def build(path=None):
+    """
+    從資料庫產生快照，回傳 (版本, 是否寫入新檔)
+
+    內容與現有快照相同時不改寫檔案，各 worker 不需要切換。
+    """
+    from .models import Drink, OpeningPeriod, TeaShop
+
+    path = path or settings.CATALOG_SNAPSHOT_PATH
+    columns = {name: [] for name in SECTIONS}
+    shop_names = bytearray()
+    drink_names = bytearray()
+
+    periods = {}
+    for shop_id, weekday, open_minute, close_minute in OpeningPeriod.objects.order_by(
+        'tea_shop_id', 'weekday', 'open_minute'
+    ).values_list('tea_shop_id', 'weekday', 'open_minute', 'close_minute').iterator(chunk_size=5000):
+        periods.setdefault(shop_id, []).append((weekday, open_minute, close_minute))
+
+    drinks = {}
+    for row in Drink.objects.order_by('tea_shop_id', 'min_price', 'pk').values_list(
+        'tea_shop_id', 'pk', 'name', 'min_price', 'milk_type', 'tea_type', 'topping'
+    ).iterator(chunk_size=5000):
+        drinks.setdefault(row[0], []).append(row[1:])
+
+    shops = TeaShop.objects.order_by('latitude', 'pk').values_list('pk', 'name', 'latitude', 'longitude', 'rating')
+    for shop_id, name, latitude, longitude, rating in shops.iterator(chunk_size=5000):
+        columns['shop_id'].append(shop_id)
+        columns['shop_lat'].append(float(latitude))
+        columns['shop_lng'].append(float(longitude))
+        columns['shop_rating'].append(float(rating))
+        columns['shop_name_start'].append(len(shop_names))
+        shop_names.extend(name.encode('utf-8'))
+        columns['shop_period_start'].append(len(columns['period_weekday']))
+        for weekday, open_minute, close_minute in periods.get(shop_id, []):
+            columns['period_weekday'].append(weekday)
+            columns['period_open'].append(open_minute)
+            columns['period_close'].append(close_minute)
+        columns['shop_drink_start'].append(len(columns['drink_id']))
+        for drink_id, drink_name, min_price, milk_type, tea_type, topping in drinks.get(shop_id, []):
+            columns['drink_id'].append(drink_id)
+            columns['drink_min_price'].append(-1 if min_price is None else int(min_price))
+            columns['drink_milk'].append(_encode(MILK_CODES, milk_type))
+            columns['drink_tea'].append(_encode(TEA_CODES, tea_type))
+            columns['drink_topping'].append(_encode(TOPPING_CODES, topping))
+            columns['drink_name_start'].append(len(drink_names))
+            drink_names.extend(drink_name.encode('utf-8'))
+
+    # 起訖索引多一筆結尾
+    columns['shop_name_start'].append(len(shop_names))
+    columns['shop_period_start'].append(len(columns['period_weekday']))
+    columns['shop_drink_start'].append(len(columns['drink_id']))
+    columns['drink_name_start'].append(len(drink_names))
+    by_id = sorted(range(len(columns['shop_id'])), key=columns['shop_id'].__getitem__)
+    columns['id_order'] = [columns['shop_id'][index] for index in by_id]
+    columns['id_index'] = by_id
+    columns['shop_names'] = shop_names
+    columns['drink_names'] = drink_names
+
+    # 區段內容
+    blobs = []
+    for name, fmt in SECTIONS.items():
+        values = columns[name]
+        blob = bytes(values) if isinstance(values, bytearray) else struct.pack(f'<{len(values)}{fmt}', *values)
+        blobs.append((name, blob))
+    body = b''.join(blob for _, blob in blobs)
+    version = _version(body)
+
+    existing = _read_header(path)
+    if existing is not None and existing[0] == version:
+        return version.decode(), False
+
+    # 版本標頭與區段目錄
+    offset = HEADER.size + SECTION.size * len(blobs)
+    offset += -offset % 8
+    directory = []
+    for name, blob in blobs:
+        directory.append(SECTION.pack(name.encode('ascii'), offset, len(blob)))
+        offset += len(blob) + (-len(blob) % 8)
+
+    directory_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', dir=directory_dir)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(blobs), version, time.time()))
+            file.write(b''.join(directory))
+            file.write(b'\x00' * (-file.tell() % 8))
+            for _, blob in blobs:
+                file.write(blob)
+                file.write(b'\x00' * (-len(blob) % 8))
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return version.decode(), True
+
+
+def is_enabled():
+    """已設定快照路徑且快照檔存在（部署時執行過 build_snapshot）"""
+    path = getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+    return bool(path) and os.path.exists(path)
+
+
+def refresh():
+    """匯入後重建快照（未啟用時略過），回傳 build() 的結果或 None"""
+    if not is_enabled():
+        return None
+    return build()
+
+
+def schedule():
+    """交易 commit 後排入 build_snapshot 工作（已在佇列中時不重複）"""
+    if not is_enabled():
+        return
+    from django.db import transaction
+    from . import jobs
+    transaction.on_commit(lambda: jobs.enqueue('build_snapshot'))
+
+
+def _read_header(path):
+    """回傳 (版本, 建立時間)；檔案不存在或格式不符時為 None"""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, format_version, _, version, built_at = HEADER.unpack(data)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        return None
+    return version, built_at
+
+
+def _string(blob, starts, index):
+    return bytes(blob[starts[index]:starts[index + 1]]).decode('utf-8')
+
+
+class Snapshot:
+    """以 mmap 開啟的快照；所有欄位都是指向 mmap 的 memoryview"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, format_version, count, version, built_at = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f'不支援的快照格式: {path}')
+        self.version = version.decode('ascii')
+        self.built_at = built_at
+
+        for index in range(count):
+            name, offset, size = SECTION.unpack_from(view, HEADER.size + SECTION.size * index)
+            name = name.rstrip(b'\x00').decode('ascii')
+            if name in SECTIONS:
+                setattr(self, name, view[offset:offset + size].cast(SECTIONS[name]))
+
+    def __len__(self):
+        return len(self.shop_id)
+
+
+    def shop_index(self, shop_id):
+        """店家 id -> 索引（不存在時為 None）"""
+        position = bisect.bisect_left(self.id_order, shop_id)
+        if position < len(self.id_order) and self.id_order[position] == shop_id:
+            return self.id_index[position]
+        return None
+
+    def shop_name(self, index):
+        return _string(self.shop_names, self.shop_name_start, index)
+
+    def is_open(self, index, now=None):
+        """與 opening_hours.open_now_exists 相同的營業中判斷"""
+        now = now or datetime.now()
+        weekday = now.weekday()
+        minute = now.hour * 60 + now.minute
+        exact = not (now.second or now.microsecond)
+        for period in range(self.shop_period_start[index], self.shop_period_start[index + 1]):
+            if self.period_weekday[period] != weekday or self.period_open[period] > minute:
+                continue
+            close = self.period_close[period]
+            if close > minute or (exact and close == minute):
+                return True
+        return False
+
+    def shops_within(self, lat, lng, radius_km, open_now=False, now=None):
+        """
+        半徑內的店家，回傳 [(店家 id, 距離公里), ...]（依距離排序）
+
+        以緯度二分搜尋取出範圍，經度範圍預篩後才計算 Haversine 距離。
+        """
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        start = bisect.bisect_left(self.shop_lat, min_lat)
+        end = bisect.bisect_right(self.shop_lat, max_lat)
+        results = []
+        for index in range(start, end):
+            shop_lng = self.shop_lng[index]
+            if not min_lng <= shop_lng <= max_lng:
+                continue
+            if open_now and not self.is_open(index, now):
+                continue
+            distance = calculate_distance(lat, lng, self.shop_lat[index], shop_lng)
+            if distance <= radius_km:
+                results.append((self.shop_id[index], distance))
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def drinks(self, index):
+        """店家的飲料，依最低價排序：[(飲料 id, 名稱, 最低價或 None, 奶類, 茶類, 配料), ...]"""
+        results = []
+        for drink in range(self.shop_drink_start[index], self.shop_drink_start[index + 1]):
+            price = self.drink_min_price[drink]
+            results.append((
+                self.drink_id[drink],
+                _string(self.drink_names, self.drink_name_start, drink),
+                None if price < 0 else price,
+                MILK_CODES[self.drink_milk[drink]],
+                TEA_CODES[self.drink_tea[drink]],
+                TOPPING_CODES[self.drink_topping[drink]],
+            ))
+        return results
+
+
+_lock = threading.Lock()
+_current = None
+_stat = None
+_checked_at = 0.0
+
+
+def current():
+    """
+    目前的快照（沒有設定 CATALOG_SNAPSHOT_PATH 或檔案不存在時為 None）
+
+    每個 worker 只在檔案被替換（inode / mtime 改變）時重新 mmap；
+    舊的快照由仍在使用的請求持有，不再被參照後自動解除對應。
+    """
+    global _current, _stat, _checked_at
+
+    path = getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+    if not path:
+        return None
+    now = time.monotonic()
+    if now - _checked_at < settings.CATALOG_SNAPSHOT_CHECK_INTERVAL:
+        return _current
+
+    with _lock:
+        if now - _checked_at < settings.CATALOG_SNAPSHOT_CHECK_INTERVAL:
+            return _current
+        _checked_at = now
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _current, _stat = None, None
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != _stat:
+            try:
+                _current = Snapshot(path)
+            except (OSError, ValueError, struct.error):
+                _current = None
+            _stat = key
+    return _current
@@ -0,0 +1,21 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+
+from polls import images
+
+
+register = template.Library()
+
+
+@register.filter
+def shop_image_url(place_id):
+    """店家照片網址，沒有照片時回傳空字串（樣板改顯示佔位圖）"""
+    path = images.shop_image(place_id)
+    if not path:
+        return ''
+    try:
+        return static(path)
+    except ValueError:
+        # collectstatic 之後才下載的照片不在 manifest 中，改用未帶雜湊的網址
+        return settings.STATIC_URL + path
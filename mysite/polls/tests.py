@@ -1,3 +1,686 @@
-from django.test import TestCase
+import io
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import catalog, favorites, jobs, metrics, ratelimit
+from .cache import get_cache, get_or_compute, single_flight
+from .drink_search import MAX_RADIUS_KM
+from .middleware import MetricsMiddleware, NPlusOneMiddleware, QueryCounter, QueryRecorder, wrap_queries
+from .models import Drink, DrinkStaging, Favorite, ImportFile, Job, TeaShop
+
+
+# 測試不執行 collectstatic，樣板改用未帶雜湊的靜態檔網址
+PLAIN_STATIC_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class AsyncQueryWrapperTests(TestCase):
+    """async view 的 ORM 查詢在 sync_to_async 的執行緒上執行，仍需被 middleware 記錄"""
+
+    @classmethod
+    def setUpTestData(cls):
+        TeaShop.objects.create(
+            name='測試茶飲', address='台北市', latitude=25.02, longitude=121.53, rating=4.5,
+        )
+
+    async def test_wrap_queries_sees_sync_to_async_queries(self):
+        counter = QueryCounter()
+        with wrap_queries(counter):
+            await sync_to_async(TeaShop.objects.count)()
+            await TeaShop.objects.acount()
+        self.assertEqual(counter.count, 2)
+
+    async def test_wrappers_do_not_leak_outside_block(self):
+        counter = QueryCounter()
+        with wrap_queries(counter):
+            pass
+        await TeaShop.objects.acount()
+        self.assertEqual(counter.count, 0)
+
+    async def test_metrics_middleware_counts_async_view_queries(self):
+        counts = []
+
+        def build_batch(middleware, request, response, duration, query_count):
+            counts.append(query_count)
+            return metrics.Batch()  # 不寫入指標檔
+
+        with mock.patch.object(MetricsMiddleware, 'build_batch', build_batch):
+            response = await self.async_client.get(reverse('nearby_shops'), {'lat': '25.02', 'lng': '121.53'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(counts), 1)
+        self.assertGreater(counts[0], 0)
+
+    @override_settings(NPLUSONE_ENABLED=True)
+    async def test_nplusone_middleware_records_async_view_queries(self):
+        totals = []
+
+        def check(middleware, request, recorder):
+            totals.append(recorder.total)
+
+        with mock.patch.object(NPlusOneMiddleware, 'check', check):
+            response = await self.async_client.get(reverse('nearby_shops'), {'lat': '25.02', 'lng': '121.53'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(totals), 1)
+        self.assertGreater(totals[0], 0)
+
+    def test_sync_queries_are_still_recorded(self):
+        recorder = QueryRecorder()
+        with wrap_queries(recorder):
+            TeaShop.objects.count()
+        self.assertEqual(recorder.total, 1)
+
+
+def run_concurrently(target, count=2):
+    """以 count 個執行緒同時執行 target(index)，回傳各執行緒的結果（例外也視為結果）"""
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    return results
+
+
+class FavoriteRaceTests(TransactionTestCase):
+    """同一使用者同時收藏同一項目（雙擊、重送）只會留下一筆收藏"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('racer', password='x')
+        self.shop = TeaShop.objects.create(
+            place_id='race-shop', name='測試茶飲', address='台北市', latitude=25.02, longitude=121.53, rating=4.5,
+        )
+        self.drink = Drink.objects.create(tea_shop=self.shop, name='珍珠奶茶', has_medium=True, price_medium=50)
+        self.targets = {
+            'shop': {'favorite_type': 'shop', 'tea_shop': self.shop, 'drink': None},
+            'drink': {'favorite_type': 'drink', 'drink': self.drink, 'tea_shop': None},
+        }
+
+    def racing_get(self, barrier):
+        """get_or_create 第一次查詢沒找到時等待另一個執行緒，確保兩邊都會嘗試 INSERT"""
+        original = QuerySet.get
+        waited = threading.local()
+
+        def get(queryset, *args, **kwargs):
+            try:
+                return original(queryset, *args, **kwargs)
+            except Favorite.DoesNotExist:
+                if queryset.model is Favorite and not getattr(waited, 'done', False):
+                    waited.done = True
+                    barrier.wait(timeout=10)
+                raise
+
+        return mock.patch.object(QuerySet, 'get', get)
+
+    def assert_single_favorite(self, favorite_type, results):
+        self.assertEqual(Favorite.objects.filter(user=self.user, favorite_type=favorite_type).count(), 1)
+        for result in results:
+            self.assertNotIsInstance(result, Exception)
+        # 兩個執行緒拿到同一筆收藏，只有一個是新建立的
+        self.assertEqual(len({favorite.pk for favorite, _ in results}), 1)
+        self.assertEqual(sorted(created for _, created in results), [False, True])
+
+    def test_concurrent_get_or_create(self):
+        for favorite_type, fields in self.targets.items():
+            with self.subTest(favorite_type=favorite_type):
+                barrier = threading.Barrier(2)
+                with self.racing_get(barrier):
+                    results = run_concurrently(
+                        lambda index: Favorite.objects.get_or_create(user=self.user, **fields)
+                    )
+                self.assert_single_favorite(favorite_type, results)
+
+    def test_concurrent_aget_or_create(self):
+        for favorite_type, fields in self.targets.items():
+            with self.subTest(favorite_type=favorite_type):
+                barrier = threading.Barrier(2)
+                with self.racing_get(barrier):
+                    async def aget_or_create(index):
+                        return await Favorite.objects.aget_or_create(user=self.user, **fields)
+
+                    results = run_concurrently(async_to_sync(aget_or_create))
+                self.assert_single_favorite(favorite_type, results)
+
+    def test_concurrent_create_raises_integrity_error(self):
+        for favorite_type, fields in self.targets.items():
+            with self.subTest(favorite_type=favorite_type):
+                barrier = threading.Barrier(2)
+
+                def create(index):
+                    barrier.wait(timeout=10)
+                    with transaction.atomic():
+                        return Favorite.objects.create(user=self.user, **fields)
+
+                results = run_concurrently(create)
+                self.assertEqual(sum(isinstance(result, IntegrityError) for result in results), 1)
+                self.assertEqual(Favorite.objects.filter(user=self.user, favorite_type=favorite_type).count(), 1)
+
+    def test_other_type_is_not_a_duplicate(self):
+        Favorite.objects.create(user=self.user, **self.targets['shop'])
+        Favorite.objects.create(user=self.user, **self.targets['drink'])
+        other = User.objects.create_user('other', password='x')
+        Favorite.objects.create(user=other, **self.targets['shop'])
+        self.assertEqual(Favorite.objects.count(), 3)
+
+    def test_batch_add_reports_concurrent_favorite_as_exists(self):
+        original = QuerySet.in_bulk
+
+        def in_bulk(queryset, *args, **kwargs):
+            # 批次收藏讀取既有收藏之後，另一個請求搶先收藏了同一家店
+            if queryset.model is TeaShop and not Favorite.objects.filter(user=self.user).exists():
+                Favorite.objects.create(user=self.user, **self.targets['shop'])
+                TeaShop.objects.filter(pk=self.shop.pk).update(favorite_count=1)
+            return original(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'in_bulk', in_bulk):
+            results = favorites.apply(self.user, add={'shop': [self.shop.pk], 'drink': [self.drink.pk]})
+
+        self.assertEqual({item['type']: item['result'] for item in results}, {'shop': 'exists', 'drink': 'added'})
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 2)
+        self.shop.refresh_from_db()
+        self.drink.refresh_from_db()
+        self.assertEqual((self.shop.favorite_count, self.drink.favorite_count), (1, 1))
+
+
+class FavoriteDedupMigrationTests(TransactionTestCase):
+    """0020：加上唯一索引前先合併既有的重複收藏"""
+
+    before = [('polls', '0019_import_fingerprints')]
+    after = [('polls', '0020_favorite_unique_per_type')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user_model = apps.get_model('auth', 'User')
+        shop_model = apps.get_model('polls', 'TeaShop')
+        drink_model = apps.get_model('polls', 'Drink')
+        self.favorite_model = apps.get_model('polls', 'Favorite')
+
+        self.user = user_model.objects.create(username='dup')
+        self.shop = shop_model.objects.create(
+            place_id='dup-shop', name='測試茶飲', address='台北市', latitude=25.02, longitude=121.53, rating=4.5,
+            opening_hours='', favorite_count=3,
+        )
+        self.drink = drink_model.objects.create(tea_shop=self.shop, name='珍珠奶茶', favorite_count=2)
+        create = self.favorite_model.objects.create
+        self.kept_shop = create(user=self.user, favorite_type='shop', tea_shop=self.shop)
+        create(user=self.user, favorite_type='shop', tea_shop=self.shop, notes='舊備註')
+        create(user=self.user, favorite_type='shop', tea_shop=self.shop, notes='新備註')
+        self.kept_drink = create(user=self.user, favorite_type='drink', drink=self.drink, notes='少冰')
+        create(user=self.user, favorite_type='drink', drink=self.drink, notes='去冰')
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_dedup_keeps_oldest_and_recounts(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+
+        shop_favorites = list(Favorite.objects.filter(favorite_type='shop').values_list('pk', 'notes'))
+        drink_favorites = list(Favorite.objects.filter(favorite_type='drink').values_list('pk', 'notes'))
+        # 保留最早的一筆；沒有備註時沿用最新一筆重複收藏的備註，已有備註則不變
+        self.assertEqual(shop_favorites, [(self.kept_shop.pk, '新備註')])
+        self.assertEqual(drink_favorites, [(self.kept_drink.pk, '少冰')])
+        self.assertEqual(TeaShop.objects.get(pk=self.shop.pk).favorite_count, 1)
+        self.assertEqual(Drink.objects.get(pk=self.drink.pk).favorite_count, 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Favorite.objects.create(user_id=self.user.pk, favorite_type='shop', tea_shop_id=self.shop.pk)
+
+
+class MetricsBufferTests(SimpleTestCase):
+    """計數先累加在行程記憶體，定期或累積一定批數後才寫入指標檔"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(METRICS_DB=Path(directory.name) / 'metrics.sqlite3', METRICS_FLUSH_EVERY=3)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.flush_pending()  # 先前測試留下的計數
+        # 背景執行緒呼叫的是模組內的 flush_pending，測試期間改由測試自行寫入
+        self.flush = metrics.flush_pending
+        patcher = mock.patch.object(metrics, 'flush_pending', lambda: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self, name):
+        return dict(metrics.get_connection().execute(
+            'SELECT labels, value FROM samples WHERE name = ?', [name]
+        ).fetchall())
+
+    def test_counts_are_buffered_until_flush(self):
+        metrics.inc('polls_rate_limited_total', {'endpoint': 'test'})
+        metrics.inc('polls_rate_limited_total', {'endpoint': 'test'}, 2)
+        self.assertEqual(self.stored('polls_rate_limited_total'), {})
+        self.flush()
+        self.assertEqual(self.stored('polls_rate_limited_total'), {'endpoint="test"': 3})
+
+    def test_writes_after_flush_every_batches(self):
+        with mock.patch.object(metrics, 'flush_pending', self.flush):
+            for _ in range(3):
+                metrics.record_cache('test', hit=True)
+        self.assertEqual(self.stored('polls_cache_requests_total'), {'cache="test",result="hit"': 3})
+
+    def test_record_job_writes_immediately(self):
+        metrics.record_job('test_job', items={'created': 2})
+        self.assertEqual(self.stored('polls_jobs_total'), {'job="test_job",outcome="success"': 1})
+
+    def test_static_requests_are_not_recorded(self):
+        middleware = MetricsMiddleware(lambda request: HttpResponse())
+        middleware(RequestFactory().get('/static/css/base.css'))
+        self.assertFalse(metrics._pending)
+        middleware(RequestFactory().get('/'))
+        self.assertTrue(metrics._pending)
+        self.flush()
+
+
+class CheapestNearbyValidationTests(TestCase):
+    """附近最便宜飲料的座標與半徑檢查"""
+
+    def test_invalid_parameters_return_400(self):
+        url = reverse('cheapest_nearby_drinks')
+        for params in (
+            {'lat': 'inf', 'lng': '1'},
+            {'lat': 'nan', 'lng': '1'},
+            {'lat': '95', 'lng': '121.53'},
+            {'lat': '25.02', 'lng': '-181'},
+            {'lat': '25.02', 'lng': '121.53', 'radius': '0'},
+            {'lat': '25.02', 'lng': '121.53', 'radius': '-1'},
+            {'lat': '25.02', 'lng': '121.53', 'radius': 'inf'},
+        ):
+            with self.subTest(**params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+
+    def test_radius_is_clamped(self):
+        response = self.client.get(reverse('cheapest_nearby_drinks'), {'lat': '25.02', 'lng': '121.53', 'radius': '1000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['radius'], MAX_RADIUS_KM)
+
+
+class JobQueueTests(TestCase):
+    """背景工作佇列：重複排入、取得、失敗重試與中止工作重新排入"""
+
+    def test_enqueue_deduplicates_active_jobs(self):
+        job, created = jobs.enqueue('import_drinks', ['a.csv'])
+        self.assertTrue(created)
+        again, created = jobs.enqueue('import_drinks', ['a.csv'])
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+        self.assertTrue(jobs.enqueue('import_drinks', ['b.csv'])[1])
+        # 完成後可再次排入
+        Job.objects.filter(pk=job.pk).update(status='succeeded')
+        self.assertTrue(jobs.enqueue('import_drinks', ['a.csv'])[1])
+
+    def test_enqueue_rejects_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('drop_tables')
+
+    def test_claim_respects_group_concurrency(self):
+        first, _ = jobs.enqueue('import_drinks', ['a.csv'])
+        jobs.enqueue('import_teashops')
+        rebuild, _ = jobs.enqueue('rebuild_rankings')
+
+        claimed = jobs.claim('w1')
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual((claimed.status, claimed.worker, claimed.attempts), ('running', 'w1', 1))
+        # import group 已滿，只能取得其他 group 的工作
+        self.assertEqual(jobs.claim('w2').pk, rebuild.pk)
+        self.assertIsNone(jobs.claim('w3'))
+
+    def test_claim_skips_jobs_not_yet_due(self):
+        job, _ = jobs.enqueue('rebuild_rankings')
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() + timedelta(minutes=1))
+        self.assertIsNone(jobs.claim('w1'))
+
+    @override_settings(JOB_RETRY_DELAY=60)
+    def test_failed_job_is_retried_then_marked_failed(self):
+        job, _ = jobs.enqueue('rebuild_rankings', max_attempts=2)
+        with mock.patch.object(jobs, 'call_command', side_effect=CommandError('boom')), \
+                self.assertLogs('polls.jobs', 'WARNING'):
+            self.assertEqual(jobs.run(jobs.claim('w1')), 'queued')
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertIn('boom', job.error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=50))
+
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            self.assertEqual(jobs.run(jobs.claim('w1')), 'failed')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    @override_settings(JOB_STALE_AFTER=600)
+    def test_stale_running_job_is_requeued(self):
+        job, _ = jobs.enqueue('rebuild_rankings')
+        jobs.claim('dead-worker')
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('queued', ''))
+
+
+class JobClaimRaceTests(TransactionTestCase):
+    """兩個 worker 同時取得工作時，group 的並行上限仍然成立"""
+
+    def test_two_workers_respect_concurrency_limit(self):
+        jobs.enqueue('import_drinks', ['a.csv'])
+        jobs.enqueue('import_drinks', ['b.csv'])
+        barrier = threading.Barrier(2)
+        original = jobs.full_groups
+
+        def full_groups():
+            # 讓兩邊都在讀完執行中數量後才更新；取得寫入鎖時另一邊會卡在 BEGIN，等待逾時後繼續
+            blocked = original()
+            try:
+                barrier.wait(timeout=1)
+            except threading.BrokenBarrierError:
+                pass
+            return blocked
+
+        with mock.patch.object(jobs, 'full_groups', full_groups):
+            results = run_concurrently(lambda index: jobs.claim(f'w{index}'))
+
+        for result in results:
+            self.assertNotIsInstance(result, Exception)
+        self.assertEqual(len([job for job in results if job is not None]), 1)
+        self.assertEqual(Job.objects.filter(status='running').count(), 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'single-flight-tests'}},
+    SINGLE_FLIGHT_CACHE='default',
+)
+class SingleFlightTests(TestCase):
+    """single-flight 快取：只有取得鎖的呼叫重新計算，其他呼叫回傳舊值或短暫等待"""
+
+    def setUp(self):
+        get_cache().clear()
+        catalog.expire()
+        self.outcomes = []
+        patcher = mock.patch.object(metrics, 'record_cache_lock', lambda name, outcome: self.outcomes.append(outcome))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'value-{self.calls}'
+
+    def test_fresh_value_is_computed_once(self):
+        self.assertEqual(get_or_compute('k', self.compute, 'test', beta=0), 'value-1')
+        self.assertEqual(get_or_compute('k', self.compute, 'test', beta=0), 'value-1')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.outcomes, ['acquired'])
+        self.assertIsNone(get_cache().get('k:lock'))
+
+    def test_expired_value_is_served_while_locked(self):
+        cache = get_cache()
+        cache.set('k', ('old', time.time() - 1, 0.0), 60)
+        cache.add('k:lock', 1, 60)
+        self.assertEqual(get_or_compute('k', self.compute, 'test'), 'old')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.outcomes, ['stale'])
+
+    def test_expired_value_is_recomputed_by_lock_holder(self):
+        get_cache().set('k', ('old', time.time() - 1, 0.0), 60)
+        self.assertEqual(get_or_compute('k', self.compute, 'test'), 'value-1')
+        self.assertEqual(self.outcomes, ['acquired'])
+
+    def test_waits_for_lock_holder_without_stale_value(self):
+        cache = get_cache()
+        cache.add('k:lock', 1, 60)
+        timer = threading.Timer(0.1, lambda: cache.set('k', ('theirs', time.time() + 60, 0.0), 60))
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(get_or_compute('k', self.compute, 'test', wait=5), 'theirs')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.outcomes, ['wait'])
+
+    def test_computes_itself_after_wait_timeout(self):
+        get_cache().add('k:lock', 1, 60)
+        self.assertEqual(get_or_compute('k', self.compute, 'test', wait=0.1), 'value-1')
+        self.assertEqual(self.outcomes, ['wait', 'timeout'])
+
+    def test_catalog_change_uses_new_key(self):
+        shop = TeaShop.objects.create(name='測試茶飲', address='台北市', latitude=25.02, longitude=121.53, rating=4.5)
+
+        @single_flight('test_catalog', beta=0)
+        def shop_names():
+            self.calls += 1
+            return list(TeaShop.objects.values_list('name', flat=True))
+
+        catalog.expire()
+        self.assertEqual(shop_names(), ['測試茶飲'])
+        self.assertEqual(shop_names(), ['測試茶飲'])
+        self.assertEqual(self.calls, 1)
+
+        # 儲存店家時 signal 遞增版本，commit 後改用新的 key
+        with self.captureOnCommitCallbacks(execute=True):
+            shop.name = '改名茶飲'
+            shop.save()
+        self.assertEqual(shop_names(), ['改名茶飲'])
+        self.assertEqual(self.calls, 2)
+
+
+class ImportDrinksTests(TestCase):
+    """飲料匯入：未變更的檔案略過、刪除 CSV 中已不存在的飲料、分段匯入"""
+
+    HEADER = '所屬店家,飲料名稱,描述,奶類,茶類,配料,中杯,中杯價格,大杯,大杯價格\n'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(METRICS_DB=self.directory / 'metrics.sqlite3', CATALOG_SNAPSHOT_PATH=None)
+        override.enable()
+        self.addCleanup(override.disable)
+        TeaShop.objects.create(name='測試茶飲', address='台北市', latitude=25.02, longitude=121.53, rating=4.5)
+
+    def write_csv(self, *rows):
+        path = self.directory / 'drinks.csv'
+        path.write_text(self.HEADER + ''.join(f'{row}\n' for row in rows), encoding='utf-8')
+        return path
+
+    def run_import(self, path, **options):
+        output = io.StringIO()
+        call_command('import_drinks', csv_path=str(path), workers=1, stdout=output, **options)
+        return output.getvalue()
+
+    def prices(self):
+        return dict(Drink.objects.values_list('name', 'price_medium'))
+
+    def test_unchanged_file_is_skipped_until_catalog_changes(self):
+        path = self.write_csv('測試茶飲,紅茶,,,紅茶,無,有,30,無,', '測試茶飲,奶茶,,奶精,紅茶,無,有,45,無,')
+        self.run_import(path)
+        self.assertEqual(self.prices(), {'紅茶': 30, '奶茶': 45})
+        self.assertIn('略過匯入', self.run_import(path))
+
+        # 匯入後飲料被修改：目錄版本改變，同一個檔案需要重新比對並改回
+        drink = Drink.objects.get(name='紅茶')
+        drink.price_medium = 99
+        drink.save()
+        output = self.run_import(path)
+        self.assertNotIn('略過匯入', output)
+        self.assertEqual(self.prices(), {'紅茶': 30, '奶茶': 45})
+        self.assertIn('略過匯入', self.run_import(path))
+
+    def test_file_with_errors_is_not_recorded(self):
+        path = self.write_csv('測試茶飲,紅茶,,,紅茶,無,有,30,無,', '測試茶飲,,,,紅茶,無,有,30,無,')
+        self.run_import(path)
+        self.assertEqual(self.prices(), {'紅茶': 30})
+        self.assertFalse(ImportFile.objects.exists())
+        self.assertNotIn('略過匯入', self.run_import(path))
+
+    def test_prune_removes_vanished_drinks(self):
+        self.run_import(self.write_csv('測試茶飲,紅茶,,,紅茶,無,有,30,無,', '測試茶飲,奶茶,,奶精,紅茶,無,有,45,無,'))
+        path = self.write_csv('測試茶飲,紅茶,,,紅茶,無,有,35,無,')
+        self.run_import(path)
+        self.assertEqual(self.prices(), {'紅茶': 35, '奶茶': 45})
+        self.run_import(path, prune=True, force=True)
+        self.assertEqual(self.prices(), {'紅茶': 35})
+
+    def test_staged_publish_merges_delta(self):
+        self.run_import(self.write_csv('測試茶飲,紅茶,,,紅茶,無,有,30,無,', '測試茶飲,奶茶,,奶精,紅茶,無,有,45,無,'))
+        unchanged = Drink.objects.get(name='奶茶')
+        path = self.write_csv(
+            '測試茶飲,紅茶,,,紅茶,無,有,35,無,', '測試茶飲,奶茶,,奶精,紅茶,無,有,45,無,', '測試茶飲,綠茶,,,綠茶,無,有,30,無,',
+        )
+        output = self.run_import(path, staged=True)
+        self.assertEqual(self.prices(), {'紅茶': 35, '奶茶': 45, '綠茶': 30})
+        self.assertIn('新增: 1 筆', output)
+        self.assertIn('更新: 1 筆', output)
+        # 未變動的飲料沒有被重建，暫存表在合併後清空
+        self.assertEqual(Drink.objects.get(name='奶茶').pk, unchanged.pk)
+        self.assertFalse(DrinkStaging.objects.exists())
+
+        self.run_import(self.write_csv('測試茶飲,綠茶,,,綠茶,無,有,30,無,'), staged=True, prune=True)
+        self.assertEqual(self.prices(), {'綠茶': 30})
+
+
+class TokenBucketTests(SimpleTestCase):
+    """限流的 token bucket：滿桶開始、依時間補充、不超過容量"""
+
+    def setUp(self):
+        self.key = ('test', self.id())
+        self.addCleanup(ratelimit._buckets.pop, self.key, None)
+
+    def test_bucket_refills_over_time(self):
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=0), 0)
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=0), 0)
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=0), 1.0)
+        self.assertAlmostEqual(ratelimit.take(self.key, 2, 1.0, now=0.5), 0.5)
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=1.5), 0)
+
+    def test_refill_is_capped_at_capacity(self):
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=0), 0)
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=3600), 0)
+        self.assertEqual(ratelimit.take(self.key, 2, 1.0, now=3600), 0)
+        self.assertGreater(ratelimit.take(self.key, 2, 1.0, now=3600), 0)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled(self):
+        self.assertIsNone(ratelimit.get_limit('check_favorites'))
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class CheckFavoritesTests(TestCase):
+    """頁面上所有收藏按鈕以一個請求檢查，超過額度時回傳 429 與 Retry-After"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('checker', password='x')
+        cls.shops = [
+            TeaShop.objects.create(
+                place_id=f'check-{index}', name=f'測試茶飲 {index}', address='台北市',
+                latitude=25.02, longitude=121.53, rating=4.5,
+            )
+            for index in range(3)
+        ]
+        Favorite.objects.create(user=cls.user, favorite_type='shop', tea_shop=cls.shops[1])
+
+    def setUp(self):
+        ratelimit._buckets.clear()
+        self.client.force_login(self.user)
+
+    def check(self, ids, **extra):
+        return self.client.get(
+            reverse('check_favorites'), {'type': 'shop', 'ids': ','.join(str(item_id) for item_id in ids)}, **extra
+        )
+
+    def test_page_load_is_checked_with_one_request(self):
+        page = self.client.get(reverse('shop_list'))
+        ids = re.findall(r'data-shop-id="(\d+)"', page.content.decode())
+        self.assertEqual(sorted(map(int, ids)), sorted(shop.pk for shop in self.shops))
+        response = self.check(ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'favorited': [self.shops[1].pk]})
+
+    def test_invalid_ids_and_type(self):
+        self.assertEqual(self.check(['x', '', self.shops[1].pk]).json(), {'favorited': [self.shops[1].pk]})
+        response = self.client.get(reverse('check_favorites'), {'type': 'user', 'ids': '1'})
+        self.assertEqual(response.json(), {'favorited': []})
+
+    def test_too_many_ids(self):
+        response = self.check(range(1, favorites.MAX_ITEMS + 2))
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RATE_LIMITS={'check_favorites': (2, 60)}, RATE_LIMIT_ENABLED=True)
+    def test_rate_limited_with_retry_after(self):
+        ids = [shop.pk for shop in self.shops]
+        self.assertEqual(self.check(ids).status_code, 200)
+        self.assertEqual(self.check(ids).status_code, 200)
+        response = self.check(ids, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(response.json()['success'])
+
+
+class StaticFileTests(SimpleTestCase):
+    """沒有前端 web server 時的靜態檔案：帶雜湊的檔名長期快取，其餘短期快取"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        (root / 'css').mkdir()
+        (root / 'css' / 'site.0123456789ab.css').write_text('body {}')
+        (root / 'css' / 'site.css').write_text('body {}')
+        override = override_settings(STATIC_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def get(self, path):
+        return self.client.get(reverse('static_file', kwargs={'path': path}))
+
+    def test_hashed_name_is_immutable(self):
+        response = self.get('css/site.0123456789ab.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_unhashed_name_has_short_max_age(self):
+        response = self.get('css/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+    def test_falls_back_to_static_dirs(self):
+        self.assertEqual(self.get('js/base.js').status_code, 200)
+
+    def test_paths_outside_static_root_are_not_served(self):
+        self.assertEqual(self.get('../db.sqlite3').status_code, 404)
+        self.assertEqual(self.get('css/missing.0123456789ab.css').status_code, 404)
@@ -0,0 +1,36 @@
+"""
+前 k 名選取
+
+只需要前 k 筆時，以 heapq 逐筆讀取候選資料（可直接傳入 QuerySet.iterator()），
+記憶體只保留 k 筆，不必先把所有符合條件的資料載入再整個排序。
+"""
+import heapq
+
+
+# 排序模式 -> (排序依據, 是否由大到小)
+SORT_MODES = {
+    'rating_desc': ('rating', True),
+    'rating_asc': ('rating', False),
+    'price_asc': ('min_price', False),
+    'price_desc': ('max_price', True),
+}
+
+
+def top_k(candidates, k, key, reverse=False):
+    """與 sorted(candidates, key=key, reverse=reverse)[:k] 結果相同（含同分時的先後順序）"""
+    if reverse:
+        return heapq.nlargest(k, candidates, key=key)
+    return heapq.nsmallest(k, candidates, key=key)
+
+
+def top_k_by(candidates, k, sort_by, keys, default='rating_desc'):
+    """
+    依排序模式取前 k 筆
+
+    keys 提供各排序依據的取值函式，例如 {'rating': ..., 'min_price': ..., 'max_price': ...}；
+    未知或不支援的排序模式改用 default。
+    """
+    field, reverse = SORT_MODES.get(sort_by, SORT_MODES[default])
+    if field not in keys:
+        field, reverse = SORT_MODES[default]
+    return top_k(candidates, k, keys[field], reverse=reverse)
@@ -1,12 +1,32 @@
+import os
+import re
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import Q
-from .models import TeaShop, Drink, Favorite
-from math import radians, sin, cos, sqrt, atan2
+from django.db.models import Exists, F, OuterRef, Q
+from .models import TeaShop, Drink, Favorite, DrinkRanking, CanonicalDrink
+from . import canonical, recommendations
+from . import favorites as favorite_batch
+from . import exporting, metrics, snapshot
+from .cache import single_flight
+from .ratelimit import rate_limit
+from .geo import bounding_box_filter, distance_expression, parse_coordinates, parse_radius
+from .opening_hours import open_now_exists
+from .topk import top_k, top_k_by
+from .drink_search import DEFAULT_RADIUS_KM, MAX_LIMIT, MAX_RADIUS_KM, cheapest_nearby, intent_q
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.views.static import serve as serve_static
+from django.utils.cache import patch_cache_control
 from django.views.decorators.http import require_POST
 from django.contrib.auth.views import PasswordResetView, PasswordResetConfirmView
 
@@ -16,16 +36,45 @@ def home(request):
     return render(request, 'polls/home.html')
 
 
+def shop_list_params(params):
+    """shop_list 的篩選參數（shop_list_results 的參數，warm_caches 也以此產生相同的快取 key）"""
+    _, drink_filters = menu_filter(params)
+    return {
+        'search_query': params.get('search', ''),
+        'rating_filter': params.get('rating', ''),
+        'open_now': params.get('open_now', ''),  # 'true' or ''
+        'sort_by': params.get('sort', 'rating_desc'),
+        'fresh_milk_filter': params.get('fresh_milk', ''),  # 'true' or ''
+        'topping_filter': params.get('topping', ''),  # 'yes' or ''
+        'max_price_filter': params.get('max_price', ''),  # 例如 '50'
+        'drink_filters': drink_filters,
+    }
+
+
 def shop_list(request):
     """店家列表頁面 - 包含營業中篩選"""
-    # 取得搜尋關鍵字
-    search_query = request.GET.get('search', '')
+    params = shop_list_params(request.GET)
+    # 營業中篩選隨時間變動，不使用快取
+    if params['open_now'] == 'true':
+        tea_shops = shop_list_results.uncached(**params)
+    else:
+        tea_shops = shop_list_results(**params)
+    drink_filters = params.pop('drink_filters')
+
+    context = {
+        'tea_shops': tea_shops,
+        'total_count': len(tea_shops),
+        **params,
+        **drink_filters,
+    }
+
+    return render(request, 'polls/shop_list.html', context)
 
-    # 取得篩選參數
-    rating_filter = request.GET.get('rating', '')
-    open_now = request.GET.get('open_now', '')  # 'true' or ''
-    sort_by = request.GET.get('sort', 'rating_desc')
 
+@single_flight('shop_list')
+def shop_list_results(search_query, rating_filter, open_now, sort_by, fresh_milk_filter, topping_filter,
+                      max_price_filter, drink_filters):
+    """符合篩選條件的店家（已排序，依篩選條件快取）"""
     # 基本查詢
     tea_shops = TeaShop.objects.all()
 
@@ -44,40 +93,81 @@ def shop_list(request):
         except ValueError:
             pass
 
-    tea_shops = list(tea_shops)
+    # 菜單篩選（使用 TeaShop 上預先彙總、有索引的菜單統計欄位）
+    try:
+        max_price = float(max_price_filter) if max_price_filter else None
+    except ValueError:
+        max_price = None
+
+    if fresh_milk_filter == 'true' and max_price is not None:
+        # 有低於指定價格的鮮奶飲品
+        tea_shops = tea_shops.filter(menu_min_fresh_milk_price__lt=max_price)
+    elif fresh_milk_filter == 'true':
+        tea_shops = tea_shops.filter(menu_has_fresh_milk=True)
+    elif max_price is not None:
+        tea_shops = tea_shops.filter(menu_min_price__lt=max_price)
+
+    if topping_filter == 'yes':
+        tea_shops = tea_shops.filter(menu_has_topping=True)
+
+    # 飲料條件篩選（EXISTS 子查詢）
+    drink_exists, _ = menu_filter(drink_filters)
+    if drink_exists is not None:
+        tea_shops = tea_shops.filter(drink_exists)
 
     # 營業中篩選（Toggle 機制）
     if open_now == 'true':
-        tea_shops = [shop for shop in tea_shops if shop.is_open_now() == True]
+        tea_shops = tea_shops.filter(open_now_exists())
 
     # 排序（移除 name）
     if sort_by == 'rating_asc':
-        tea_shops = sorted(tea_shops, key=lambda x: x.rating)
+        tea_shops = tea_shops.order_by('rating', 'name')
+    elif sort_by == 'favorites_desc':
+        tea_shops = tea_shops.order_by('-favorite_count', '-rating', 'name')
     else:  # rating_desc
-        tea_shops = sorted(tea_shops, key=lambda x: x.rating, reverse=True)
+        tea_shops = tea_shops.order_by('-rating', 'name')
 
-    context = {
-        'tea_shops': tea_shops,
-        'total_count': len(tea_shops),
-        'search_query': search_query,
-        'rating_filter': rating_filter,
-        'open_now': open_now,
-        'sort_by': sort_by,
-    }
+    return list(tea_shops)
 
-    return render(request, 'polls/shop_list.html', context)
+
+def recommended_params(params):
+    """recommended_results 的參數（warm_caches 也以此產生相同的快取 key）"""
+    return (
+        params.get('rating', ''),
+        params.get('milk_type', ''),
+        params.get('price', ''),
+        params.get('tea_type', ''),
+        params.get('topping', ''),
+        params.get('sort', 'recommended'),  # 預設依推薦分數
+    )
 
 
 def recommended_drinks(request):
     """推薦品項頁面"""
     # 取得篩選參數
-    rating_filter = request.GET.get('rating', '')
-    milk_filter = request.GET.get('milk_type', '')
-    price_filter = request.GET.get('price', '')
-    tea_filter = request.GET.get('tea_type', '')
-    topping_filter = request.GET.get('topping', '')
-    sort_by = request.GET.get('sort', 'rating_desc')  # 預設評價由高到低
+    rating_filter, milk_filter, price_filter, tea_filter, topping_filter, sort_by = recommended_params(request.GET)
+
+    drinks, total_count = recommended_results(
+        rating_filter, milk_filter, price_filter, tea_filter, topping_filter, sort_by
+    )
+
+    context = {
+        'drinks': drinks,
+        'total_count': total_count,
+        'rating_filter': rating_filter,
+        'milk_filter': milk_filter,
+        'price_filter': price_filter,
+        'tea_filter': tea_filter,
+        'topping_filter': topping_filter,
+        'sort_by': sort_by,
+    }
+
+    return render(request, 'polls/recommended_drinks.html', context)
 
+
+@single_flight('recommended_drinks')
+def recommended_results(rating_filter, milk_filter, price_filter, tea_filter, topping_filter, sort_by):
+    """推薦品項的前 50 筆與符合條件的總數（依篩選條件快取）"""
     # 基本查詢：建立基礎查詢集
     drinks = Drink.objects.select_related('tea_shop')
 
@@ -88,9 +178,6 @@ def recommended_drinks(request):
             drinks = drinks.filter(tea_shop__rating__gte=min_rating)
         except ValueError:
             pass
-    else:
-        # 無篩選時的預設行為：顯示 4.0 星以上
-        drinks = drinks.filter(tea_shop__rating__gte=4.0)
 
     # 奶類篩選
     if milk_filter:
@@ -104,43 +191,34 @@ def recommended_drinks(request):
     if topping_filter:
         drinks = drinks.filter(topping=topping_filter)
 
-    # 轉換為列表以便價格篩選和排序
-    drinks = list(drinks)
-
     # 價格篩選
-    if price_filter == 'under_50':
-        drinks = [d for d in drinks if has_price_in_range(d, 0, 50)]
-    elif price_filter == '50_80':
-        drinks = [d for d in drinks if has_price_in_range(d, 50, 80)]
-    elif price_filter == 'over_80':
-        drinks = [d for d in drinks if has_price_in_range(d, 80, float('inf'))]
+    if price_filter in PRICE_RANGES:
+        drinks = drinks.filter(price_range_q(*PRICE_RANGES[price_filter]))
 
-    # 排序
-    if sort_by == 'rating_desc' or sort_by == 'rating':
-        drinks = sorted(drinks, key=lambda x: x.tea_shop.rating, reverse=True)
-    elif sort_by == 'rating_asc':
-        drinks = sorted(drinks, key=lambda x: x.tea_shop.rating)
-    elif sort_by == 'price_asc':
-        drinks = sorted(drinks, key=lambda x: get_min_price(x))
-    elif sort_by == 'price_desc':
-        drinks = sorted(drinks, key=lambda x: get_max_price(x), reverse=True)
+    if sort_by == 'recommended' and DrinkRanking.objects.exists():
+        # 依預先計算的排名表分數排序；上次 rebuild_rankings 之後才新增的飲料尚無分數，排在最後
+        ranked = drinks.order_by(F('ranking__score').desc(nulls_last=True), 'id')
+        return list(ranked[:50]), drinks.count()
+    if sort_by == 'favorites_desc':
+        # 依收藏人數（有索引的計數欄位）排序
+        ranked = drinks.order_by('-favorite_count', '-tea_shop__rating', 'id')
+        return list(ranked[:50]), ranked.count()
 
-    context = {
-        'drinks': drinks[:50],  # 限制顯示數量
-        'total_count': len(drinks),
-        'rating_filter': rating_filter,
-        'milk_filter': milk_filter,
-        'price_filter': price_filter,
-        'tea_filter': tea_filter,
-        'topping_filter': topping_filter,
-        'sort_by': sort_by,
-    }
+    # 價格需在 Python 中計算：逐筆讀取，只保留前 50 筆
+    # （rating_desc 或尚未建立排名表時依店家評分）
+    total_count = drinks.count()
+    return top_k_by(drinks.iterator(chunk_size=500), 50, sort_by, DRINK_SORT_KEYS), total_count
 
-    return render(request, 'polls/recommended_drinks.html', context)
 
+# 使用目錄快照時於 Python 端排序，與資料庫排序相同
+# nearby_shops 各排序依據的取值（polls.topk.SORT_MODES）
+NEARBY_SORT_KEYS = {
+    'rating': lambda shop: shop.rating,
+}
 
-def nearby_shops(request):
-    """附近店家頁面 - 根據使用者位置顯示"""
+
+async def nearby_shops(request):
+    """附近店家頁面 - 根據使用者位置顯示（async）"""
     # 取得使用者位置
     user_lat = request.GET.get('lat', '')
     user_lng = request.GET.get('lng', '')
@@ -151,60 +229,67 @@ def nearby_shops(request):
 
     tea_shops = TeaShop.objects.all()
 
+    # 飲料條件與營業中篩選（EXISTS 子查詢，與距離條件在同一個查詢中完成）
+    drink_exists, drink_filters = menu_filter(request.GET)
+    if drink_exists is not None:
+        tea_shops = tea_shops.filter(drink_exists)
+    if open_now == 'true':
+        tea_shops = tea_shops.filter(open_now_exists())
+
     # 如果有使用者位置，計算距離
     if user_lat and user_lng:
         try:
-            user_lat = float(user_lat)
-            user_lng = float(user_lng)
-
-            # 計算每家店的距離
-            shops_with_distance = []
-            for shop in tea_shops:
-                distance = calculate_distance(
-                    user_lat, user_lng,
-                    float(shop.latitude), float(shop.longitude)
-                )
-                shop.distance = distance
-                shops_with_distance.append(shop)
-
-            # 顯示距離統計
-            if shops_with_distance:
-                distances = [s.distance for s in shops_with_distance]
-                print(f"距離範圍: 最近 {min(distances):.2f}km, 最遠 {max(distances):.2f}km")
-
-            # 距離篩選（支援 0.5, 1, 3, 5, 8）
-            if distance_filter:
-                try:
-                    max_distance = float(distance_filter)
-                    before_count = len(shops_with_distance)
-                    shops_with_distance = [s for s in shops_with_distance
-                                          if s.distance <= max_distance]
-                    after_count = len(shops_with_distance)
-                    print(f"距離篩選: {max_distance}km, 篩選前: {before_count}家, 篩選後: {after_count}家")
-                except ValueError:
-                    print(f"距離篩選值無效: {distance_filter}")
-                    pass
-
-            # 營業中篩選
-            if open_now == 'true':
-                shops_with_distance = [s for s in shops_with_distance
-                                      if s.is_open_now() == True]
-
-            # 排序
-            if sort_by == 'rating_desc' or sort_by == 'rating':
-                tea_shops = sorted(shops_with_distance, key=lambda x: x.rating, reverse=True)
-            elif sort_by == 'rating_asc':
-                tea_shops = sorted(shops_with_distance, key=lambda x: x.rating)
-            elif sort_by == 'distance_desc':
-                tea_shops = sorted(shops_with_distance, key=lambda x: x.distance, reverse=True)
-            else:  # distance_asc or distance
-                tea_shops = sorted(shops_with_distance, key=lambda x: x.distance)
+            user_lat, user_lng = parse_coordinates(user_lat, user_lng)
+
+            try:
+                max_distance = parse_radius(distance_filter) if distance_filter else None
+            except ValueError:
+                max_distance = None
+
+            catalog = snapshot.current()
+            if catalog is not None and max_distance is not None:
+                # 目錄快照：半徑內的店家與距離直接由各 worker 共用的 mmap 算出，資料庫只取這些店家
+                within = catalog.shops_within(user_lat, user_lng, max_distance)
+                shops = {shop.pk: shop async for shop in tea_shops.filter(pk__in=[pk for pk, _ in within])}
+                # shops_within 已依距離由近到遠排序，直接沿用
+                tea_shops = []
+                for pk, distance in within:
+                    if pk in shops:
+                        shops[pk].distance = distance
+                        tea_shops.append(shops[pk])
+                if sort_by == 'distance_desc':
+                    tea_shops.reverse()
+                elif sort_by in ('rating', 'rating_desc', 'rating_asc'):
+                    # 同分時維持距離順序
+                    tea_shops = top_k_by(tea_shops, len(tea_shops), 'rating_desc' if sort_by == 'rating' else sort_by, NEARBY_SORT_KEYS)
+            else:
+                # 在資料庫中計算每家店的距離
+                shops_with_distance = tea_shops.annotate(distance=distance_expression(user_lat, user_lng))
+
+                # 距離篩選（支援 0.5, 1, 3, 5, 8）：先以經緯度範圍走索引，再比對精確距離
+                if max_distance is not None:
+                    shops_with_distance = shops_with_distance.filter(
+                        **bounding_box_filter(user_lat, user_lng, max_distance),
+                        distance__lte=max_distance,
+                    )
+
+                # 排序
+                if sort_by == 'rating_desc' or sort_by == 'rating':
+                    shops_with_distance = shops_with_distance.order_by('-rating', 'distance')
+                elif sort_by == 'rating_asc':
+                    shops_with_distance = shops_with_distance.order_by('rating', 'distance')
+                elif sort_by == 'distance_desc':
+                    shops_with_distance = shops_with_distance.order_by('-distance')
+                else:  # distance_asc or distance
+                    shops_with_distance = shops_with_distance.order_by('distance')
+
+                tea_shops = [shop async for shop in shops_with_distance]
 
         except (ValueError, TypeError):
-            tea_shops = list(tea_shops.order_by('-rating'))
+            tea_shops = [shop async for shop in tea_shops.order_by('-rating')]
     else:
         # 如果沒有位置，顯示高評分店家
-        tea_shops = list(tea_shops.order_by('-rating')[:20])
+        tea_shops = [shop async for shop in tea_shops.order_by('-rating')[:20]]
 
     context = {
         'tea_shops': tea_shops,
@@ -214,9 +299,134 @@ def nearby_shops(request):
         'distance_filter': distance_filter,
         'open_now': open_now,
         'sort_by': sort_by,
+        **drink_filters,
     }
 
-    return render(request, 'polls/nearby_shops.html', context)
+    # 模板會透過 context processor 讀取 request.user / session，需在同步環境中渲染
+    return await sync_to_async(render)(request, 'polls/nearby_shops.html', context)
+
+
+@rate_limit('cheapest_nearby_drinks')
+async def cheapest_nearby_drinks(request):
+    """附近最便宜的飲料（JSON）- 例如 ?q=珍珠奶茶&lat=25.02&lng=121.53&radius=1&open_now=true"""
+    search_query = request.GET.get('q', '').strip()
+    try:
+        lat, lng = parse_coordinates(request.GET['lat'], request.GET['lng'])
+        radius = parse_radius(request.GET.get('radius', DEFAULT_RADIUS_KM))
+        limit = int(request.GET.get('limit', 10))
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': '請提供有效的 lat（-90 ~ 90）、lng（-180 ~ 180）、radius（大於 0）與 limit',
+        }, status=400)
+
+    radius = min(radius, MAX_RADIUS_KM)
+    limit = min(max(limit, 1), MAX_LIMIT)
+    open_now = request.GET.get('open_now', '') == 'true'
+
+    drinks = cheapest_nearby(search_query, lat, lng, radius, open_now=open_now, limit=limit)
+    results = [
+        {
+            'drink_id': drink.id,
+            'drink_name': drink.name,
+            'price': int(drink.min_price),
+            'price_range': drink.get_price_range(),
+            'shop_id': drink.tea_shop_id,
+            'shop_name': drink.tea_shop.name,
+            'shop_address': drink.tea_shop.address,
+            'distance': round(drink.distance, 3),
+        }
+        async for drink in drinks
+    ]
+
+    return JsonResponse({
+        'success': True,
+        'query': search_query,
+        'radius': radius,
+        'open_now': open_now,
+        'results': results,
+    })
+
+
+def canonical_drink_stats(request):
+    """標準飲料的跨店價格統計（JSON）- 例如 ?q=珍奶&min_shops=2"""
+    search_query = request.GET.get('q', '').strip()
+    try:
+        min_shops = int(request.GET.get('min_shops', 2))
+    except ValueError:
+        min_shops = 2
+
+    stats = canonical.price_statistics().filter(shop_count__gte=min_shops)
+    if search_query:
+        stats = stats.filter(canonical__key__contains=canonical.normalize_name(search_query))
+    stats = stats.order_by('-shop_count', 'canonical__name')[:100]
+
+    return JsonResponse({
+        'success': True,
+        'results': [
+            {
+                'canonical_id': row['canonical_id'],
+                'name': row['canonical__name'],
+                'shop_count': row['shop_count'],
+                'drink_count': row['drink_count'],
+                'min_price': int(row['lowest_price']),
+                'avg_price': round(float(row['average_price']), 1),
+                'max_price': int(row['highest_price']),
+            }
+            for row in stats
+        ],
+    })
+
+
+def canonical_drink_compare(request, canonical_id):
+    """同一個標準飲料在各店家的價格比較（JSON）"""
+    canonical_drink = get_object_or_404(CanonicalDrink, id=canonical_id)
+    drinks = canonical.compare(canonical_id)
+
+    return JsonResponse({
+        'success': True,
+        'canonical_id': canonical_drink.id,
+        'name': canonical_drink.name,
+        'results': [
+            {
+                'drink_id': drink.id,
+                'drink_name': drink.name,
+                'price': int(drink.min_price) if drink.min_price is not None else None,
+                'price_range': drink.get_price_range(),
+                'shop_id': drink.tea_shop_id,
+                'shop_name': drink.tea_shop.name,
+                'shop_rating': float(drink.tea_shop.rating),
+            }
+            for drink in drinks
+        ],
+    })
+
+
+@rate_limit('also_liked')
+def also_liked(request):
+    """收藏這個的人也喜歡（JSON）- 例如 ?type=shop&id=1&limit=10"""
+    item_type = request.GET.get('type', '')
+    try:
+        item_id = int(request.GET.get('id', ''))
+        limit = min(max(int(request.GET.get('limit', 10)), 1), recommendations.NEIGHBORS)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': '請提供有效的 id 與 limit'}, status=400)
+    if item_type not in ('shop', 'drink'):
+        return JsonResponse({'success': False, 'message': '無效的收藏類型'}, status=400)
+
+    results = []
+    for item in recommendations.also_liked(item_type, item_id, limit=limit):
+        obj = item['object']
+        if item['type'] == 'shop':
+            results.append({'type': 'shop', 'id': obj.id, 'name': obj.name, 'score': round(item['score'], 4)})
+        else:
+            results.append({
+                'type': 'drink', 'id': obj.id, 'name': obj.name,
+                'shop_id': obj.tea_shop_id, 'shop_name': obj.tea_shop.name,
+                'score': round(item['score'], 4),
+            })
+
+    return JsonResponse({'success': True, 'results': results})
 
 
 def shop_detail(request, shop_id):
@@ -270,6 +480,7 @@ def shop_detail(request, shop_id):
         'shop': shop,
         'drinks': drinks,
         'total_drinks': len(drinks),
+        'also_liked': recommendations.also_liked('shop', shop.id, limit=6),
         'milk_filter': milk_filter,
         'price_filter': price_filter,
         'tea_filter': tea_filter,
@@ -300,6 +511,71 @@ def get_max_price(drink):
     return max(prices) if prices else 0
 
 
+# 價格篩選區間（下限含、上限不含）
+PRICE_RANGES = {
+    'under_50': (0, 50),
+    '50_80': (50, 80),
+    'over_80': (80, None),
+}
+
+
+def price_range_q(min_price, max_price=None):
+    """has_price_in_range 的資料庫版本：任一杯型價格落在區間內"""
+    conditions = Q()
+    for size in ('medium', 'large'):
+        size_q = Q(**{f'has_{size}': True, f'price_{size}__gt': 0, f'price_{size}__gte': min_price})
+        if max_price is not None:
+            size_q &= Q(**{f'price_{size}__lt': max_price})
+        conditions |= size_q
+    return conditions
+
+
+def menu_filter(params):
+    """
+    依菜單條件篩選店家（drink_q / drink_milk / drink_tea / drink_topping / drink_price / drink_max_price）
+
+    所有條件須由同一杯飲料同時符合，組成單一 EXISTS 子查詢；
+    回傳 (Exists 或 None, 模板用的篩選值)。
+    """
+    values = {
+        'drink_q': params.get('drink_q', '').strip(),
+        'drink_milk': params.get('drink_milk', ''),
+        'drink_tea': params.get('drink_tea', ''),
+        'drink_topping': params.get('drink_topping', ''),
+        'drink_price': params.get('drink_price', ''),
+        'drink_max_price': params.get('drink_max_price', ''),
+    }
+
+    conditions = Q()
+    if values['drink_milk']:
+        conditions &= Q(milk_type=values['drink_milk'])
+    if values['drink_tea']:
+        conditions &= Q(tea_type=values['drink_tea'])
+    if values['drink_topping']:
+        conditions &= Q(topping=values['drink_topping'])
+    if values['drink_price'] in PRICE_RANGES:
+        conditions &= price_range_q(*PRICE_RANGES[values['drink_price']])
+    if values['drink_max_price']:
+        try:
+            conditions &= price_range_q(0, float(values['drink_max_price']))
+        except ValueError:
+            pass
+    if values['drink_q']:
+        conditions &= Q(name__icontains=values['drink_q'])
+
+    if not conditions:
+        return None, values
+    return Exists(Drink.objects.filter(conditions, tea_shop=OuterRef('pk'))), values
+
+
+# recommended_drinks 各排序依據的取值（polls.topk.SORT_MODES）
+DRINK_SORT_KEYS = {
+    'rating': lambda drink: drink.tea_shop.rating,
+    'min_price': get_min_price,
+    'max_price': get_max_price,
+}
+
+
 def has_price_in_range(drink, min_price, max_price):
     """檢查飲料是否有任何杯型的價格在指定範圍內"""
     prices = []
@@ -311,22 +587,6 @@ def has_price_in_range(drink, min_price, max_price):
     return any(min_price <= p < max_price for p in prices)
 
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """使用 Haversine 公式計算兩點間的距離（公里）"""
-    R = 6371  # 地球半徑（公里）
-
-    lat1_rad = radians(lat1)
-    lat2_rad = radians(lat2)
-    delta_lat = radians(lat2 - lat1)
-    delta_lon = radians(lon2 - lon1)
-
-    a = sin(delta_lat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-    distance = R * c
-    return distance
-
-
 def index(request):
     """主首頁 - v2 完整版本（保留以供參考）"""
 
@@ -433,8 +693,8 @@ def favorites_list(request):
     # 取得篩選類型
     filter_type = request.GET.get('type', 'all')  # all, shop, drink
 
-    # 取得使用者的所有收藏
-    favorites = Favorite.objects.filter(user=request.user)
+    # 取得使用者的所有收藏（一併載入店家與飲料，避免模板逐筆查詢）
+    favorites = Favorite.objects.filter(user=request.user).select_related('tea_shop', 'drink__tea_shop')
 
     # 根據類型篩選
     if filter_type == 'shop':
@@ -442,35 +702,46 @@ def favorites_list(request):
     elif filter_type == 'drink':
         favorites = favorites.filter(favorite_type='drink')
 
+    # 依目前所有收藏推薦（不受類型篩選影響）
+    favorite_items = [
+        ('shop', shop_id) if favorite_type == 'shop' else ('drink', drink_id)
+        for favorite_type, shop_id, drink_id in Favorite.objects.filter(user=request.user).values_list(
+            'favorite_type', 'tea_shop_id', 'drink_id'
+        )
+    ]
+
     context = {
         'favorites': favorites,
         'filter_type': filter_type,
         'total_count': favorites.count(),
+        'recommended': recommendations.for_user(favorite_items, limit=6),
     }
 
     return render(request, 'polls/favorites.html', context)
 
 
+@rate_limit('add_favorite')
 @login_required
 @require_POST
-def add_favorite(request):
-    """新增收藏（AJAX）"""
+async def add_favorite(request):
+    """新增收藏（AJAX，async）"""
     favorite_type = request.POST.get('type')  # shop 或 drink
     item_id = request.POST.get('id')
+    user = await request.auser()
 
     try:
         if favorite_type == 'shop':
-            shop = get_object_or_404(TeaShop, id=item_id)
-            favorite, created = Favorite.objects.get_or_create(
-                user=request.user,
+            shop = await TeaShop.objects.aget(id=item_id)
+            favorite, created = await Favorite.objects.aget_or_create(
+                user=user,
                 favorite_type='shop',
                 tea_shop=shop,
                 drink=None
             )
         elif favorite_type == 'drink':
-            drink = get_object_or_404(Drink, id=item_id)
-            favorite, created = Favorite.objects.get_or_create(
-                user=request.user,
+            drink = await Drink.objects.aget(id=item_id)
+            favorite, created = await Favorite.objects.aget_or_create(
+                user=user,
                 favorite_type='drink',
                 drink=drink,
                 tea_shop=None
@@ -483,59 +754,108 @@ def add_favorite(request):
         else:
             return JsonResponse({'success': False, 'message': '已經在收藏清單中'})
 
+    except (TeaShop.DoesNotExist, Drink.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'message': '找不到項目'}, status=404)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 
+@rate_limit('remove_favorite')
 @login_required
 @require_POST
-def remove_favorite(request):
-    """移除收藏（AJAX）"""
+async def remove_favorite(request):
+    """移除收藏（AJAX，async）"""
     favorite_id = request.POST.get('id')
+    user = await request.auser()
 
     try:
-        favorite = get_object_or_404(Favorite, id=favorite_id, user=request.user)
-        favorite.delete()
+        favorite = await Favorite.objects.aget(id=favorite_id, user=user)
+        await favorite.adelete()
         return JsonResponse({'success': True, 'message': '已移除收藏'})
+    except (Favorite.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'message': '找不到收藏'}, status=404)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+@rate_limit('batch_favorites')
+@login_required
+@require_POST
+async def batch_favorites(request):
+    """
+    批次加入 / 移除收藏（AJAX，async）
+
+    POST 欄位 add_shop、add_drink、remove_shop、remove_drink 各可重複多次（店家或飲料的 id），
+    回傳逐項結果與各結果的筆數。
+    """
+    add = {favorite_type: request.POST.getlist(f'add_{favorite_type}') for favorite_type in favorite_batch.TARGETS}
+    remove = {favorite_type: request.POST.getlist(f'remove_{favorite_type}') for favorite_type in favorite_batch.TARGETS}
+    item_count = sum(len(ids) for items in (add, remove) for ids in items.values())
+    if not item_count:
+        return JsonResponse({'success': False, 'message': '沒有指定任何項目'}, status=400)
+    if item_count > favorite_batch.MAX_ITEMS:
+        return JsonResponse(
+            {'success': False, 'message': f'一次最多 {favorite_batch.MAX_ITEMS} 項'}, status=400
+        )
+
+    user = await request.auser()
+    try:
+        results = await sync_to_async(favorite_batch.apply)(user, add, remove)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
+    summary = {}
+    for item in results:
+        summary[item['result']] = summary.get(item['result'], 0) + 1
+    return JsonResponse({
+        'success': True,
+        'message': f'已加入 {summary.get("added", 0)} 項、移除 {summary.get("removed", 0)} 項收藏',
+        'summary': summary,
+        'results': results,
+    })
 
+
+@rate_limit('update_favorite_notes')
 @login_required
 @require_POST
-def update_favorite_notes(request):
-    """更新收藏備註（AJAX）"""
+async def update_favorite_notes(request):
+    """更新收藏備註（AJAX，async）"""
     favorite_id = request.POST.get('id')
     notes = request.POST.get('notes', '')
+    user = await request.auser()
 
     try:
-        favorite = get_object_or_404(Favorite, id=favorite_id, user=request.user)
+        favorite = await Favorite.objects.aget(id=favorite_id, user=user)
         favorite.notes = notes
-        favorite.save()
+        await favorite.asave(update_fields=['notes'])
         return JsonResponse({'success': True, 'message': '備註已更新'})
+    except (Favorite.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'message': '找不到收藏'}, status=404)
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
 
 
+@rate_limit('check_favorite')
 @login_required
-def check_favorite(request):
-    """檢查某項目是否已收藏（AJAX）"""
+async def check_favorite(request):
+    """檢查某項目是否已收藏（AJAX，async）"""
     favorite_type = request.GET.get('type')
     item_id = request.GET.get('id')
+    user = await request.auser()
 
     try:
         if favorite_type == 'shop':
-            exists = Favorite.objects.filter(
-                user=request.user,
+            exists = await Favorite.objects.filter(
+                user=user,
                 favorite_type='shop',
                 tea_shop_id=item_id
-            ).exists()
+            ).aexists()
         elif favorite_type == 'drink':
-            exists = Favorite.objects.filter(
-                user=request.user,
+            exists = await Favorite.objects.filter(
+                user=user,
                 favorite_type='drink',
                 drink_id=item_id
-            ).exists()
+            ).aexists()
         else:
             return JsonResponse({'favorited': False})
 
@@ -544,6 +864,33 @@ def check_favorite(request):
         return JsonResponse({'favorited': False})
 
 
+@rate_limit('check_favorites')
+@login_required
+async def check_favorites(request):
+    """
+    批次檢查頁面上的項目是否已收藏（AJAX，async）
+
+    GET 參數 type（shop / drink）與 ids（以逗號分隔，最多 MAX_ITEMS 個），回傳已收藏的 id；
+    每個頁面只需一個請求，不必每張卡片各查詢一次。
+    """
+    favorite_type = request.GET.get('type')
+    if favorite_type not in favorite_batch.TARGETS:
+        return JsonResponse({'favorited': []})
+    ids, _ = favorite_batch.parse_ids(request.GET.get('ids', '').split(','))
+    if len(ids) > favorite_batch.MAX_ITEMS:
+        return JsonResponse(
+            {'success': False, 'message': f'一次最多 {favorite_batch.MAX_ITEMS} 項'}, status=400
+        )
+
+    user = await request.auser()
+    _, field = favorite_batch.TARGETS[favorite_type]
+    favorited = Favorite.objects.filter(
+        user=user, favorite_type=favorite_type, **{f'{field}_id__in': ids}
+    ).values_list(f'{field}_id', flat=True)
+    return JsonResponse({'favorited': [item_id async for item_id in favorited]})
+
+
+@rate_limit('search_drinks')
 def search_drinks(request):
     """智能飲料搜尋 - 支援模糊匹配、茶類、奶類等多種搜尋方式"""
     search_query = request.GET.get('search', '').strip()
@@ -551,6 +898,20 @@ def search_drinks(request):
     if not search_query:
         return redirect('home')
 
+    drinks = search_results(search_query)
+
+    context = {
+        'drinks': drinks,
+        'total_count': len(drinks),
+        'search_query': search_query,
+    }
+
+    return render(request, 'polls/search_results.html', context)
+
+
+@single_flight('search_drinks')
+def search_results(search_query):
+    """依相關性排序的前 100 筆搜尋結果（依關鍵字快取）"""
     # 開始建立查詢
     all_drinks = Drink.objects.select_related('tea_shop').all()
 
@@ -564,84 +925,14 @@ def search_drinks(request):
 
     # 如果精確匹配有結果，優先返回這些結果
     if exact_matches.exists():
-        drinks = list(exact_matches)
+        drinks = exact_matches.iterator(chunk_size=500)
     else:
         # === 階段 2: 智能拆解匹配（當精確匹配無結果時） ===
-        query_conditions = Q()
-
-        # 常見飲料組合關鍵字（完整詞優先）
-        drink_combinations = {
-            '鮮奶茶': Q(name__icontains='鮮奶') & Q(name__icontains='茶'),
-            '奶精茶': Q(name__icontains='奶精') & Q(name__icontains='茶'),
-            '珍珠奶茶': Q(name__icontains='珍珠') & Q(name__icontains='奶茶'),
-            '珍奶': Q(name__icontains='珍珠') | Q(name__icontains='奶茶'),
-            '奶綠': Q(name__icontains='奶綠') | (Q(name__icontains='綠茶') & Q(milk_type__isnull=False)),
-            '紅茶拿鐵': Q(name__icontains='紅茶') & Q(name__icontains='拿鐵'),
-            '綠茶拿鐵': Q(name__icontains='綠茶') & Q(name__icontains='拿鐵'),
-            '烏龍拿鐵': Q(name__icontains='烏龍') & Q(name__icontains='拿鐵'),
-            '抹茶拿鐵': Q(name__icontains='抹茶') & Q(name__icontains='拿鐵'),
-        }
-
-        # 檢查是否匹配組合關鍵字
-        matched_combination = False
-        for combo_keyword, combo_query in drink_combinations.items():
-            if combo_keyword in search_query:
-                query_conditions |= combo_query
-                matched_combination = True
-                break
-
-        # 如果沒有匹配到組合關鍵字，則進行單一屬性匹配
-        if not matched_combination:
-            # 茶類搜尋（僅當搜尋詞是純茶類時）
-            tea_type_mapping = {
-                '紅茶': 'black_tea',
-                '綠茶': 'green_tea',
-                '烏龍茶': 'oolong_tea',
-                '烏龍': 'oolong_tea',
-                '青茶': 'blue_tea',
-                '抹茶': 'matcha',
-                '鐵觀音': 'tieguanyin',
-                '麥茶': 'barley_tea',
-                '四季春': 'season',
-                '茉莉花茶': 'jasmine',
-                '茉莉': 'jasmine',
-                '普洱茶': 'pu_erh',
-                '普洱': 'pu_erh',
-            }
-
-            tea_matched = False
-            for tea_name, tea_code in tea_type_mapping.items():
-                # 只有當搜尋詞完全是茶類名稱時才用茶類篩選
-                if search_query == tea_name or (tea_name in search_query and len(search_query) <= len(tea_name) + 2):
-                    query_conditions |= Q(tea_type=tea_code)
-                    tea_matched = True
-                    break
-
-            # 奶類搜尋（僅當搜尋詞是純奶類時）
-            if search_query in ['鮮奶', '牛奶'] or (search_query.endswith('鮮奶') and len(search_query) <= 6):
-                query_conditions |= Q(milk_type='fresh_milk')
-            elif search_query == '奶精' or (search_query.endswith('奶精') and len(search_query) <= 6):
-                query_conditions |= Q(milk_type='creamer')
-
-            # 配料搜尋
-            if search_query in ['珍珠', '波霸', '配料'] or search_query.startswith('珍珠'):
-                query_conditions |= Q(topping='yes')
-
-            # 如果以上都沒匹配，嘗試部分匹配飲料名稱
-            if not tea_matched and not query_conditions:
-                # 拆解搜尋詞中的關鍵字
-                keywords_to_try = []
-                if '拿鐵' in search_query:
-                    keywords_to_try.append('拿鐵')
-                if '奶茶' in search_query and search_query != '奶茶':
-                    keywords_to_try.append('奶茶')
-
-                for keyword in keywords_to_try:
-                    query_conditions |= Q(name__icontains=keyword)
+        query_conditions = intent_q(search_query)
 
         # 應用查詢條件
         if query_conditions:
-            drinks = list(all_drinks.filter(query_conditions).distinct())
+            drinks = all_drinks.filter(query_conditions).distinct().iterator(chunk_size=500)
         else:
             drinks = []
 
@@ -669,16 +960,78 @@ def search_drinks(request):
 
         return score
 
-    # 按相關性和店家評分排序
-    drinks = sorted(drinks, key=get_relevance_score, reverse=True)
+    # 按相關性和店家評分排序，只保留前 100 項
+    return top_k(drinks, 100, key=get_relevance_score, reverse=True)
 
-    # 限制結果數量（前 100 項）
-    drinks = drinks[:100]
 
-    context = {
-        'drinks': drinks,
-        'total_count': len(drinks),
-        'search_query': search_query,
-    }
+# ===== 匯出 =====
 
-    return render(request, 'polls/search_results.html', context)
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+@staff_member_required
+def export_catalog(request, kind):
+    """串流匯出店家 / 飲料 / 收藏（?format=csv 或 jsonl，僅限 staff）"""
+    if kind not in exporting.KINDS:
+        raise Http404
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exporting.FORMATS:
+        return HttpResponse('format 需為 csv 或 jsonl', status=400)
+
+    # ASGI 需要 async iterator 才會逐段送出，WSGI 則需要同步 iterator
+    if isinstance(request, ASGIRequest):
+        content = exporting.alines(kind, fmt)
+    else:
+        content = exporting.lines(kind, fmt)
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+# ===== 監控 =====
+
+def metrics_view(request):
+    """Prometheus 指標（METRICS_PUBLIC 未開啟時僅限 staff）"""
+    if not metrics.is_enabled():
+        raise Http404
+    if not getattr(settings, 'METRICS_PUBLIC', False) and not request.user.is_staff:
+        raise Http404
+
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ===== 靜態檔案 =====
+
+# ManifestStaticFilesStorage 帶內容雜湊的檔名：name.<12 位十六進位>.ext
+HASHED_STATIC_NAME = re.compile(r'\.[0-9a-f]{12}(\.[^./]+)?$')
+
+
+def static_file(request, path):
+    """
+    沒有前端 web server 時提供 collectstatic 後的靜態檔案（僅在 DEBUG = False 時註冊）
+
+    正式環境應由 web server 直接提供 STATIC_ROOT（設定方式見 settings.STATIC_ROOT 的說明）。
+    STATIC_ROOT 中帶雜湊的檔名內容不會變動，設定一年的 immutable 快取；其餘檔名使用短的快取時間。
+    STATIC_ROOT 沒有的檔案（collectstatic 之後才下載的店家照片）改從原始的 static 目錄尋找。
+    """
+    root = str(settings.STATIC_ROOT)
+    try:
+        in_root = os.path.isfile(safe_join(root, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    # 依檔名判斷，collectstatic 後不必重新啟動即可套用新檔案的長期快取
+    hashed = in_root and HASHED_STATIC_NAME.search(path) is not None
+    if not in_root:
+        found = finders.find(path)
+        if not found:
+            raise Http404
+        root = found[:-len(path)]
+    response = serve_static(request, path, document_root=root)
+    if hashed:
+        patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.STATIC_UNHASHED_MAX_AGE)
+    return response
@@ -0,0 +1,66 @@
+"""
+部署後的快取預熱
+
+MetricsMiddleware 把可預熱 view 的請求參數（只保留 view 會讀取的參數，依名稱排序）
+記錄到 metrics.access_stats；warm_caches 取最近最常被請求的組合，
+以相同參數呼叫 view 背後有快取的函式，讓第一批使用者不必負擔冷快取的成本。
+"""
+from urllib.parse import parse_qsl, urlencode
+
+from django.http import QueryDict
+
+
+# view 名稱 -> 會影響結果的查詢參數
+VIEW_PARAMS = {
+    'shop_list': [
+        'search', 'rating', 'open_now', 'sort', 'fresh_milk', 'topping', 'max_price',
+        'drink_q', 'drink_milk', 'drink_tea', 'drink_topping', 'drink_price', 'drink_max_price',
+    ],
+    'recommended_drinks': ['rating', 'milk_type', 'price', 'tea_type', 'topping', 'sort'],
+    'search_drinks': ['search'],
+}
+
+# 預熱請求帶上此標頭，不列入請求統計
+WARMUP_HEADER = 'X-Cache-Warmup'
+
+
+def normalize(view, params):
+    """只保留 view 會讀取且有值的參數，依名稱排序後編碼為查詢字串"""
+    names = VIEW_PARAMS[view]
+    return urlencode(sorted((name, params[name]) for name in names if params.get(name, '').strip()))
+
+
+def warm(view, params):
+    """
+    以查詢字串 params 計算 view 的快取內容（與請求時的快取 key 相同）
+
+    回傳 False 表示這個組合不使用快取（例如營業中篩選），不需預熱。
+    """
+    from . import views
+
+    query = QueryDict(params)
+    if view == 'shop_list':
+        kwargs = views.shop_list_params(query)
+        if kwargs['open_now'] == 'true':
+            return False
+        views.shop_list_results(**kwargs)
+    elif view == 'recommended_drinks':
+        views.recommended_results(*views.recommended_params(query))
+    elif view == 'search_drinks':
+        search_query = query.get('search', '').strip()
+        if not search_query:
+            return False
+        views.search_results(search_query)
+    else:
+        raise ValueError(f'無法預熱的 view: {view}')
+    return True
+
+
+def default_combinations():
+    """沒有請求統計時預熱各 view 的預設頁面"""
+    return [(view, '') for view in VIEW_PARAMS if view != 'search_drinks']
+
+
+def describe(params):
+    """報告用的參數顯示"""
+    return ', '.join(f'{name}={value}' for name, value in parse_qsl(params)) or '(預設)'
@@ -0,0 +1,77 @@
+// 各頁面共用的腳本：CSRF token 與收藏按鈕（網址由 base.html 的 POLLS_URLS 提供）
+
+// 取得 CSRF token
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+const csrftoken = getCookie('csrftoken');
+
+// 切換收藏狀態
+function toggleFavorite(event, type, id, element) {
+    event.preventDefault();
+    event.stopPropagation();
+
+    $.ajax({
+        url: POLLS_URLS.addFavorite,
+        type: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken
+        },
+        data: {
+            type: type,
+            id: id
+        },
+        success: function(response) {
+            if (response.success) {
+                $(element).addClass('favorited');
+                alert(response.message);
+            } else {
+                alert(response.message);
+            }
+        },
+        error: function() {
+            alert('發生錯誤，請稍後再試。');
+        }
+    });
+}
+
+// 一次請求最多檢查的項目數（與 polls.favorites.MAX_ITEMS 相同）
+const CHECK_FAVORITES_BATCH_SIZE = 200;
+
+// 檢查頁面上的收藏按鈕（data-shop-id / data-drink-id）是否已收藏：每 200 個按鈕一個請求
+function checkFavorites(type) {
+    const buttons = $(`.favorite-btn[data-${type}-id]`);
+    const ids = [...new Set(buttons.map(function() {
+        return String($(this).data(`${type}-id`));
+    }).get())];
+
+    for (let start = 0; start < ids.length; start += CHECK_FAVORITES_BATCH_SIZE) {
+        $.ajax({
+            url: POLLS_URLS.checkFavorites,
+            type: 'GET',
+            data: {
+                type: type,
+                ids: ids.slice(start, start + CHECK_FAVORITES_BATCH_SIZE).join(',')
+            },
+            success: function(response) {
+                const favorited = new Set(response.favorited.map(String));
+                buttons.each(function() {
+                    if (favorited.has(String($(this).data(`${type}-id`)))) {
+                        $(this).addClass('favorited');
+                    }
+                });
+            }
+        });
+    }
+}
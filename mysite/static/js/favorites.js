@@ -0,0 +1,94 @@
+// 儲存備註
+function saveNotes(favoriteId) {
+    const notes = document.getElementById(`notes-${favoriteId}`).value;
+
+    $.ajax({
+        url: POLLS_URLS.updateFavoriteNotes,
+        type: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken
+        },
+        data: {
+            id: favoriteId,
+            notes: notes
+        },
+        success: function(response) {
+            if (response.success) {
+                alert('備註已更新！');
+            } else {
+                alert('更新失敗: ' + response.message);
+            }
+        },
+        error: function() {
+            alert('發生錯誤，請稍後再試。');
+        }
+    });
+}
+
+// 移除收藏
+function removeFavorite(favoriteId) {
+    if (!confirm('確定要移除此收藏嗎？')) {
+        return;
+    }
+
+    $.ajax({
+        url: POLLS_URLS.removeFavorite,
+        type: 'POST',
+        headers: {
+            'X-CSRFToken': csrftoken
+        },
+        data: {
+            id: favoriteId
+        },
+        success: function(response) {
+            if (response.success) {
+                alert('已移除收藏！');
+                location.reload();
+            } else {
+                alert('移除失敗: ' + response.message);
+            }
+        },
+        error: function() {
+            alert('發生錯誤，請稍後再試。');
+        }
+    });
+}
+
+// 全選 / 取消全選
+function selectAll(checked) {
+    $('.favorites-grid .favorite-select').prop('checked', checked);
+}
+
+// 批次移除選取的收藏（單一請求）
+function removeSelected() {
+    const data = {remove_shop: [], remove_drink: []};
+    $('.favorites-grid .favorite-select:checked').each(function() {
+        data['remove_' + $(this).data('type')].push($(this).data('id'));
+    });
+    const count = data.remove_shop.length + data.remove_drink.length;
+    if (!count) {
+        alert('請先選取要移除的收藏。');
+        return;
+    }
+    if (!confirm(`確定要移除選取的 ${count} 項收藏嗎？`)) {
+        return;
+    }
+
+    $.ajax({
+        url: POLLS_URLS.batchFavorites,
+        type: 'POST',
+        traditional: true,
+        headers: {
+            'X-CSRFToken': csrftoken
+        },
+        data: data,
+        success: function(response) {
+            alert(response.message);
+            location.reload();
+        },
+        error: function(xhr) {
+            const message = xhr.responseJSON && xhr.responseJSON.message;
+            alert(message ? '移除失敗: ' + message : '發生錯誤，請稍後再試。');
+        }
+    });
+}
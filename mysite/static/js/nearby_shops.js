@@ -0,0 +1,152 @@
+// 地理位置相關功能
+function getLocation() {
+    if (navigator.geolocation) {
+        navigator.geolocation.getCurrentPosition(showPosition, showError);
+    } else {
+        alert("您的瀏覽器不支援地理位置功能");
+    }
+}
+
+function showPosition(position) {
+    const lat = position.coords.latitude;
+    const lng = position.coords.longitude;
+    window.location.href = `${POLLS_URLS.nearbyShops}?lat=${lat}&lng=${lng}`;
+}
+
+function showError(error) {
+    switch(error.code) {
+        case error.PERMISSION_DENIED:
+            alert("您拒絕了位置存取請求");
+            break;
+        case error.POSITION_UNAVAILABLE:
+            alert("無法取得位置資訊");
+            break;
+        case error.TIMEOUT:
+            alert("位置請求逾時");
+            break;
+        case error.UNKNOWN_ERROR:
+            alert("發生未知錯誤");
+            break;
+    }
+}
+
+// Distance slider values
+const distanceValues = [
+    { value: 0.5, label: '500公尺' },
+    { value: 1, label: '1公里' },
+    { value: 3, label: '3公里' },
+    { value: 5, label: '5公里' },
+    { value: 8, label: '8公里' }
+];
+
+// Apply distance filter
+function applyDistance() {
+    const index = document.getElementById('distanceSlider').value;
+    const distance = distanceValues[index].value;
+    const url = new URL(window.location);
+
+    // 設置距離參數（URL會自動保留所有現有參數）
+    url.searchParams.set('distance', distance);
+
+    console.log('Applying distance filter:', distance, 'km');
+    console.log('Full URL:', url.toString());
+    $('#distanceModal').modal('hide');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Clear distance filter
+function clearDistance() {
+    const url = new URL(window.location);
+
+    // 刪除距離參數（URL會自動保留其他參數）
+    url.searchParams.delete('distance');
+
+    $('#distanceModal').modal('hide');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle open now filter
+function toggleOpenNowNearby() {
+    const url = new URL(window.location);
+    const currentOpenNow = url.searchParams.get('open_now');
+    if (currentOpenNow === 'true') {
+        url.searchParams.delete('open_now');
+    } else {
+        url.searchParams.set('open_now', 'true');
+    }
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle sort
+function toggleSortNearby(type) {
+    const url = new URL(window.location);
+    const currentSort = url.searchParams.get('sort');
+
+    let newSort;
+    if (type === 'distance') {
+        // 預設是 distance_asc，第一次點擊應切換到 distance_desc
+        if (!currentSort || currentSort === 'distance_asc' || currentSort === 'distance') {
+            newSort = 'distance_desc';
+        } else {
+            newSort = 'distance_asc';
+        }
+    } else if (type === 'rating') {
+        // 如果當前不是評價排序，則設為 rating_desc（預設由高到低）
+        if (!currentSort || (!currentSort.includes('rating'))) {
+            newSort = 'rating_desc';
+        } else if (currentSort === 'rating_desc') {
+            newSort = 'rating_asc';
+        } else {
+            newSort = 'rating_desc';
+        }
+    }
+
+    url.searchParams.set('sort', newSort);
+    window.location.href = url.toString() + '#filters';
+}
+
+// 頁面載入時檢查已收藏的項目和初始化slider
+$(document).ready(function() {
+    // Initialize distance slider event listener
+    const distanceSlider = document.getElementById('distanceSlider');
+    if (distanceSlider) {
+        distanceSlider.addEventListener('input', function() {
+            const index = this.value;
+            document.getElementById('distanceValue').textContent = distanceValues[index].label;
+        });
+
+        // Initialize distance slider value
+        const currentDistance = PAGE_FILTERS.distance;
+        if (currentDistance) {
+            const distance = parseFloat(currentDistance);
+            const index = distanceValues.findIndex(d => d.value === distance);
+            if (index >= 0) {
+                distanceSlider.value = index;
+                document.getElementById('distanceValue').textContent = distanceValues[index].label;
+            }
+        }
+    }
+
+    // 頁面載入時更新排序圖標
+    const currentSort = PAGE_FILTERS.sort;
+
+    // 更新距離排序圖標
+    const distanceSortBtn = $('.sort-toggle').eq(0).find('i');
+    if (currentSort === 'distance_desc') {
+        distanceSortBtn.removeClass('fa-sort-amount-up').addClass('fa-sort-amount-down');
+    } else if (currentSort === 'distance_asc' || !currentSort || currentSort === 'distance') {
+        distanceSortBtn.removeClass('fa-sort-amount-down').addClass('fa-sort-amount-up');
+    }
+
+    // 更新評價排序圖標
+    const ratingSortBtn = $('.sort-toggle').eq(1).find('i');
+    if (currentSort === 'rating_asc') {
+        ratingSortBtn.removeClass('fa-sort-amount-down').addClass('fa-sort-amount-up');
+    } else if (currentSort === 'rating_desc' || currentSort === 'rating') {
+        ratingSortBtn.removeClass('fa-sort-amount-up').addClass('fa-sort-amount-down');
+    }
+
+    if (POLLS_AUTHENTICATED) {
+        checkFavorites('shop');
+    }
+});
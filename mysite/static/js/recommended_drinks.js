@@ -0,0 +1,114 @@
+// Rating slider values
+const ratingValues = [3.0, 3.5, 4.0, 4.5, 5.0];
+
+// Update display when rating slider moves
+document.getElementById('ratingSlider').addEventListener('input', function() {
+    const index = this.value;
+    const rating = ratingValues[index];
+    document.getElementById('ratingValue').textContent = rating;
+});
+
+// Apply rating filter
+function applyRating() {
+    const index = document.getElementById('ratingSlider').value;
+    const rating = ratingValues[index];
+    const url = new URL(window.location);
+    url.searchParams.set('rating', rating);
+    window.location.href = url.toString() + '#filters';
+}
+
+// Clear rating filter
+function clearRating() {
+    const url = new URL(window.location);
+    url.searchParams.delete('rating');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Price slider values
+const priceRanges = [
+    { value: 'under_50', label: '<50元' },
+    { value: '50_80', label: '50-80元' },
+    { value: 'over_80', label: '≥80元' }
+];
+
+// Update display when price slider moves
+document.getElementById('priceSlider').addEventListener('input', function() {
+    const index = this.value;
+    document.getElementById('priceValue').textContent = priceRanges[index].label;
+});
+
+// Apply price filter
+function applyPrice() {
+    const index = document.getElementById('priceSlider').value;
+    const priceValue = priceRanges[index].value;
+    const url = new URL(window.location);
+    url.searchParams.set('price', priceValue);
+    window.location.href = url.toString() + '#filters';
+}
+
+// Clear price filter
+function clearPrice() {
+    const url = new URL(window.location);
+    url.searchParams.delete('price');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle sort
+function toggleSort(type) {
+    const url = new URL(window.location);
+    const currentSort = url.searchParams.get('sort');
+
+    let newSort;
+    if (type === 'recommended') {
+        newSort = 'recommended';
+    } else if (type === 'favorites') {
+        newSort = 'favorites_desc';
+    } else if (type === 'rating') {
+        // 第一次點擊為 rating_desc，再點擊切換到 rating_asc
+        if (currentSort === 'rating_desc' || currentSort === 'rating') {
+            newSort = 'rating_asc';
+        } else {
+            newSort = 'rating_desc';
+        }
+    } else if (type === 'price') {
+        // 如果當前不是價格排序，則設為 price_asc（預設由低到高）
+        if (!currentSort || (!currentSort.includes('price'))) {
+            newSort = 'price_asc';
+        } else if (currentSort === 'price_asc') {
+            newSort = 'price_desc';
+        } else {
+            newSort = 'price_asc';
+        }
+    }
+
+    url.searchParams.set('sort', newSort);
+    window.location.href = url.toString() + '#filters';
+}
+
+// 頁面載入時檢查已收藏的項目
+$(document).ready(function() {
+    // Initialize rating slider value
+    const currentRating = PAGE_FILTERS.rating;
+    if (currentRating) {
+        const rating = parseFloat(currentRating);
+        const index = ratingValues.indexOf(rating);
+        if (index >= 0) {
+            document.getElementById('ratingSlider').value = index;
+            document.getElementById('ratingValue').textContent = rating;
+        }
+    }
+
+    // Initialize price slider value
+    const currentPrice = PAGE_FILTERS.price;
+    if (currentPrice) {
+        const index = priceRanges.findIndex(p => p.value === currentPrice);
+        if (index >= 0) {
+            document.getElementById('priceSlider').value = index;
+            document.getElementById('priceValue').textContent = priceRanges[index].label;
+        }
+    }
+
+    if (POLLS_AUTHENTICATED) {
+        checkFavorites('drink');
+    }
+});
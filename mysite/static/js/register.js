@@ -0,0 +1,127 @@
+$(document).ready(function() {
+    // 使用者名稱驗證規則
+    const usernameRules = [
+        {
+            test: (val) => val.length >= 3,
+            message: '使用者名稱至少需要3個字元'
+        },
+        {
+            test: (val) => val.length <= 150,
+            message: '使用者名稱不能超過150個字元'
+        },
+        {
+            test: (val) => /^[\w.@+-]+$/.test(val),
+            message: '使用者名稱只能包含字母、數字和 @/./+/-/_ 字元'
+        }
+    ];
+
+    // 密碼驗證規則
+    const passwordRules = [
+        {
+            test: (val) => val.length >= 8,
+            message: '密碼至少需要8個字元'
+        },
+        {
+            test: (val) => !/^\d+$/.test(val),
+            message: '密碼不能全部是數字'
+        },
+        {
+            test: (val) => val.toLowerCase() !== $('#id_username').val().toLowerCase(),
+            message: '密碼不能與使用者名稱太相似'
+        }
+    ];
+
+    // 驗證使用者名稱
+    function validateUsername() {
+        const username = $('#id_username').val();
+        const helptext = $('#id_username').siblings('.helptext');
+
+        if (!username) {
+            helptext.removeClass('show');
+            $('#id_username').removeClass('is-invalid');
+            return;
+        }
+
+        let isValid = true;
+        let errorMessages = [];
+
+        usernameRules.forEach(rule => {
+            if (!rule.test(username)) {
+                isValid = false;
+                errorMessages.push(rule.message);
+            }
+        });
+
+        if (!isValid) {
+            helptext.html(errorMessages.join('<br>')).addClass('show');
+            $('#id_username').addClass('is-invalid');
+        } else {
+            helptext.removeClass('show');
+            $('#id_username').removeClass('is-invalid');
+        }
+    }
+
+    // 驗證密碼
+    function validatePassword() {
+        const password = $('#id_password1').val();
+        const helptext = $('#id_password1').siblings('.helptext');
+
+        if (!password) {
+            helptext.removeClass('show');
+            $('#id_password1').removeClass('is-invalid');
+            return;
+        }
+
+        let isValid = true;
+        let errorMessages = [];
+
+        passwordRules.forEach(rule => {
+            if (!rule.test(password)) {
+                isValid = false;
+                errorMessages.push(rule.message);
+            }
+        });
+
+        if (!isValid) {
+            helptext.html(errorMessages.join('<br>')).addClass('show');
+            $('#id_password1').addClass('is-invalid');
+        } else {
+            helptext.removeClass('show');
+            $('#id_password1').removeClass('is-invalid');
+        }
+    }
+
+    // 驗證確認密碼
+    function validatePassword2() {
+        const password1 = $('#id_password1').val();
+        const password2 = $('#id_password2').val();
+        const helptext = $('#id_password2').siblings('.helptext');
+
+        if (!password2) {
+            helptext.removeClass('show');
+            $('#id_password2').removeClass('is-invalid');
+            return;
+        }
+
+        if (password1 !== password2) {
+            helptext.html('兩次輸入的密碼不一致').addClass('show');
+            $('#id_password2').addClass('is-invalid');
+        } else {
+            helptext.removeClass('show');
+            $('#id_password2').removeClass('is-invalid');
+        }
+    }
+
+    // 綁定事件
+    $('#id_username').on('input blur', validateUsername);
+    $('#id_password1').on('input blur', function() {
+        validatePassword();
+        if ($('#id_password2').val()) {
+            validatePassword2();
+        }
+    });
+    $('#id_password2').on('input blur', validatePassword2);
+
+    // 頁面載入時隱藏所有helptext
+    $('.helptext').removeClass('show');
+});
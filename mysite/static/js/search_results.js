@@ -0,0 +1,6 @@
+// 頁面載入時檢查已收藏的項目
+$(document).ready(function() {
+    if (POLLS_AUTHENTICATED) {
+        checkFavorites('drink');
+    }
+});
@@ -0,0 +1,37 @@
+// Toggle sort for shop detail
+function toggleSortShopDetail(type) {
+    const url = new URL(window.location);
+    const currentSort = url.searchParams.get('sort');
+
+    let newSort;
+    if (type === 'price') {
+        if (!currentSort || (!currentSort.includes('price'))) {
+            newSort = 'price_asc';
+        } else if (currentSort === 'price_asc') {
+            newSort = 'price_desc';
+        } else {
+            newSort = 'price_asc';
+        }
+    }
+
+    url.searchParams.set('sort', newSort);
+    window.location.href = url.toString() + '#drink-filters';
+}
+
+// 頁面載入時檢查已收藏的項目
+$(document).ready(function() {
+    // 處理營業時間換行
+    const openingHoursElement = document.getElementById('opening-hours-text');
+    if (openingHoursElement) {
+        const text = openingHoursElement.textContent;
+        openingHoursElement.innerHTML = text.replace(/\|/g, '<br>');
+    }
+
+    if (POLLS_AUTHENTICATED) {
+        // 檢查店家收藏狀態
+        checkFavorites('shop');
+
+        // 檢查飲料收藏狀態
+        checkFavorites('drink');
+    }
+});
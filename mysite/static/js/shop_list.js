@@ -0,0 +1,82 @@
+// Rating slider values
+const ratingValues = [3.0, 3.5, 4.0, 4.5, 5.0];
+
+// Update display when slider moves
+document.getElementById('ratingSlider').addEventListener('input', function() {
+    const index = this.value;
+    const rating = ratingValues[index];
+    document.getElementById('ratingValue').textContent = rating;
+});
+
+// Apply rating filter
+function applyRating() {
+    const index = document.getElementById('ratingSlider').value;
+    const rating = ratingValues[index];
+    const url = new URL(window.location);
+    url.searchParams.set('rating', rating);
+    window.location.href = url.toString() + '#filters';
+}
+
+// Clear rating filter
+function clearRating() {
+    const url = new URL(window.location);
+    url.searchParams.delete('rating');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle sort direction
+function toggleSort() {
+    const url = new URL(window.location);
+    const currentSort = url.searchParams.get('sort') || 'rating_desc';
+    const newSort = currentSort === 'rating_asc' ? 'rating_desc' : 'rating_asc';
+    url.searchParams.set('sort', newSort);
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle menu filters
+function toggleParam(name, value) {
+    const url = new URL(window.location);
+    if (url.searchParams.get(name) === value) {
+        url.searchParams.delete(name);
+    } else {
+        url.searchParams.set(name, value);
+    }
+    window.location.href = url.toString() + '#filters';
+}
+
+// Sort by favorite count
+function sortByFavorites() {
+    const url = new URL(window.location);
+    url.searchParams.set('sort', 'favorites_desc');
+    window.location.href = url.toString() + '#filters';
+}
+
+// Toggle open now filter
+function toggleOpenNow() {
+    const url = new URL(window.location);
+    const currentOpenNow = url.searchParams.get('open_now');
+    if (currentOpenNow === 'true') {
+        url.searchParams.delete('open_now');
+    } else {
+        url.searchParams.set('open_now', 'true');
+    }
+    window.location.href = url.toString() + '#filters';
+}
+
+// 頁面載入時檢查已收藏的項目
+$(document).ready(function() {
+    // Initialize rating slider value
+    const currentRating = PAGE_FILTERS.rating;
+    if (currentRating) {
+        const rating = parseFloat(currentRating);
+        const index = ratingValues.indexOf(rating);
+        if (index >= 0) {
+            document.getElementById('ratingSlider').value = index;
+            document.getElementById('ratingValue').textContent = rating;
+        }
+    }
+
+    if (POLLS_AUTHENTICATED) {
+        checkFavorites('shop');
+    }
+});